@@ -1,13 +1,12 @@
 # app.py  — BoostBridgeDIY • AI Letters (clean single-file version)
 
-import os, time, json
+import os, time, json, importlib
 from textwrap import dedent
 from datetime import datetime
 from typing import List, Tuple, Optional
 
 import streamlit as st
 from dotenv import load_dotenv
-from openai import OpenAI
 
 
 # ---------- Streamlit page config ----------
@@ -91,11 +90,12 @@ def render_footer(contact_email: str = "boostbridgediy@gmail.com"):
 
 # ---------- Load env & initialize third-party clients ----------
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 # ---------- Jobs sheet helper (writes only; no reads here) ----------
-import gspread
-from google.oauth2.service_account import Credentials
+# Heavy libraries (gspread, google-auth, bcrypt, fpdf, pandas, openai) load on first use via
+# utils.lazy_imports / utils.llm; the public landing page imports none of them.
+from utils.lazy_imports import gspread, service_account_credentials, api_error
+from utils.run_stats import counting_sheets
 from zoneinfo import ZoneInfo
 LOCAL_TZ = ZoneInfo("America/New_York")
 JOBS_SHEET_ID = os.getenv("JOBS_SHEET_ID")
@@ -106,14 +106,14 @@ def now_local_str() -> str:
 def open_jobs_sheet():
     # Reuse service account creds
     if os.path.exists("service_account.json"):
-        creds = Credentials.from_service_account_file(
+        creds = service_account_credentials().from_service_account_file(
             "service_account.json",
             scopes=["https://www.googleapis.com/auth/spreadsheets",
                     "https://www.googleapis.com/auth/drive"]
         )
-        gc = gspread.authorize(creds)
+        gc = counting_sheets(gspread().authorize(creds))
     else:
-        gc = gspread.service_account()
+        gc = counting_sheets(gspread().service_account())
     return gc.open_by_key(JOBS_SHEET_ID).sheet1
 
 def add_job_row(letter_id: str, email: str, bureau: str, dispute_type: str, round_name: str, intake_payload: dict):
@@ -135,8 +135,9 @@ def add_job_row(letter_id: str, email: str, bureau: str, dispute_type: str, roun
     ws.append_row(row, value_input_option="USER_ENTERED")
 
 # ---------- Imports that rely on env after load_dotenv ----------
-from gspread.exceptions import APIError
 from utils.auth import auth_ui, find_user, remaining_quota, refresh_cached_user
+from utils import run_stats
+from utils import background_retry
 # Optional tracker
 try:
     from utils.credit_tracker import init_tracker_if_needed, render_sidebar_badge
@@ -165,59 +166,64 @@ def prewarm_caches_once():
 
 def quota_retry_call(key: str, fn, *args, **kwargs):
     """
-    Run a Sheets-backed function with bounded auto-retry & backoff.
+    Run a Sheets-backed function. On quota errors it is retried in the background
+    (utils.background_retry) while this run shows its last good result, or a short
+    "Syncing…" note if there is none; the page reruns when the retry lands.
     Falls back to a 'Retry now' button instead of telling users to refresh.
     """
-    n = st.session_state.get(key, 0)
-    from gspread.exceptions import APIError
-    try:
-        result = fn(*args, **kwargs)
-        st.session_state[key] = 0
+    if background_retry.pending(key):
+        result, age = background_retry.last_good(key)
+        background_retry.rerun_when_ready(key)
+        if age is None:
+            st.info("Syncing… one sec.")
+            st.stop()
+        st.caption("Syncing… showing data from a moment ago.")
         return result
-    except APIError as e:
-        msg = str(e).lower()
-        if "429" in msg or "quota" in msg:
-            if n < 6:
-                st.session_state[key] = n + 1
-                st.info("Syncing… one sec.")
-                import time as _t
-                _t.sleep(0.8 * (n + 1))
+
+    failed = background_retry.take(key)
+    if failed is not None and failed.exception() is not None:
+        c1, c2 = st.columns([1, 6])
+        with c1:
+            if st.button("Retry now", key=f"retry_call_{key}"):
                 st.rerun()
-            else:
-                st.session_state[key] = 0
-                c1, c2 = st.columns([1, 6])
-                with c1:
-                    if st.button("Retry now", key=f"retry_call_{int(datetime.now().timestamp())}"):
-                        st.rerun()
-                with c2:
-                    st.info("Still syncing. Click **Retry now** — your inputs are safe.")
-                st.stop()
-        raise
+        with c2:
+            st.info("Still syncing. Click **Retry now** — your inputs are safe.")
+        st.stop()
+
+    try:
+        result, age = background_retry.fresh_or_stale(key, fn, *args, **kwargs)
+    except api_error() as e:
+        if not background_retry.is_quota_error(e):
+            raise
+        st.info("Syncing… one sec.")
+        background_retry.rerun_when_ready(key)
+        st.stop()
+    if age:
+        st.caption("Syncing… showing data from a moment ago.")
+        background_retry.rerun_when_ready(key)
+    return result
 
 
 # ---------- Global quota helpers (pre-warm + call/step guards) ----------
 def safe_render(step_fn):
     """
     Render a step with a global APIError 429 guard.
-    Auto-retries with backoff. If it still can't, shows a 'Retry' button that
+    Auto-retries with backoff: a timed fragment reruns the page, so this run returns at
+    once instead of sleeping. If it still can't, shows a 'Retry' button that
     runs st.rerun() (does NOT clear session_state / typed fields).
     """
     key = "_global_retry"
     n = st.session_state.get(key, 0)
-    from gspread.exceptions import APIError
     try:
         step_fn()
         st.session_state[key] = 0
-    except APIError as e:
-        msg = str(e).lower()
-        if "429" in msg or "quota" in msg:
+    except api_error() as e:
+        if background_retry.is_quota_error(e):
             # Try up to 6 times with gentle backoff
             if n < 6:
                 st.session_state[key] = n + 1
                 st.info("Syncing… one sec.")
-                import time as _t
-                _t.sleep(0.8 * (n + 1))  # 0.8, 1.6, 2.4, 3.2, 4.0, 4.8s
-                st.rerun()
+                background_retry.rerun_when_ready(delay_s=0.8 * (n + 1))  # 0.8, 1.6, 2.4, 3.2, 4.0, 4.8s
             else:
                 # Stop auto-looping. Provide a *local* retry button that won't clear inputs.
                 st.session_state[key] = 0
@@ -317,6 +323,9 @@ def render_public_landing():
             unsafe_allow_html=True,
         )
 
+# ---------- Rerun accounting (full runs, Sheets + LLM requests per session/step) ----------
+run_stats.begin_run(st.session_state, st.session_state.get("step") if st.session_state.get("user") else None)
+
 # ---------- Auth gate ----------
 logged_in = auth_ui()
 if not logged_in:
@@ -398,15 +407,23 @@ if rq["daily_left"] <= 0 and plan != "pro":
         "You can still review steps; generation will be blocked until reset."
     )
 
+# ---------- Sidebar fragments ----------
+# Sidebar panels are fragments rendered inside `with st.sidebar:`; their widgets rerun
+# only the fragment, never the access-control block or the active step. Anything that
+# changes the page (navigation, logout) asks for st.rerun(scope="app") explicitly.
+
 # --- Sidebar: Letter Credits ---
-def _render_letter_credits_sidebar(q: dict):
-    st.sidebar.subheader("💌 Letter Credits")
-    st.sidebar.caption(
+@st.fragment
+def letter_credits_sidebar():
+    rec = (st.session_state.get("user") or {}).get("record") or user_rec
+    q = remaining_quota(rec)
+    st.subheader("💌 Letter Credits")
+    st.caption(
         f"Daily: {int(q['daily_left'])}/{int(q['daily_limit'])} • "
         f"Monthly: {int(q['monthly_left'])}/{int(q['monthly_limit'])}"
     )
     # Big monthly remaining number
-    st.sidebar.markdown(
+    st.markdown(
         f"""
         <div style="font-size:28px;font-weight:800;line-height:1;margin:2px 0 6px 0;">
             {int(q.get('monthly_left', 0))}
@@ -418,9 +435,10 @@ def _render_letter_credits_sidebar(q: dict):
     # Progress bar shows monthly remaining fraction
     denom = max(1, int(q["monthly_limit"]))
     pct = float(q["monthly_left"]) / float(denom)
-    st.sidebar.progress(pct)
+    st.progress(pct)
 
-_render_letter_credits_sidebar(rq)
+with st.sidebar:
+    letter_credits_sidebar()
 
 # Optional tracker bootstrap (if you use it)
 try:
@@ -448,77 +466,88 @@ st.session_state["_is_admin"] = user_is_admin
 
 
 # ---------- Sidebar quick nav ----------
-if st.sidebar.button("🎓 Tips & Education"):
-    st.session_state.step = 98
-    st.rerun()
-
-if st.sidebar.button("📜 Dispute History"):
-    st.session_state.step = 99
-    st.rerun()
-
-# replace your Dashboard button
-if st.session_state.get("_is_admin") and st.sidebar.button("📊 Dashboard"):
-    st.session_state.step = 100
-    st.rerun()
-
-st.sidebar.markdown("---")
+@st.fragment
+def sidebar_nav():
+    target = None
+    if st.button("🎓 Tips & Education"):
+        target = 98
+    if st.button("📜 Dispute History"):
+        target = 99
+    # replace your Dashboard button
+    if st.session_state.get("_is_admin") and st.button("📊 Dashboard"):
+        target = 100
+    st.markdown("---")
+    if target is not None:
+        st.session_state.step = target
+        st.rerun(scope="app")
+
+with st.sidebar:
+    sidebar_nav()
 
 # ---------- Sidebar helper (mini assistant) ----------
+from utils.quick_help import answer_locally, stream_answer as stream_help_answer
+
+@st.fragment
 def sidebar_helper():
-    st.sidebar.subheader("💬 Quick Help")
+    st.subheader("💬 Quick Help")
     if "help_chat" not in st.session_state:
         st.session_state.help_chat = []
 
     for msg in st.session_state.help_chat[-8:]:
         role = "You" if msg["role"] == "user" else "Assistant"
-        st.sidebar.markdown(f"**{role}:** {msg['content']}")
+        st.markdown(f"**{role}:** {msg['content']}")
 
-    user_q = st.sidebar.text_area("Ask about this step:", height=80, key="help_q")
+    user_q = st.text_area("Ask about this step:", height=80, key="help_q")
 
-    c1, c2 = st.sidebar.columns(2)
+    c1, c2 = st.columns(2)
     if c1.button("Ask", key="help_ask"):
-        if user_q.strip():
-            st.session_state.help_chat.append({"role": "user", "content": user_q.strip()})
-            system_prompt = (
-                "You are an in-app helper for a credit-dispute letter generator. "
-                "Be concise, step-specific, and avoid legal advice. "
-                "If the user asks for legal advice, say you cannot provide it. "
-                "Explain fields, flow, and general law meanings in plain language."
-            )
-            try:
-                resp = client.chat.completions.create(
-                    model="gpt-4",
-                    messages=[{"role": "system", "content": system_prompt}, *st.session_state.help_chat],
-                    temperature=0.4,
-                    max_tokens=300,
-                )
-                answer = (resp.choices[0].message.content or "").strip()
-            except Exception as e:
-                answer = f"Sorry—something went wrong: {e}"
+        q = user_q.strip()
+        if q:
+            st.session_state.help_chat.append({"role": "user", "content": q})
+            st.markdown(f"**You:** {q}")
+            # Repeat questions are answered from the tips/FAQ index — no LLM round-trip.
+            answer = answer_locally(q, step=str(st.session_state.get("step", "")))
+            if answer:
+                st.markdown(f"**Assistant:** {answer}")
+            else:
+                st.markdown("**Assistant:**")
+                try:
+                    answer = st.write_stream(stream_help_answer(st.session_state.help_chat))
+                    if not isinstance(answer, str):
+                        answer = "".join(str(x) for x in answer)
+                    answer = answer.strip()
+                except Exception as e:
+                    answer = f"Sorry—something went wrong: {e}"
+                    st.markdown(answer)
             st.session_state.help_chat.append({"role": "assistant", "content": answer})
-            st.rerun()
 
     if c2.button("Clear", key="help_clear"):
         st.session_state.help_chat = []
-        st.rerun()
+        st.rerun(scope="fragment")
 
-sidebar_helper()
+with st.sidebar:
+    sidebar_helper()
 
 # ---------- Steps router ----------
-from components import (
-    step_1_intro,
-    step_2_dispute_type,
-    step_3_bureau_select,
-    step_4_select_dispute_type,
-    step_4_5_dispute_details,
-    step_5_round_select,
-    step_6_law_selection,
-    step_7_user_info,
-    step_8_generate_letter,
-    page_history,
-    page_education,
-    page_dashboard,
-)
+# Only the current page's module is imported (a run on Step 2 never loads Step 8's stack).
+STEP_PAGES = {
+    1: "step_1_intro",
+    2: "step_2_dispute_type",
+    3: "step_3_bureau_select",
+    4: "step_4_select_dispute_type",
+    4.5: "step_4_5_dispute_details",
+    5: "step_5_round_select",
+    6: "step_6_law_selection",
+    7: "step_7_user_info",
+    7.5: "step_7_5_review_confirm",
+    8: "step_8_generate_letter",
+    98: "page_education",
+    99: "page_history",
+    100: "page_dashboard",
+}
+
+def _page(step: float):
+    return importlib.import_module(f"components.{STEP_PAGES[step]}")
 
 # Normalize step (handle ints, strings, 4.5)
 raw_step = st.session_state.get("step", 1)
@@ -534,38 +563,12 @@ if "selected_bureau" in st.session_state:
     st.info(f"📌 Bureau Selected: **{st.session_state.selected_bureau}**")
 
 # Route with quota-safe rendering
-if step_num == 1:
-    safe_render(step_1_intro.render)
-elif step_num == 2:
-    safe_render(step_2_dispute_type.render)
-elif step_num == 3:
-    safe_render(step_3_bureau_select.render)
-elif step_num == 4:
-    safe_render(step_4_select_dispute_type.render)
-elif step_num == 4.5:
-    safe_render(step_4_5_dispute_details.render)
-elif step_num == 5:
-    safe_render(step_5_round_select.render)
-elif step_num == 6:
-    safe_render(step_6_law_selection.render)
-elif step_num == 7:
-    safe_render(step_7_user_info.render)
-elif step_num == 7.5:
-    from components import step_7_5_review_confirm
-    safe_render(step_7_5_review_confirm.render)
-elif step_num == 8:
-    safe_render(step_8_generate_letter.render)
-elif step_num == 98:
-    safe_render(page_education.render)
-elif step_num == 99:
-    safe_render(page_history.render)
-elif step_num == 100:
-    if not st.session_state.get("_is_admin"):
-        st.warning("That page is only available to admins.")
-        st.session_state.step = 1
-        st.rerun()
-    else:
-        safe_render(page_dashboard.render)
+if step_num == 100 and not st.session_state.get("_is_admin"):
+    st.warning("That page is only available to admins.")
+    st.session_state.step = 1
+    st.rerun()
+elif step_num in STEP_PAGES:
+    safe_render(_page(step_num).render)
 else:
     st.warning("Unknown step. Resetting to Step 1.")
     st.session_state.step = 1
@@ -1 +1,2 @@
-from . import step_7_5_review_confirm
+# components/__init__.py
+# Pages are imported on demand by app.py's router (see STEP_PAGES), never all at once.
@@ -2,8 +2,10 @@
 import os, json
 from datetime import datetime, timedelta
 import streamlit as st
-import gspread
-from google.oauth2.service_account import Credentials
+from utils.lazy_imports import gspread, service_account_credentials
+from utils.run_stats import counting_sheets, session_stats
+
+from utils.metrics import latency_summary
 
 # Optional extra columns that may or may not exist yet
 OPTIONAL_COLS = [
@@ -16,10 +18,10 @@ def _open_ws_and_read(spreadsheet_id: str):
     scope = ["https://www.googleapis.com/auth/spreadsheets"]
     cred_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
     if cred_path and os.path.exists(cred_path):
-        creds = Credentials.from_service_account_file(cred_path, scopes=scope)
-        gc = gspread.authorize(creds)
+        creds = service_account_credentials().from_service_account_file(cred_path, scopes=scope)
+        gc = counting_sheets(gspread().authorize(creds))
     else:
-        gc = gspread.service_account()
+        gc = counting_sheets(gspread().service_account())
 
     ss = gc.open_by_key(spreadsheet_id)
     try:
@@ -125,3 +127,44 @@ def render():
         return r
 
     st.dataframe([_trim(r) for r in latest], use_container_width=True)
+
+    _render_llm_latency()
+    _render_run_stats()
+
+def _render_run_stats():
+    """Full runs + Sheets/LLM requests for this session (tests/test_flow_budget.py checks the wizard's)."""
+    st.subheader("This session: reruns & requests")
+    stats = session_stats(st.session_state)
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Script runs", stats["runs"])
+    c2.metric("Sheets requests", stats["sheets"])
+    c3.metric("LLM requests", stats["llm"])
+    st.dataframe([{"step": s, **v} for s, v in sorted(stats["by_step"].items())], use_container_width=True)
+    if stats["transitions"]:
+        st.caption("Step transitions: " + ", ".join(f"{t} ×{n}" for t, n in sorted(stats["transitions"].items())))
+
+def _render_llm_latency():
+    """p50/p95 wall time + time-to-first-token per mode/model from the local metrics store."""
+    st.subheader("LLM latency & tokens")
+    days = st.selectbox("Window", [1, 7, 30], index=1, format_func=lambda d: f"Last {d} day(s)", key="dash_llm_days")
+    try:
+        summary = latency_summary(days)
+    except Exception as e:
+        st.caption(f"Metrics store unavailable: {e}")
+        return
+    if not summary:
+        st.caption("No LLM calls recorded in this window yet.")
+        return
+
+    letters = [r for r in summary if r["kind"] == "letter"]
+    if letters:
+        walls = [r["p95_s"] for r in letters if r["p95_s"] is not None]
+        c1, c2, c3 = st.columns(3)
+        c1.metric("Letter calls", sum(r["calls"] for r in letters))
+        c2.metric("Worst p95 (s)", f"{max(walls):.1f}" if walls else "—")
+        c3.metric("Errors", sum(r["errors"] for r in letters))
+
+    def _fmt(v):
+        return round(v, 2) if isinstance(v, float) else v
+
+    st.dataframe([{k: _fmt(v) for k, v in r.items()} for r in summary], use_container_width=True)
@@ -1,6 +1,6 @@
 # components/page_education.py
 import streamlit as st
-from utils.tips import get_contextual_tips, get_law_cards, TIP_BANK
+from utils.tips import get_contextual_tips, get_law_cards, TIP_BANK, FAQS
 
 def render():
     st.header("🎓 Tips & Education Hub")
@@ -69,16 +69,9 @@ def render():
 
     with tabs[3]:
         st.subheader("FAQs")
-        with st.expander("How long does a bureau have to respond?"):
-            st.write("Generally **30 days** from receipt for reinvestigation; +15 days if you supply new docs mid-investigation.")
-        with st.expander("Should I send disputes online or by mail?"):
-            st.write("Mail gives you tracking and a paper trail. If you dispute online, always download the response PDF.")
-        with st.expander("Can I dispute multiple items at once?"):
-            st.write("Yes, but keep each item specific. Overloaded letters can delay clean outcomes.")
-        with st.expander("My item was deleted then came back. What now?"):
-            st.write("That’s a **reinsertion** scenario—ask for when/why it was reinserted and which furnisher data was relied upon.")
-        with st.expander("Do I still owe a debt if it’s deleted?"):
-            st.write("Removal for accuracy/verification reasons doesn’t erase the underlying debt. You may still owe it.")
+        for q, a in FAQS:
+            with st.expander(q):
+                st.write(a)
 
     st.markdown("---")
     cols = st.columns([1,1,2])
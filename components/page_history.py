@@ -1,14 +1,17 @@
 import os
+from typing import TYPE_CHECKING
 import streamlit as st
-import pandas as pd
 from utils.tips import tips_from_history_row
 from utils.history import load_history, update_status, STATUS_CHOICES
 
+if TYPE_CHECKING:
+    import pandas  # annotations only; at runtime pandas loads lazily (utils.lazy_imports)
+
 def _current_user_email() -> str | None:
     u = st.session_state.get("user")
     return (u or {}).get("email")
 
-def _which_email_col(df: pd.DataFrame) -> str | None:
+def _which_email_col(df: "pandas.DataFrame") -> str | None:
     for c in ["owner_email", "email", "user_email", "created_by"]:
         if c in df.columns:
             return c
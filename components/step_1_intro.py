@@ -5,13 +5,11 @@ from datetime import datetime
 import streamlit as st
 
 # We use ONLY utils.auth for sheet access (no access_gate here)
-from utils.auth import find_user, _cached_all_users, _get_users_sheet, _with_backoff
+from utils.auth import find_user, _users_table, _get_users_sheet, _with_backoff
+from utils.lazy_imports import gspread, service_account_credentials
+from utils.run_stats import counting_sheets
 
 # (Optional) legacy disclaimer logging — safe to leave; it silently no-ops if not configured
-try:
-    from google.oauth2.service_account import Credentials
-except Exception:
-    Credentials = None  # keep import optional so we never crash
 
 SHEETS_SCOPE = [
     "https://www.googleapis.com/auth/spreadsheets",
@@ -29,7 +27,7 @@ def _sheet_consent(email: str) -> bool:
     return v in {"1", "true", "yes", "y"}
 
 def _set_sheet_consent(email: str, value: bool = True) -> None:
-    headers, rows = _cached_all_users()
+    headers, rows = _users_table()  # only locates the row; a stale table is fine
     if not headers or not email:
         st.session_state["consent_ok"] = bool(value)
         return
@@ -62,8 +60,10 @@ def _set_sheet_consent(email: str, value: bool = True) -> None:
 
 # ---------- Optional, safe legacy logging ----------
 def _get_google_creds():
-    if not Credentials:
-        return None
+    try:
+        Credentials = service_account_credentials()
+    except Exception:
+        return None  # keep import optional so we never crash
     # 1) Streamlit secrets
     try:
         if "gcp_service_account" in st.secrets:
@@ -105,8 +105,7 @@ def _legacy_log_disclaimer(full_name: str, email: str):
         creds = _get_google_creds()
         if not creds:
             return
-        import gspread
-        client = gspread.authorize(creds)
+        client = counting_sheets(gspread().authorize(creds))
         sheet = client.open_by_key(DISCLAIMER_SHEET_ID).sheet1
         ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         try:
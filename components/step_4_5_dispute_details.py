@@ -3,9 +3,11 @@ import streamlit as st
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
-from utils.jobs import add_job_row   # <— new, avoids circular import
+from utils.jobs import add_job_row, add_job_rows   # <— new, avoids circular import
+from utils import background_retry
+from utils.letter_body import MAX_ITEMS_PER_LETTER, chunk_account_items
 
-MAX_ITEMS = 5
+MAX_ITEMS = 25   # per intake; more than MAX_ITEMS_PER_LETTER are split into several letters
 
 def _digits_last4(s: str) -> str:
     s = "".join(ch for ch in (s or "") if ch.isdigit())
@@ -47,9 +49,11 @@ def render():
 
     dtype = dispute_types[0].lower().replace(" ", "_")
 
-    # ===================== ACCOUNT (multi-item, cap 5) =====================
+    # ===================== ACCOUNT (multi-item, cap MAX_ITEMS) =====================
     if dtype == "account":
-        st.caption("You can bundle up to **5 accounts** in this one letter to the same bureau.")
+        st.caption(f"You can bundle up to **{MAX_ITEMS_PER_LETTER} accounts** in one letter to the same bureau. "
+                   f"Add up to {MAX_ITEMS} and they are split into several letters automatically "
+                   "(one credit per letter).")
         items = st.session_state.get("account_items", [])
         if not isinstance(items, list):
             items = []
@@ -97,7 +101,9 @@ def render():
 
         # ---- Existing items list ----
         if items:
-            st.subheader(f"Included in this letter ({len(items)}/{MAX_ITEMS})")
+            n_letters = len(chunk_account_items(items))
+            st.subheader(f"Included in this letter ({len(items)}/{MAX_ITEMS})" if n_letters == 1
+                         else f"Included in this dispute ({len(items)}/{MAX_ITEMS}, sent as {n_letters} letters)")
             for idx, it in enumerate(items):
                 title = f"{idx+1}. {it.get('name','(unnamed)')} • Last4: {it.get('last4') or 'N/A'}"
                 with st.expander(title, expanded=False):
@@ -146,23 +152,32 @@ def render():
                 # Ensure canonical storage
                 st.session_state.dispute_details["account_items"] = items
 
-                # Build payload for JOBS sheet (account type = multi items)
-                payload = {
-                    "user": _base_user(),
-                    "items": items,
-                    "bureau": st.session_state.get("selected_bureau",""),
-                    "round":  st.session_state.get("round_name","R1"),
-                    "notes":  st.session_state.get("notes","")
-                }
-                letter_id = _new_letter_id()
-                add_job_row(
-                    letter_id=letter_id,
-                    email=st.session_state.get("email",""),
-                    bureau=st.session_state.get("selected_bureau",""),
-                    dispute_type="account",
-                    round_name=st.session_state.get("round_name","R1"),
-                    payload=payload
-                )
+                # Build payloads for JOBS sheet (account type = multi items), one per letter;
+                # all rows go out in one append
+                chunks = chunk_account_items(items)
+                base_id = _new_letter_id()
+                letter_ids = [base_id] if len(chunks) == 1 else [f"{base_id}-p{i}" for i in range(1, len(chunks) + 1)]
+                # on a quota error the append finishes in the background; the wizard moves on
+                background_retry.run_or_schedule(f"jobs_add:{base_id}", add_job_rows, [
+                    {
+                        "letter_id": lid,
+                        "email": st.session_state.get("email",""),
+                        "bureau": st.session_state.get("selected_bureau",""),
+                        "dispute_type": "account",
+                        "round_name": st.session_state.get("round_name","R1"),
+                        "payload": {
+                            "user": _base_user(),
+                            "items": chunk,
+                            "bureau": st.session_state.get("selected_bureau",""),
+                            "round":  st.session_state.get("round_name","R1"),
+                            "notes":  st.session_state.get("notes","")
+                        },
+                    }
+                    for lid, chunk in zip(letter_ids, chunks)
+                ])
+                # Step 8 attaches generation metrics (one row per letter, in chunk order)
+                st.session_state["intake_letter_id"] = letter_ids[0]
+                st.session_state["intake_letter_ids"] = letter_ids
 
                 st.session_state.step = 5
                 st.rerun()
@@ -230,7 +245,10 @@ def render():
                 "notes":  st.session_state.get("notes","")
             }
             letter_id = _new_letter_id()
-            add_job_row(
+            st.session_state["intake_letter_id"] = letter_id  # Step 8 attaches generation metrics
+            st.session_state["intake_letter_ids"] = [letter_id]
+            background_retry.run_or_schedule(
+                f"jobs_add:{letter_id}", add_job_row,
                 letter_id=letter_id,
                 email=st.session_state.get("email",""),
                 bureau=st.session_state.get("selected_bureau",""),
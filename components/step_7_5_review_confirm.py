@@ -2,6 +2,12 @@
 import streamlit as st
 from datetime import datetime
 
+from utils.letter_body import inputs_from_state, input_key, uses_pi_template, split_inputs
+from utils.letter_sections import section_cache
+from utils import speculative
+from utils.auth import can_generate_letter
+from utils.credit_tracker import identity_ok, cannot_spend_reason
+
 def _mask_last4(s: str) -> str:
     s = (s or "").strip()
     return f"•••• {s[-4:]}" if s else "—"
@@ -71,6 +77,33 @@ def _render_items():
         st.write("**Type:** Other")
         st.write(f"**Details:** {info.get('details','') or '—'}")
 
+def _start_speculative_generation():
+    """
+    Every build_prompt input is final here, so start the letter in the background.
+    Step 8 commits it (and charges the credit) only if the inputs still match.
+    Only starts when Step 8's gate (quota, identity lock, local credits) would let it through.
+    """
+    record = (st.session_state.get("user") or {}).get("record") or {}
+    try:
+        if not record or not can_generate_letter(record):
+            return
+    except Exception:
+        return
+    if not identity_ok(st.session_state.get("user_info", {})) or cannot_spend_reason():
+        return  # Step 8 would refuse this letter; don't pay for it
+
+    inputs = inputs_from_state(st.session_state)
+    if uses_pi_template(inputs, record.get("plan")):
+        return  # rendered instantly in Step 8; nothing to speculate on
+    if len(split_inputs(inputs)) > 1:
+        return  # Step 8 splits it into several letters, generated together
+    key = input_key(inputs)
+    prev = st.session_state.get("spec_key")
+    if prev and prev != key:
+        speculative.discard(prev)  # user edited something since the last visit
+    speculative.start(key, inputs, section_cache(st.session_state))
+    st.session_state["spec_key"] = key
+
 def render():
     st.header("Step 7.5: Review & Confirm")
 
@@ -82,6 +115,8 @@ def render():
         st.rerun()
         return
 
+    _start_speculative_generation()
+
     user = st.session_state.get("user_info", {}) or {}
     bureau = st.session_state.get("selected_bureau", "")
     round_name = st.session_state.get("round_name") or st.session_state.get("dispute_round") or "Round 1"
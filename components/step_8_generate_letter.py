@@ -1,19 +1,30 @@
 # components/step_8_generate_letter.py
-import os, io, re, json
+import os, io, json
 from datetime import datetime
 
 import streamlit as st
 from dotenv import load_dotenv
-from openai import OpenAI
-from fpdf import FPDF
-import time
-from gspread.exceptions import APIError
+from utils.lazy_imports import fpdf, api_error
 
 # jobs utils (de-duped import)
 from utils.jobs import list_jobs_for_email, find_job_in_list, requeue_job
 
-from utils.prompt_builder import build_prompt
-from utils.history import save_letter_files, log_dispute
+from utils.jobs import add_job_rows, write_job_results
+from utils.letter_body import (
+    BUREAU_ADDRESSES,
+    inputs_from_state,
+    input_key,
+    split_inputs,
+    generate_body,
+    generate_bodies,
+    generate_parts,
+    assemble_letter,
+    strip_salutation_and_signature,
+)
+from utils.letter_sections import section_cache
+from utils.letter_qa import check_letter, qa_notes_json
+from utils import speculative, background_retry
+from utils.history import save_letter_files, log_disputes, zip_letter_files
 from utils.access_gate import (
     get_user_meta,
     get_remaining_credits_today,
@@ -38,7 +49,6 @@ def _k(name: str) -> str:
     return f"s8_{name}"
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 REPLACEMENTS = {
     "\u2022": "-", "\u2013": "-", "\u2014": "-",
@@ -50,18 +60,59 @@ def _ascii_sanitize(s: str) -> str:
         s = s.replace(k, v)
     return s.encode("latin-1", "replace").decode("latin-1")
 
-def _strip_salutation_and_signature(text: str) -> str:
-    t = text.strip()
-    t = re.sub(r'^(?:\s*(?:dear\b[^\n]*,|to whom[^\n]*,?|hello[^\n]*,?)\s*\n)+','',t,flags=re.IGNORECASE).lstrip()
-    t = re.sub(r'\n\s*(?:dear\b[^\n]*,|to whom[^\n]*,?|hello[^\n]*,?)\s*\n','\n',t,flags=re.IGNORECASE)
-    t = re.split(r'\n\s*(?:sincerely|regards|respectfully)\b.*', t, flags=re.IGNORECASE)[0].rstrip()
-    return re.sub(r'\n{3,}', '\n\n', t)
-
-BUREAU_ADDRESSES = {
-    "Equifax": "Equifax Information Services LLC\nP.O. Box 740256\nAtlanta, GA 30374",
-    "Experian": "Experian\nP.O. Box 4500\nAllen, TX 75013",
-    "TransUnion": "TransUnion Consumer Solutions\nP.O. Box 2000\nChester, PA 19016-2000",
-}
+def _job_metrics(info: dict) -> dict:
+    """Compact per-generation telemetry for the job row's llm_metrics column."""
+    info = info or {}
+    return {
+        "model": info.get("model", ""),
+        "mode": "/".join(x for x in (info.get("mode"), info.get("strategy")) if x),
+        "prompt_tokens": info.get("prompt_tokens", 0),
+        "completion_tokens": info.get("completion_tokens", 0),
+        "cached_tokens": info.get("cached_tokens", 0),
+        "wall_s": info.get("seconds"),
+        "ttft_s": info.get("ttft_s"),
+        "fell_back": bool(info.get("fell_back")),
+        "speculative": bool(info.get("speculative")),
+    }
+
+def _fanout_job(inputs: dict, bureau: str, email: str, llm_info: dict | None = None,
+                qa: dict | None = None, part: int | None = None) -> dict:
+    """
+    Jobs-sheet row for a letter Step 4.5 did not queue: an extra bureau in a fan-out,
+    or a part of a split intake (`part`, 1-based) with no intake row.
+    """
+    ui = inputs.get("user_info") or {}
+    dd = inputs.get("dispute_details") or {}
+    types = inputs.get("dispute_types") or []
+    items = dd.get("account_items") or [
+        {"type": t, **dd[t]} for t in types if isinstance(dd.get(t), dict)
+    ]
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    slug = (ui.get("full_name") or "user").strip().lower().replace(" ", "-") or "user"
+    return {
+        "letter_id": f"{slug}-{bureau.lower()}-{stamp}" + (f"-p{part}" if part else ""),
+        "email": email,
+        "bureau": bureau,
+        "dispute_type": "account" if dd.get("account_items") else (types[0] if types else ""),
+        "round_name": st.session_state.get("round_name", "R1"),
+        "llm_metrics": _job_metrics(llm_info) if llm_info else None,
+        "qa_notes": qa_notes_json(qa) if qa else "",
+        "status": "needs_fix" if qa and qa["status"] == "needs_fix" else "queued",
+        "payload": {
+            "user": {
+                "full_name": ui.get("full_name", ""),
+                "address":   ui.get("address", ""),
+                "dob":       ui.get("dob", ""),
+                "last4":     ui.get("ssn_last4", ""),
+                "phone":     ui.get("phone", ""),
+                "sms_opt_in": bool(ui.get("sms_opt_in", False)),
+            },
+            "items": items,
+            "bureau": bureau,
+            "round": st.session_state.get("round_name", "R1"),
+            "notes": st.session_state.get("notes", ""),
+        },
+    }
 
 def render():
     st.header("Step 8: Generate Your Letter")
@@ -84,25 +135,21 @@ def render():
         or ""
     )
 
-    # before you read jobs, initialize a retry counter once
-    if "jobs_retry" not in st.session_state:
-        st.session_state["jobs_retry"] = 0
-
+    # On 429 the list is re-read in the background; meanwhile show the last good one (or
+    # none) and rerun the page when the read lands.
+    jobs_key = f"jobs:{email_for_jobs.lower()}"
     try:
-        jobs = list_jobs_for_email(email_for_jobs, limit=25)
-        # success → reset counter
-        st.session_state["jobs_retry"] = 0
-    except APIError:
-        attempt = st.session_state["jobs_retry"]
-        if attempt < 3:  # 3 gentle retries max
+        jobs, age = background_retry.fresh_or_stale(jobs_key, list_jobs_for_email, email_for_jobs, limit=25)
+        if age:
+            st.caption("Syncing your recent jobs… showing the list from a moment ago.")
+            background_retry.rerun_when_ready(jobs_key)
+    except api_error():
+        jobs = []
+        if background_retry.pending(jobs_key):
             st.info("Syncing your recent jobs… one sec.")
-            st.session_state["jobs_retry"] += 1
-            time.sleep(1.2 * (attempt + 1))  # backoff: 1.2s, 2.4s, 3.6s
-            st.rerun()
+            background_retry.rerun_when_ready(jobs_key)
         else:
-            st.session_state["jobs_retry"] = 0
             st.info("Still syncing. Tap Refresh or try again shortly.")
-            jobs = []
 
     if jobs and "current_letter_id" not in st.session_state:
         st.session_state.current_letter_id = jobs[-1]["letter_id"]
@@ -136,8 +183,11 @@ def render():
                         payload = json.loads(payload) if isinstance(payload, str) else payload
                     except Exception:
                         payload = None
-                    requeue_job(job["letter_id"], payload=payload)
-                    st.success("Re-queued. The worker will pick this up on the next cycle.")
+                    if background_retry.run_or_schedule(f"requeue:{job['letter_id']}", requeue_job,
+                                                        job["letter_id"], payload=payload):
+                        st.success("Re-queued. The worker will pick this up on the next cycle.")
+                    else:
+                        st.success("Re-queued. It reaches the worker as soon as Google Sheets catches up.")
                 except Exception as e:
                     st.error(f"Could not re-queue: {e}")
         with cols[1]:
@@ -164,6 +214,17 @@ def render():
             key=_k("agree_cb")
         )
 
+        # same intake to more bureaus, generated together (one credit per letter)
+        primary_bureau = st.session_state.get("selected_bureau", "")
+        also_send = []
+        if primary_bureau in BUREAU_ADDRESSES:
+            also_send = st.multiselect(
+                "Also send this dispute to:",
+                [b for b in BUREAU_ADDRESSES if b != primary_bureau],
+                key=_k("fanout_bureaus"),
+                help="Each extra bureau gets its own letter, generated at the same time. One credit per letter.",
+            )
+
         cols = st.columns([1,1,3])
         with cols[0]:
             if st.button("Back to Step 7", key=_k("back_to7_btn")):
@@ -212,85 +273,121 @@ def render():
                     st.stop()
 
                 # --- gather inputs ---
-                dispute_details = st.session_state.dispute_details
-                dispute_types = st.session_state.dispute_types
-                bureau = st.session_state.get("selected_bureau", "")
                 round_num = st.session_state.get("dispute_round", "Round 1")
-                strategy  = st.session_state.get("round_strategy")
-                law_selection = st.session_state.law_selection
-
-                with st.spinner("Creating your personalized dispute letter..."):
-                    try:
-                        prompt = build_prompt(
-                            user_info=user_info,
-                            dispute_details=dispute_details,
-                            dispute_types=dispute_types,
-                            bureau=bureau,
-                            round_num=round_num,
-                            law_selection=law_selection,
-                            strategy=strategy,
-                        )
-                    except TypeError:
-                        prompt = build_prompt(
-                            user_info=user_info,
-                            dispute_details=dispute_details,
-                            dispute_types=dispute_types,
-                            bureau=bureau,
-                            round_num=round_num,
-                            law_selection=law_selection
-                        )
+                inputs = inputs_from_state(st.session_state)
+                parts = split_inputs(inputs)  # > MAX_ITEMS_PER_LETTER accounts -> several letters
 
-                    resp = client.chat.completions.create(
-                        model="gpt-4",
-                        messages=[
-                            {"role": "system",
-                             "content": ("You are a credit repair expert. "
-                                         "Return ONLY the body paragraphs of the dispute letter. "
-                                         "No header, no date, no salutation, no signature.")},
-                            {"role": "user", "content": prompt},
-                        ],
-                        temperature=0.6,
-                        max_tokens=900,
-                    )
-                    raw_body = (resp.choices[0].message.content or "").strip()
-                    body = _strip_salutation_and_signature(raw_body)
-
-                    # assemble final letter
+                # Fan-out / split needs one credit per letter
+                bureaus = [st.session_state.get("selected_bureau", "")] + list(also_send)
+                n_letters = len(bureaus) * len(parts)
+                if n_letters > 1:
+                    q = remaining_quota(user_rec)
+                    room = min(q["daily_left"], q["monthly_left"])
+                    local = st.session_state.get("credits_remaining", 0)
+                    if st.session_state.get("credit_mode") != "pro":
+                        room = min(room, local)
+                    if room < n_letters:
+                        st.error(f"{n_letters} letters need {n_letters} credits; you have {room} left.")
+                        st.stop()
+
+                # commit the Step 7.5 speculative run if nothing changed since; else discard it
+                spec_key = input_key(inputs)
+                parked_key = st.session_state.pop("spec_key", None)
+                if parked_key and parked_key != spec_key:
+                    speculative.discard(parked_key)
+
+                plan = user_rec.get("plan")
+                if n_letters == 1:
+                    spinner = "Creating your personalized dispute letter..."
+                elif len(parts) == 1:
+                    spinner = f"Creating {len(bureaus)} letters ({', '.join(bureaus)})..."
+                else:
+                    spinner = f"Creating {n_letters} letters ({len(parts)} per bureau, {', '.join(bureaus)})..."
+                cache = section_cache(st.session_state)
+                with st.spinner(spinner):
+                    parked = speculative.take(spec_key) if parked_key == spec_key else None
+                    if len(parts) > 1:
+                        # every part x bureau at once (Step 7.5 does not speculate on split intakes)
+                        part_results = generate_parts(parts, bureaus, plan, cache)
+                    elif len(bureaus) == 1:
+                        part_results = [{bureaus[0]: parked or generate_body(inputs, plan, cache)}]
+                    else:
+                        # primary bureau can reuse the parked run; the rest go out together
+                        todo = bureaus[1:] if parked else bureaus
+                        results = generate_bodies(inputs, todo, plan, cache)
+                        if parked:
+                            results[bureaus[0]] = parked
+                        part_results = [results]
+
+                    # assemble + save each letter; a failed one is reported, not charged
                     full_name = user_info.get("full_name", "")
-                    address = user_info.get("address", "")
-                    city = user_info.get("city", "")
-                    state = user_info.get("state", "")
-                    zip_code = user_info.get("zip") or user_info.get("zip_code", "")
-                    dob = user_info.get("dob", "")
-                    ssn_last4 = user_info.get("ssn_last4", "")
-                    bureau_block = BUREAU_ADDRESSES.get(bureau, bureau)
-                    today_str = datetime.now().strftime("%B %d, %Y")
-
-                    dob_line = f"Date of Birth: {dob}\n" if dob else ""
-                    ssn_line = f"SSN Last 4: {ssn_last4}\n" if ssn_last4 else ""
-
-                    header_block = (
-                        f"{full_name}\n{address}\n{city}, {state} {zip_code}\n\n"
-                        f"{dob_line}{ssn_line}\n"
-                        f"{bureau_block}\n\n{today_str}\n\n"
-                        f"Dear {bureau},\n"
-                    )
-                    signature = f"\nSincerely,\n{full_name}"
-                    letter_text = f"{header_block}\n{body}{signature}"
-
-                    # persist + history
-                    st.session_state.generated_letter = letter_text
-                    txt_path, pdf_path = save_letter_files(letter_text, full_name=full_name, bureau=bureau)
                     owner_email = (st.session_state.get("user") or {}).get("email", "")
-                    _ = log_dispute(
-                        full_name=full_name,
-                        bureau=bureau,
-                        round_num=round_num,
-                        dispute_types=st.session_state.dispute_types,
-                        txt_path=txt_path,
-                        pdf_path=pdf_path,
-                        owner_email=owner_email,
-                    )
+                    letters = []
+                    for n, (part_inputs, results) in enumerate(zip(parts, part_results), 1):
+                        part = n if len(parts) > 1 else None
+                        for b in bureaus:
+                            label = f"{b} ({n}/{len(parts)})" if part else b
+                            res = results.get(b)
+                            if isinstance(res, Exception) or res is None:
+                                st.warning(f"{label}: letter could not be generated ({res.__class__.__name__}). No credit used.")
+                                continue
+                            letter_text = assemble_letter(user_info, b, res[0])
+                            qa = check_letter(strip_salutation_and_signature(res[0]), dict(part_inputs, bureau=b))
+                            txt_path, pdf_path = save_letter_files(letter_text, full_name=full_name, bureau=b, part=part)
+                            letters.append({"bureau": b, "part": part, "label": label, "letter_text": letter_text,
+                                            "txt_path": txt_path, "pdf_path": pdf_path, "llm": res[1], "qa": qa})
+                    if not letters:
+                        st.error("Letter generation failed. Please try again.")
+                        st.stop()
+
+                    # persist + history (one CSV write for all letters)
+                    st.session_state.generated_letter = letters[0]["letter_text"]
+                    st.session_state.generated_letters = letters
+                    log_disputes([
+                        {
+                            "full_name": full_name,
+                            "bureau": l["bureau"],
+                            "round_num": round_num,
+                            "dispute_types": st.session_state.dispute_types,
+                            "txt_path": l["txt_path"],
+                            "pdf_path": l["pdf_path"],
+                            "owner_email": owner_email,
+                        }
+                        for l in letters
+                    ])
+
+                    # Step 4.5 queued one row per part for the primary bureau; every other
+                    # letter gets its Jobs row in one append
+                    intake_ids = (st.session_state.get("intake_letter_ids")
+                                  or [st.session_state.get("intake_letter_id")])
+                    if len(intake_ids) != len(parts):
+                        intake_ids = []  # items changed since Step 4.5; queue every part afresh
+                    intake_rows, extra_jobs = {}, []
+                    for l in letters:
+                        idx = (l["part"] or 1) - 1
+                        if l["bureau"] == bureaus[0] and idx < len(intake_ids) and intake_ids[idx]:
+                            intake_rows[intake_ids[idx]] = l
+                        else:
+                            extra_jobs.append(_fanout_job(parts[idx], l["bureau"], email, l["llm"], l["qa"], l["part"]))
+                    if extra_jobs:
+                        try:
+                            background_retry.run_or_schedule(f"jobs_add:{extra_jobs[0]['letter_id']}",
+                                                             add_job_rows, extra_jobs)
+                        except Exception as e:
+                            st.warning(f"Jobs for the extra letters will sync later ({e}).")
+
+                    # telemetry + QA notes for the intake's own job rows, one batch write (best effort)
+                    if intake_rows:
+                        updates = {}
+                        for lid, l in intake_rows.items():
+                            updates[lid] = {"llm_metrics": _job_metrics(l["llm"]), "qa_notes": qa_notes_json(l["qa"])}
+                            if l["qa"]["status"] == "needs_fix":
+                                updates[lid]["status"] = "needs_fix"
+                        try:
+                            background_retry.run_or_schedule(f"jobs_write:{','.join(sorted(updates))}",
+                                                             write_job_results, updates)
+                        except Exception:
+                            pass
 
                     # increment Access counters + local sidebar credits
                     try:
@@ -304,28 +401,32 @@ def render():
                         dispute_type_str = ", ".join([str(x) for x in dt]) if isinstance(dt, (list, tuple)) else str(dt or "")
                         dd = st.session_state.get("dispute_details", {}) or {}
                         account_ref = dd.get("account_ref") or dd.get("account_number") or dd.get("creditor") or ""
-                        letter_id_for_log = os.path.basename(txt_path) if txt_path else f"letter-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}"
-
-                        increment_counters_and_log(
-                            email=email_for_log,
-                            bureau=bureau,
-                            dispute_type=dispute_type_str,
-                            account_ref=account_ref,
-                            letter_id=letter_id_for_log,
-                        )
+                        for l in letters:
+                            txt_path = l["txt_path"]
+                            letter_id_for_log = os.path.basename(txt_path) if txt_path else f"letter-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}"
+
+                            increment_counters_and_log(
+                                email=email_for_log,
+                                bureau=l["bureau"],
+                                dispute_type=dispute_type_str,
+                                account_ref=account_ref,
+                                letter_id=letter_id_for_log,
+                            )
                     except Exception as e:
                         st.warning(f"Logged locally; external usage log deferred ({e}).")
 
                     # local UI tracker
-                    remaining = spend_one_credit()
+                    for _ in letters:
+                        remaining = spend_one_credit()
+                    done = "Letter generated." if len(letters) == 1 else f"{len(letters)} letters generated."
                     if remaining == -1:
-                        st.success("Letter generated. (Pro plan – unlimited credits)")
+                        st.success(f"{done} (Pro plan – unlimited credits)")
                     else:
-                        st.success(f"Letter generated. Credits remaining: {remaining}")
+                        st.success(f"{done} Credits remaining: {remaining}")
 
                     # ✅ Users sheet counters (authoritative): deduct + refresh cached user, then rerun
                     try:
-                        record_generation(user_rec)    # updates daily/monthly counters in Users sheet
+                        record_generation(user_rec, n=len(letters))  # updates daily/monthly counters in Users sheet
                         refresh_cached_user()          # refreshes st.session_state.user['record'] for sidebar
                         st.session_state["__credits_updated__"] = True
                     except Exception as e:
@@ -339,6 +440,14 @@ def render():
 
     # ---------- POST-GENERATION ----------
     letter_text = st.session_state.get("generated_letter", "")
+    first_qa = ((st.session_state.get("generated_letters") or [{}])[0]).get("qa") or {}
+    if first_qa.get("status") == "needs_fix":
+        st.warning("Quick check flagged this letter — review before sending:\n\n" + "\n".join(
+            f"- {i['detail']}" for i in first_qa["issues"] if i["severity"] == "error"))
+    sections = ((st.session_state.get("generated_letters") or [{}])[0].get("llm") or {}).get("sections")
+    if sections and sections["reused"]:
+        st.caption(f"Rewrote {len(sections['regenerated'])} of {sections['total']} paragraphs; "
+                   "the rest were kept from your previous version.")
     st.text_area("Your Generated Letter", letter_text, height=500, key=_k("preview_ta"))
 
     st.download_button(
@@ -348,7 +457,7 @@ def render():
         key=_k("dl_txt"),
     )
 
-    pdf = FPDF()
+    pdf = fpdf()()
     pdf.add_page()
     pdf.set_font("Arial", size=12)
     for ln in letter_text.split("\n"):
@@ -364,6 +473,25 @@ def render():
         key=_k("dl_pdf"),
     )
 
+    letters = st.session_state.get("generated_letters") or []
+    if len(letters) > 1:
+        st.markdown("---")
+        st.subheader(f"All {len(letters)} letters")
+        tabs = st.tabs([l.get("label") or l["bureau"] for l in letters])
+        for tab, l in zip(tabs, letters):
+            with tab:
+                label = l.get("label") or l["bureau"]
+                st.text_area(f"{label} letter", l["letter_text"], height=300,
+                             key=_k(f"preview_{l['bureau']}_{l.get('part') or 1}"))
+        paths = [p for l in letters for p in (l["txt_path"], l["pdf_path"])]
+        st.download_button(
+            "Download all letters (.zip)",
+            data=zip_letter_files(paths),
+            file_name="dispute_letters.zip",
+            mime="application/zip",
+            key=_k("dl_zip"),
+        )
+
     st.markdown("---")
     cols2 = st.columns([1,1,3])
     with cols2[0]:
@@ -375,7 +503,7 @@ def render():
         if st.button("Start Over", key=_k("start_over_btn")):
             for kclear in [
                 "dispute_types","dispute_details","selected_bureau","dispute_round",
-                "law_selection","user_info","generated_letter","help_chat","round_strategy"
+                "law_selection","user_info","generated_letter","generated_letters","help_chat","round_strategy"
             ]:
                 st.session_state.pop(kclear, None)
             st.session_state.s8_generated = False
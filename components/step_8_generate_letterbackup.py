@@ -1,6 +1,6 @@
 import streamlit as st
 from utils.prompt_builder import build_prompt
-from openai import OpenAI
+from utils.llm import get_client
 from dotenv import load_dotenv
 import os, io, re
 from datetime import datetime
@@ -16,7 +16,6 @@ from utils.credit_tracker import (
 
 # --- setup ---
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 REPLACEMENTS = {
     "\u2022": "-", "\u2013": "-", "\u2014": "-",
@@ -184,7 +183,7 @@ def render():
                         )
 
 
-                    resp = client.chat.completions.create(
+                    resp = get_client().chat.completions.create(
                         model="gpt-4",
                         messages=[
                             {"role": "system",
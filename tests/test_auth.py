@@ -0,0 +1,103 @@
+# tests/test_auth.py
+# Users-sheet reads and credit writes never wait in the calling thread: a throttled read
+# serves the last good table, and record_generation writes the row in the background.
+import sys, time, threading
+
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("gspread")
+
+USER_HEADERS = ["email", "password_hash", "plan", "active", "created_at",
+                "daily_count", "daily_date", "month_count", "month_yyyymm"]
+
+class FakeUsersSheet:
+    """ws.get / ws.update for the Users sheet; updates wait for `open` when it is cleared."""
+
+    def __init__(self):
+        self.rows = [list(USER_HEADERS),
+                     ["ada@example.com", "x", "pro", "TRUE", "2024-01-01", "0", "", "0", ""]]
+        self.gets = 0
+        self.updates = 0
+        self.open = threading.Event()
+        self.open.set()
+        self.writing = threading.Event()
+
+    def get(self, a1):
+        self.gets += 1
+        return [list(r) for r in self.rows]
+
+    def update(self, a1, values, **_):
+        self.writing.set()
+        assert self.open.wait(5)
+        row = int("".join(ch for ch in a1.split(":")[0] if ch.isdigit()))
+        self.rows[row - 1] = list(values[0])
+        self.updates += 1
+
+    def field(self, name):
+        return self.rows[1][USER_HEADERS.index(name)]
+
+@pytest.fixture
+def users(monkeypatch, tmp_path):
+    """Fresh utils.auth over a fake Users sheet; the cross-process gate file lives in tmp_path."""
+    for name in [m for m in sys.modules if m.split(".")[0] == "utils"]:
+        monkeypatch.delitem(sys.modules, name)
+    monkeypatch.setenv("TMPDIR", str(tmp_path))
+    monkeypatch.setenv("USERS_FETCH_MIN_S", "0")
+    from utils import auth, background_retry
+    sheet = FakeUsersSheet()
+    monkeypatch.setattr(auth, "_get_users_sheet", lambda: sheet)
+    monkeypatch.setattr(background_retry, "RETRY_BASE_S", 0.05)
+    auth._cached_all_users.clear()
+    yield auth, background_retry, sheet
+    auth._cached_all_users.clear()
+
+def _wait_until(cond, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+def test_a_throttled_read_fails_fast_and_serves_the_last_good_table(users, monkeypatch):
+    auth, background_retry, sheet = users
+    assert auth._users_table()[1] == sheet.rows[1:]
+    monkeypatch.setenv("USERS_FETCH_MIN_S", "0.3")   # another process "just" read the sheet
+    auth._cached_all_users.clear()
+
+    t0 = time.monotonic()
+    headers, rows = auth._users_table()
+    assert time.monotonic() - t0 < 0.2
+    assert rows == sheet.rows[1:] and sheet.gets == 1   # last good table, no read yet
+    with pytest.raises(auth.api_error()):
+        auth.find_user("ada@example.com", fresh=True)    # login never gets a stale table
+
+    background_retry._TASKS[auth.USERS_TABLE_KEY].result(timeout=5)
+    assert sheet.gets == 2   # read once the window passed, in the pool
+
+def test_record_generation_writes_the_row_in_the_background(users):
+    auth, _, sheet = users
+    rec = auth.find_user("ada@example.com")
+    sheet.open.clear()   # hold the write
+
+    t0 = time.monotonic()
+    auth.record_generation(rec, n=2)
+    assert time.monotonic() - t0 < 0.2
+    assert rec["daily_count"] == "2" and rec["month_count"] == "2" and rec["daily_date"]
+    assert sheet.field("daily_count") == "0"
+    assert auth.find_user("ada@example.com")["daily_count"] == "2"   # unwritten counts win
+
+    sheet.open.set()
+    _wait_until(lambda: not auth._COUNTS)
+    assert sheet.field("daily_count") == "2" and sheet.field("month_count") == "2"
+
+def test_counts_taken_during_a_write_go_out_in_a_follow_up_write(users):
+    auth, _, sheet = users
+    rec = auth.find_user("ada@example.com")
+    sheet.open.clear()
+    auth.record_generation(rec)
+    assert sheet.writing.wait(5)
+    auth.record_generation(rec)   # the first write is in flight: deduped, then followed up
+
+    sheet.open.set()
+    _wait_until(lambda: not auth._COUNTS)
+    assert sheet.field("daily_count") == "2" and sheet.updates == 2
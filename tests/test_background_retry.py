@@ -0,0 +1,100 @@
+# tests/test_background_retry.py
+# Last good values, deduped background retries, and what take/forget hand back.
+import time, threading
+from collections import OrderedDict
+
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("gspread")
+
+from utils import background_retry as br
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(br, "_TASKS", {})
+    monkeypatch.setattr(br, "_EPOCH", {})
+    monkeypatch.setattr(br, "_LAST_GOOD", OrderedDict())
+    monkeypatch.setattr(br, "RETRY_BASE_S", 0.01)
+    monkeypatch.setattr(br, "RETRY_MAX_S", 0.02)
+
+class Sheet:
+    """A call that returns `value`, or raises a 429 while `over_quota`; waits for `gate`."""
+
+    def __init__(self, value="v1"):
+        self.value = value
+        self.over_quota = False
+        self.calls = 0
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def __call__(self):
+        self.calls += 1
+        assert self.gate.wait(5)
+        if self.over_quota:
+            raise br.quota_error("Quota exceeded")
+        return self.value
+
+def test_fresh_or_stale_serves_the_last_good_value_until_it_is_too_old(monkeypatch):
+    sheet = Sheet()
+    assert br.fresh_or_stale("k", sheet) == ("v1", 0.0)
+
+    sheet.over_quota = True
+    value, age = br.fresh_or_stale("k", sheet)
+    assert value == "v1" and 0 <= age < 1
+    assert br.pending("k") or br.take("k") is not None   # the read was handed to the pool
+
+    monkeypatch.setattr(br, "STALE_MAX_S", 0.05)
+    time.sleep(0.1)
+    with pytest.raises(br.api_error()):
+        br.fresh_or_stale("k", sheet)
+
+def test_fresh_or_stale_raises_other_errors_without_scheduling():
+    def broken():
+        raise ValueError("bad range")
+    with pytest.raises(ValueError):
+        br.fresh_or_stale("k", broken)
+    assert not br.pending("k") and br.take("k") is None
+
+def test_schedule_runs_one_task_per_key():
+    sheet = Sheet()
+    sheet.gate.clear()
+    first = br.schedule("k", sheet)
+    assert br.schedule("k", sheet) is first
+    other = br.schedule("other", Sheet("v2"))
+    assert other is not first
+
+    sheet.gate.set()
+    assert first.result(timeout=5) == "v1" and other.result(timeout=5) == "v2"
+    assert sheet.calls == 1
+    assert br.last_good("k")[0] == "v1"
+
+def test_take_hands_back_a_finished_task_once():
+    sheet = Sheet()
+    sheet.gate.clear()
+    fut = br.schedule("k", sheet)
+    assert br.take("k") is None and br.pending("k")   # not ready yet
+
+    sheet.gate.set()
+    fut.result(timeout=5)
+    assert br.take("k") is fut
+    assert br.take("k") is None
+
+def test_forget_drops_a_finished_result_and_the_last_good_value():
+    fut = br.schedule("k", Sheet())
+    fut.result(timeout=5)
+    br.forget("k")
+    assert br.take("k") is None
+    assert br.last_good("k") == (None, None)
+
+def test_a_task_running_when_forgotten_is_not_remembered():
+    sheet = Sheet("before the write")
+    sheet.gate.clear()
+    fut = br.schedule("k", sheet)
+    br.forget("k")
+    assert not br.pending("k")
+
+    sheet.gate.set()
+    assert fut.result(timeout=5) == "before the write"
+    assert br.last_good("k") == (None, None)
+    assert br.take("k") is None
@@ -0,0 +1,251 @@
+# tests/test_bulk_jobs.py
+# Bulk generation against an in-memory Jobs sheet and LocalBackend with a fake client.
+import sys, json, types
+
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("gspread")
+
+HEADERS = ["letter_id", "status", "email", "bureau", "dispute_type", "round_name",
+           "payload_json", "letter_text", "qa_notes", "created_at", "updated_at"]
+
+BODY = (
+    "I am writing to dispute the Capital One account ending in 1234 on my credit report. "
+    "It is reported as 120 days late, but I have never been late on this account. "
+    "Please investigate and correct or delete this inaccurate information."
+)
+
+def _col(letters: str) -> int:
+    n = 0
+    for ch in letters:
+        n = n * 26 + ord(ch) - 64
+    return n
+
+class FakeJobsSheet:
+    """The slice of a gspread Worksheet that utils.jobs uses, in memory."""
+
+    def __init__(self, rows):
+        self.rows = [list(HEADERS)] + [list(r) for r in rows]
+        self.col_count = 40
+        self.row_count = 1000
+
+    def row_values(self, i):
+        return list(self.rows[i - 1]) if i <= len(self.rows) else []
+
+    def get_all_values(self):
+        return [list(r) for r in self.rows]
+
+    def add_cols(self, n):
+        self.col_count += n
+
+    def update(self, a1, values, **_):
+        start = a1.split(":")[0]
+        letters = "".join(ch for ch in start if ch.isalpha())
+        row, col = int(start[len(letters):]), _col(letters)
+        for i, vals in enumerate(values):
+            for j, v in enumerate(vals):
+                self._set(row + i, col + j, v)
+
+    def batch_update(self, updates, **_):
+        for u in updates:
+            self.update(u["range"], u["values"])
+
+    def _set(self, row, col, value):
+        while len(self.rows) < row:
+            self.rows.append([])
+        r = self.rows[row - 1]
+        r += [""] * (col - len(r))
+        r[col - 1] = "" if value is None else str(value)
+
+    def set(self, letter_id, **fields):
+        head = self.rows[0]
+        for n, r in enumerate(self.rows[1:], start=2):
+            if r and r[0] == letter_id:
+                for k, v in fields.items():
+                    self._set(n, head.index(k) + 1, v)
+                return
+        raise KeyError(letter_id)
+
+    def record(self, letter_id) -> dict:
+        head = self.rows[0]
+        for r in self.rows[1:]:
+            if r and r[0] == letter_id:
+                return {h: (r[i] if i < len(r) else "") for i, h in enumerate(head)}
+        raise KeyError(letter_id)
+
+def job_row(letter_id, status="bulk_queued", payload=None):
+    payload = payload if payload is not None else {
+        "user": {"full_name": "Ada Lovelace", "address": "1 Main St", "dob": "1990", "last4": "1234"},
+        "items": [{"type": "account", "name": "Capital One", "last4": "1234",
+                   "issue": "Reported as 120 days late but I was never late."}],
+        "bureau": "Experian",
+        "round": "R1",
+    }
+    raw = payload if isinstance(payload, str) else json.dumps(payload)
+    return [letter_id, status, "ada@example.com", "Experian", "account", "R1", raw, "", "", "", ""]
+
+class FakeClient:
+    """chat.completions.create -> one fixed reply."""
+
+    def __init__(self, reply=BODY):
+        self.reply = reply
+        self.calls = 0
+        self.chat = types.SimpleNamespace(completions=self)
+
+    def create(self, **body):
+        self.calls += 1
+        if isinstance(self.reply, Exception):
+            raise self.reply
+        usage = types.SimpleNamespace(prompt_tokens=10, completion_tokens=20, prompt_tokens_details=None)
+        msg = types.SimpleNamespace(content=self.reply)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=msg)], usage=usage)
+
+class ScriptedBackend:
+    """A batch backend whose status the test sets; answers every request with BODY."""
+
+    def __init__(self, status="completed"):
+        self.status = status
+        self.submitted = {}
+        self.cancelled = []
+
+    def submit(self, requests):
+        batch_id = f"batch-{len(self.submitted) + 1}"
+        self.submitted[batch_id] = [r["custom_id"] for r in requests]
+        return batch_id
+
+    def poll(self, batch_id):
+        if isinstance(self.status, Exception):
+            raise self.status
+        return self.status
+
+    def cancel(self, batch_id):
+        self.cancelled.append(batch_id)
+
+    def results(self, batch_id):
+        usage = {"prompt_tokens": 10, "completion_tokens": 20}
+        return {cid: (BODY, usage) for cid in self.submitted.get(batch_id, [])}
+
+@pytest.fixture
+def bulk(monkeypatch, tmp_path):
+    """Fresh utils.jobs / utils.bulk_jobs over a fake Jobs sheet. Returns a namespace."""
+    import streamlit as st
+
+    for name in [m for m in sys.modules if m.split(".")[0] == "utils"]:
+        monkeypatch.delitem(sys.modules, name)
+    monkeypatch.setattr(st, "secrets", {"JOBS_SHEET_ID": "test-jobs"})
+    monkeypatch.setenv("METRICS_DB_DIR", str(tmp_path))
+    monkeypatch.setenv("PROFILE_DB_DIR", str(tmp_path))
+
+    from utils import jobs, bulk_jobs
+    sheet = FakeJobsSheet([])
+    client = FakeClient()
+    monkeypatch.setattr(jobs, "_open_jobs_ws", lambda: sheet)
+    monkeypatch.setattr(bulk_jobs, "_client", lambda: client)
+    monkeypatch.setattr(bulk_jobs, "BULK_POLL_S", 0.01)
+    return types.SimpleNamespace(jobs=jobs, bulk_jobs=bulk_jobs, sheet=sheet, client=client)
+
+def test_qa_ignores_the_salutation_and_sign_off_assemble_letter_strips(bulk):
+    bulk.client.reply = f"Dear Experian,\n\n{BODY}\n\nSincerely,\nAda Lovelace"
+    bulk.sheet.rows.append(job_row("a"))
+    bulk.bulk_jobs.run_bulk(backend=bulk.bulk_jobs.LocalBackend())
+    from utils.letter_qa import check_letter
+
+    rec = bulk.sheet.record("a")
+    qa = json.loads(rec["qa_notes"])
+    checks = {i["check"] for i in qa["issues"]}
+    assert "salutation" not in checks and "signature" not in checks
+    clean = check_letter(BODY, bulk.bulk_jobs.inputs_from_job(rec))
+    assert qa["word_count"] == clean["word_count"]
+    assert qa["status"] == clean["status"]
+    assert rec["letter_text"].count("Dear ") == 1   # assemble_letter's own salutation only
+
+def test_a_batch_left_in_flight_is_resumed_by_the_next_pass(bulk):
+    bulk.sheet.rows += [job_row("a"), job_row("b")]
+    backend = ScriptedBackend(status=RuntimeError("connection reset"))
+    with pytest.raises(RuntimeError):
+        bulk.bulk_jobs.run_bulk(backend=backend)
+    assert [bulk.sheet.record(l)["status"] for l in "ab"] == ["bulk_inflight"] * 2
+    assert {bulk.sheet.record(l)["bulk_batch_id"] for l in "ab"} == {"batch-1"}
+
+    backend.status = "completed"
+    summary = bulk.bulk_jobs.run_bulk(backend=backend)
+    assert summary["resumed"] == 2 and summary["approved"] + summary["needs_fix"] == 2
+    assert list(backend.submitted) == ["batch-1"]   # polled again, not re-submitted
+    assert json.loads(bulk.sheet.record("a")["llm_metrics"])["batch_id"] == "batch-1"
+
+def test_a_claim_without_a_batch_is_released_after_the_ttl(bulk):
+    bulk.sheet.rows += [job_row("old", status="bulk_inflight"), job_row("new", status="bulk_inflight")]
+    bulk.jobs._ensure_followup_columns(bulk.sheet)
+    bulk.sheet.set("old", bulk_claimed_at="2000-01-01 00:00:00")
+    bulk.sheet.set("new", bulk_claimed_at=bulk.jobs.now_local_str())
+
+    summary = bulk.bulk_jobs.run_bulk(backend=ScriptedBackend())
+    assert summary["released"] == 1
+    assert bulk.sheet.record("old")["letter_text"]   # released, then claimed and written back
+    assert bulk.sheet.record("new")["status"] == "bulk_inflight"
+
+def test_a_timed_out_batch_is_cancelled_before_its_rows_are_requeued(bulk, monkeypatch):
+    monkeypatch.setattr(bulk.bulk_jobs, "BULK_MAX_WAIT_S", 0.05)
+    bulk.sheet.rows.append(job_row("a"))
+    backend = ScriptedBackend(status="in_progress")
+    with pytest.raises(TimeoutError):
+        bulk.bulk_jobs.run_bulk(backend=backend)
+    assert backend.cancelled == ["batch-1"]
+    rec = bulk.sheet.record("a")
+    assert rec["status"] == "bulk_queued" and rec["bulk_batch_id"] == ""
+
+def test_claim_marks_rows_in_flight_and_counts_the_attempt(bulk):
+    bulk.sheet.rows += [job_row("a"), job_row("b", status="queued"), job_row("c")]
+    claimed = bulk.jobs.claim_bulk_jobs()
+    assert [j["letter_id"] for j in claimed] == ["a", "c"]
+    for lid in "ac":
+        rec = bulk.sheet.record(lid)
+        assert rec["status"] == "bulk_inflight" and rec["bulk_attempts"] == "1" and rec["bulk_claimed_at"]
+    assert bulk.sheet.record("b")["status"] == "queued"
+    assert bulk.jobs.claim_bulk_jobs() == []   # nothing left to take
+
+def test_write_back_skips_a_row_the_user_changed_while_in_flight(bulk):
+    bulk.sheet.rows += [job_row("a"), job_row("b")]
+
+    class UserRegenerates(bulk.bulk_jobs.LocalBackend):
+        def poll(self, batch_id):
+            bulk.sheet.set("b", status="queued", letter_text="edited in Step 8")
+            return super().poll(batch_id)
+
+    summary = bulk.bulk_jobs.run_bulk(backend=UserRegenerates())
+    assert summary["skipped"] == 1 and summary["approved"] + summary["needs_fix"] == 1
+    assert bulk.sheet.record("a")["letter_text"].count(BODY[:40]) == 1
+    assert bulk.sheet.record("b")["letter_text"] == "edited in Step 8"
+    assert bulk.sheet.record("b")["status"] == "queued"
+
+def test_failed_rows_are_requeued_then_parked_at_the_attempt_cap(bulk, monkeypatch):
+    monkeypatch.setattr(bulk.bulk_jobs, "BULK_MAX_ATTEMPTS", 2)
+    bulk.client.reply = RuntimeError("model overloaded")
+    bulk.sheet.rows.append(job_row("a"))
+
+    first = bulk.bulk_jobs.run_bulk(backend=bulk.bulk_jobs.LocalBackend())
+    assert first["failed"] == 1 and first["parked"] == 0
+    rec = bulk.sheet.record("a")
+    assert rec["status"] == "bulk_queued" and rec["bulk_attempts"] == "1"
+
+    second = bulk.bulk_jobs.run_bulk(backend=bulk.bulk_jobs.LocalBackend())
+    assert second["parked"] == 1
+    rec = bulk.sheet.record("a")
+    assert rec["status"] == "needs_fix" and rec["bulk_attempts"] == "2"
+    assert "model overloaded" in json.loads(rec["qa_notes"])["issues"][0]["detail"]
+    assert bulk.jobs.claim_bulk_jobs() == []   # parked rows stay out of the queue
+
+    bulk.client.reply = BODY
+    bulk.jobs.requeue_job("a")
+    assert bulk.sheet.record("a")["bulk_attempts"] == "0"
+    third = bulk.bulk_jobs.run_bulk(backend=bulk.bulk_jobs.LocalBackend())
+    assert third["approved"] + third["needs_fix"] == 1 and bulk.sheet.record("a")["letter_text"]
+
+def test_a_row_with_a_bad_payload_is_parked_without_a_batch(bulk, monkeypatch):
+    monkeypatch.setattr(bulk.bulk_jobs, "BULK_MAX_ATTEMPTS", 1)
+    bulk.sheet.rows.append(job_row("a", payload="{not json"))
+    summary = bulk.bulk_jobs.run_bulk(backend=bulk.bulk_jobs.LocalBackend())
+    assert summary["submitted"] == 0 and summary["parked"] == 1
+    assert bulk.client.calls == 0
+    assert bulk.sheet.record("a")["status"] == "needs_fix"
@@ -0,0 +1,176 @@
+# tests/test_dispatcher.py
+# The dispatcher's idempotency ledger and sheet write-back, against an in-memory
+# Reminders sheet and fake senders.
+import sys, json, time
+from datetime import datetime, timedelta, timezone
+from contextlib import closing
+
+import pytest
+
+NOON_UTC = datetime(2026, 3, 10, 16, 0, 0, tzinfo=timezone.utc)   # 12:00 in America/New_York
+
+def _col(letters: str) -> int:
+    n = 0
+    for ch in letters:
+        n = n * 26 + ord(ch) - 64
+    return n
+
+class FakeRemindersSheet:
+    """get_all_values / batch_update over a list of rows; `fail_writes` makes batch_update raise."""
+
+    def __init__(self, headers):
+        self.rows = [list(headers)]
+        self.fail_writes = 0
+
+    def get_all_values(self):
+        return [list(r) for r in self.rows]
+
+    def batch_update(self, updates, **_):
+        if self.fail_writes:
+            self.fail_writes -= 1
+            raise ConnectionError("sheet write lost")
+        for u in updates:
+            letters = "".join(ch for ch in u["range"] if ch.isalpha())
+            row, col = int(u["range"][len(letters):]), _col(letters)
+            self.rows[row - 1][col - 1] = u["values"][0][0]
+
+    def status(self, reminder_id):
+        for r in self.rows[1:]:
+            if r[0] == reminder_id:
+                return r[self.rows[0].index("status")]
+        raise KeyError(reminder_id)
+
+class Outbox:
+    """Fake notifications.send_email / send_sms; addresses starting with "fail" are refused."""
+
+    def __init__(self):
+        self.sent = []
+
+    def email(self, to, subject, html):
+        self.sent.append(("email", to, subject))
+        return not to.startswith("fail")
+
+    def sms(self, to, body):
+        self.sent.append(("sms", to, body))
+        return not to.startswith("fail")
+
+@pytest.fixture
+def disp(monkeypatch, tmp_path):
+    """Fresh utils.dispatcher over a fake sheet and outbox, with the clock at local noon."""
+    for name in [m for m in sys.modules if m.split(".")[0] == "utils"]:
+        monkeypatch.delitem(sys.modules, name)
+    monkeypatch.setenv("DISPATCH_DB_DIR", str(tmp_path))
+    monkeypatch.delenv("SENDGRID_API_KEY", raising=False)
+    from utils import dispatcher, reminders, notifications
+
+    sheet = FakeRemindersSheet(reminders.REM_HEADERS)
+    outbox = Outbox()
+    monkeypatch.setattr(reminders, "_open_reminders_ws", lambda: sheet)
+    monkeypatch.setattr(reminders, "_now_utc", lambda: NOON_UTC)
+    monkeypatch.setattr(notifications, "send_email", outbox.email)
+    monkeypatch.setattr(notifications, "send_sms", outbox.sms)
+    monkeypatch.setattr(dispatcher, "MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(dispatcher, "_backoff", lambda attempt: 0)
+
+    def add(rid, email=None, due=NOON_UTC - timedelta(hours=1), channel="email", topic="mail_nudge"):
+        sheet.rows.append([
+            rid, rid.split("-")[0], email or f"{rid}@example.com", "", channel, topic,
+            due.strftime("%Y-%m-%d %H:%M:%S"), "pending",
+            json.dumps({"bureau": "Experian", "round": "R1"}), "", "", "",
+        ])
+
+    dispatcher._ensure_db()
+    return type("Disp", (), dict(mod=dispatcher, sheet=sheet, outbox=outbox, add=staticmethod(add)))
+
+def _ledger(dispatcher, rid, status, claimed_at):
+    with closing(dispatcher._connect()) as conn:
+        conn.execute(
+            "INSERT INTO deliveries(reminder_id, status, attempts, claimed_at) VALUES(?, ?, 1, ?)",
+            (rid, status, claimed_at),
+        )
+
+def test_a_second_pass_over_the_same_rows_sends_nothing(disp):
+    disp.add("r1")
+    disp.add("r2", email="fail@example.com")
+    disp.sheet.fail_writes = 1   # the pass crashes after sending, before the sheet is updated
+    with pytest.raises(ConnectionError):
+        disp.mod.run_once()
+    assert len(disp.outbox.sent) == 1 + 2   # r2 was tried MAX_ATTEMPTS times
+    assert disp.sheet.status("r1") == "pending"
+
+    summary = disp.mod.run_once()
+    assert len(disp.outbox.sent) == 3
+    assert summary["sent"] == 0 and summary["failed"] == 0 and summary["skipped"] == 2
+    assert (disp.sheet.status("r1"), disp.sheet.status("r2")) == ("sent", "failed")   # re-synced
+
+def test_an_expired_claim_is_taken_again_but_a_fresh_one_is_not(disp):
+    disp.add("stale")
+    disp.add("busy")
+    _ledger(disp.mod, "stale", "claimed", time.time() - disp.mod.CLAIM_TTL_S - 1)   # its worker died
+    _ledger(disp.mod, "busy", "claimed", time.time())                               # still working
+
+    summary = disp.mod.run_once()
+    assert [to for _, to, _ in disp.outbox.sent] == ["stale@example.com"]
+    assert summary["sent"] == 1 and summary["skipped"] == 1
+    assert disp.sheet.status("stale") == "sent"
+    assert disp.sheet.status("busy") == "pending"   # left to the worker that holds it
+
+def test_final_rows_are_never_claimed_again(disp):
+    disp.add("done")
+    disp.add("gave-up")
+    long_ago = time.time() - 10 * disp.mod.CLAIM_TTL_S
+    _ledger(disp.mod, "done", "sent", long_ago)
+    _ledger(disp.mod, "gave-up", "failed", long_ago)
+
+    disp.mod.run_once()
+    assert disp.outbox.sent == []
+    assert disp.mod._claim("done") == "sent" and disp.mod._claim("gave-up") == "failed"
+    assert (disp.sheet.status("done"), disp.sheet.status("gave-up")) == ("sent", "failed")
+
+def test_outcomes_land_on_their_own_rows_after_the_sheet_shifts(disp, monkeypatch):
+    for rid in ("a", "b", "c"):
+        disp.add(rid, email="fail@example.com" if rid == "b" else None)
+    listed = disp.mod.list_due_reminders(limit=10)
+    assert {r["reminder_id"]: r["__row"] for r in listed} == {"a": 2, "b": 3, "c": 4}
+
+    # a row is inserted above them while the pass is sending: every __row is now off by one
+    real_list = disp.mod.list_due_reminders
+
+    def list_then_shift(*args, **kwargs):
+        out = real_list(*args, **kwargs)
+        disp.sheet.rows.insert(1, ["new", "new", "new@example.com", "", "email", "mail_nudge",
+                                   "2030-01-01 00:00:00", "pending", "{}", "", "", ""])
+        return out
+    monkeypatch.setattr(disp.mod, "list_due_reminders", list_then_shift)
+
+    disp.mod.run_once()
+    assert [disp.sheet.status(r) for r in ("a", "b", "c", "new")] == ["sent", "failed", "sent", "pending"]
+
+# ---------- digests ----------
+
+def test_a_reminder_due_later_today_waits_when_nothing_is_due_now(disp):
+    disp.add("later", due=NOON_UTC + timedelta(hours=3))
+    summary = disp.mod.run_once()
+    assert disp.outbox.sent == [] and summary["due"] == 0
+    assert disp.sheet.status("later") == "pending"
+
+def test_one_member_due_now_sends_one_digest_for_the_whole_day(disp):
+    disp.add("now", email="ada@example.com", topic="mail_nudge")
+    disp.add("tonight", email="ada@example.com", due=NOON_UTC + timedelta(hours=6), topic="status_check")
+    disp.add("tomorrow", email="ada@example.com", due=NOON_UTC + timedelta(days=1))
+
+    summary = disp.mod.run_once()
+    assert summary["digests"] == 1 and summary["sent"] == 2
+    assert [(ch, to) for ch, to, _ in disp.outbox.sent] == [("email", "ada@example.com")]
+    assert "(2)" in disp.outbox.sent[0][2]   # "Your BoostBridgeDIY reminders (2)"
+    assert [disp.sheet.status(r) for r in ("now", "tonight", "tomorrow")] == ["sent", "sent", "pending"]
+
+def test_a_failed_digest_fails_every_member(disp):
+    disp.add("one", email="fail@example.com")
+    disp.add("two", email="fail@example.com", due=NOON_UTC + timedelta(hours=2), topic="status_check")
+
+    summary = disp.mod.run_once()
+    assert len(disp.outbox.sent) == disp.mod.MAX_ATTEMPTS   # one digest, retried; never per member
+    assert summary["failed"] == 2
+    assert (disp.sheet.status("one"), disp.sheet.status("two")) == ("failed", "failed")
+    assert disp.mod._claim("one") == "failed" and disp.mod._claim("two") == "failed"
@@ -0,0 +1,442 @@
+# tests/test_flow_budget.py
+# Rerun budget for the wizard. Walks Step 1 -> 8 headlessly (streamlit.testing AppTest)
+# against in-memory Sheets and OpenAI backends, reads the session's run stats
+# (utils.run_stats) and compares them with the stored budget in flow_budget.json:
+# full script runs, Sheets requests and LLM requests, in total and per step.
+#
+# A change that adds reruns or requests to the flow (an st.rerun() per widget, a Sheets
+# read moved out of a cache, a second LLM call per letter) fails this test; if it is
+# intended, store the new budget with the change:
+#
+#   FLOW_BUDGET_UPDATE=1 python -m pytest tests/test_flow_budget.py
+import os, sys, json, base64, threading, types
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("streamlit")
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+BUDGET_FILE = os.path.join(HERE, "flow_budget.json")
+APP_FILE = os.path.join(ROOT, "app.py")
+
+JOBS_SHEET_ID = "flow-budget-jobs"
+ACCESS_SHEET_ID = "flow-budget-access"
+
+TEST_EMAIL = "flow-budget@example.com"
+USERS_HEADERS = ["email", "password_hash", "plan", "active", "created_at",
+                 "daily_count", "daily_date", "month_count", "month_yyyymm", "consent"]
+TEST_USER = [TEST_EMAIL, "", "pro", "TRUE", "2025-01-01 00:00:00", "0", "", "0", "", ""]
+
+FAKE_LETTER = (
+    "I am writing to dispute the accuracy of the account listed below on my credit report. "
+    "The information reported is not accurate and should be investigated and corrected or deleted. "
+    "Please provide the method used to verify this account and send me an updated copy of my report."
+)
+
+RUN_TIMEOUT_S = 30
+
+# ---------- in-memory Google Sheets ----------
+
+class _APIError(Exception):
+    pass
+
+class _WorksheetNotFound(Exception):
+    pass
+
+class _Cell:
+    def __init__(self, row: int, col: int, value: str):
+        self.row, self.col, self.value = row, col, value
+
+def _col_letters(col: int) -> str:
+    out = ""
+    while col:
+        col, rem = divmod(col - 1, 26)
+        out = chr(65 + rem) + out
+    return out
+
+def _rowcol_to_a1(row: int, col: int) -> str:
+    return f"{_col_letters(col)}{row}"
+
+def _a1_to_rowcol(a1: str) -> tuple[int, int]:
+    letters = "".join(ch for ch in a1 if ch.isalpha()).upper()
+    digits = "".join(ch for ch in a1 if ch.isdigit())
+    col = 0
+    for ch in letters:
+        col = col * 26 + (ord(ch) - 64)
+    return int(digits or 1), col or 1
+
+class _Worksheet:
+    def __init__(self, title: str, rows: list[list[str]] | None = None):
+        self.title = title
+        self._rows = [list(r) for r in rows or []]
+        self._cols = max([26] + [len(r) for r in self._rows])
+        self._lock = threading.Lock()
+
+    @property
+    def row_count(self) -> int:
+        return max(1000, len(self._rows))
+
+    @property
+    def col_count(self) -> int:
+        return self._cols
+
+    def _set(self, row: int, col: int, value) -> None:
+        while len(self._rows) < row:
+            self._rows.append([])
+        r = self._rows[row - 1]
+        while len(r) < col:
+            r.append("")
+        r[col - 1] = "" if value is None else str(value)
+        self._cols = max(self._cols, col)
+
+    def get_all_values(self, **_):
+        with self._lock:
+            return [list(r) for r in self._rows]
+
+    def get(self, a1: str = "", **_):
+        return self.get_all_values()
+
+    def row_values(self, row: int, **_):
+        with self._lock:
+            return list(self._rows[row - 1]) if row <= len(self._rows) else []
+
+    def col_values(self, col: int, **_):
+        with self._lock:
+            return [r[col - 1] if col <= len(r) else "" for r in self._rows]
+
+    def find(self, query: str, **_):
+        with self._lock:
+            for i, r in enumerate(self._rows, 1):
+                for j, v in enumerate(r, 1):
+                    if v == query:
+                        return _Cell(i, j, v)
+        return None
+
+    def append_row(self, values, **_):
+        with self._lock:
+            self._rows.append(["" if v is None else str(v) for v in values])
+
+    def append_rows(self, rows, **_):
+        for values in rows:
+            self.append_row(values)
+
+    def update(self, range_name, values=None, **_):
+        if values is None:   # update(values) form
+            range_name, values = "A1", range_name
+        row, col = _a1_to_rowcol(str(range_name).split(":")[0].split("!")[-1])
+        with self._lock:
+            for i, vals in enumerate(values):
+                for j, v in enumerate(vals):
+                    self._set(row + i, col + j, v)
+
+    def batch_update(self, data, **_):
+        for d in data:
+            self.update(d["range"], d["values"])
+
+    def update_cell(self, row: int, col: int, value):
+        with self._lock:
+            self._set(row, col, value)
+
+    def add_cols(self, n: int):
+        self._cols += n
+
+    def resize(self, rows=None, cols=None):
+        if cols:
+            self._cols = cols
+
+    def clear(self):
+        with self._lock:
+            self._rows = []
+
+class _Spreadsheet:
+    def __init__(self, key: str):
+        self.id = key
+        self._sheets: dict[str, _Worksheet] = {}
+
+    @property
+    def sheet1(self) -> _Worksheet:
+        return self.get_worksheet(0)
+
+    def get_worksheet(self, index: int) -> _Worksheet:
+        if not self._sheets:
+            self._sheets["Sheet1"] = _Worksheet("Sheet1")
+        return list(self._sheets.values())[index]
+
+    def worksheet(self, title: str) -> _Worksheet:
+        if title not in self._sheets:
+            raise _WorksheetNotFound(title)
+        return self._sheets[title]
+
+    def worksheets(self):
+        return list(self._sheets.values())
+
+    def add_worksheet(self, title: str, rows: int = 1000, cols: int = 26, **_):
+        ws = self._sheets[title] = _Worksheet(title)
+        ws._cols = cols
+        return ws
+
+class _SheetsClient:
+    def __init__(self, books: dict):
+        self._books = books
+
+    def open_by_key(self, key: str) -> _Spreadsheet:
+        return self._books.setdefault(key, _Spreadsheet(key))
+
+def _seed_books(users_sheet_id: str) -> dict:
+    users = _Spreadsheet(users_sheet_id)
+    users._sheets["Sheet1"] = _Worksheet("Sheet1", [USERS_HEADERS, TEST_USER])
+    return {users_sheet_id: users}
+
+# ---------- OpenAI ----------
+
+def _ns(**kw):
+    return types.SimpleNamespace(**kw)
+
+class _Completions:
+    def __init__(self, calls: list):
+        self._calls = calls
+
+    def create(self, model="", messages=(), stream=False, **_):
+        self._calls.append(model)
+        words = FAKE_LETTER.split(" ")
+        usage = _ns(prompt_tokens=sum(len(m.get("content", "")) for m in messages) // 4,
+                    completion_tokens=len(words) * 4 // 3,
+                    prompt_tokens_details=_ns(cached_tokens=0))
+        if not stream:
+            return _ns(choices=[_ns(message=_ns(content=FAKE_LETTER), finish_reason="stop")],
+                       usage=usage, model=model)
+        chunks = [_ns(choices=[_ns(delta=_ns(content=w + " "))], usage=None) for w in words]
+        chunks.append(_ns(choices=[], usage=usage))
+        return iter(chunks)
+
+class _OpenAI:
+    def __init__(self, *args, **kwargs):
+        self.chat = _ns(completions=_Completions(_OpenAI.calls))
+
+    def with_options(self, **_):
+        return self
+
+_OpenAI.calls = []
+
+# ---------- wiring ----------
+
+def _fake_modules(books: dict) -> dict:
+    """Fake gspread / google-auth / openai modules, by sys.modules name."""
+    def _client(*args, **kwargs):
+        return _SheetsClient(books)
+
+    gs = types.ModuleType("gspread")
+    gs.authorize = _client
+    gs.service_account = _client
+    gs.exceptions = types.ModuleType("gspread.exceptions")
+    gs.exceptions.APIError = _APIError
+    gs.exceptions.WorksheetNotFound = _WorksheetNotFound
+    gs.utils = types.ModuleType("gspread.utils")
+    gs.utils.rowcol_to_a1 = _rowcol_to_a1
+    gs.utils.a1_to_rowcol = _a1_to_rowcol
+
+    creds = types.SimpleNamespace(
+        from_service_account_info=lambda *a, **k: object(),
+        from_service_account_file=lambda *a, **k: object(),
+    )
+    sa = types.ModuleType("google.oauth2.service_account")
+    sa.Credentials = creds
+
+    oa = types.ModuleType("openai")
+    oa.OpenAI = _OpenAI
+    for exc in ("APIError", "APITimeoutError", "APIConnectionError", "RateLimitError"):
+        setattr(oa, exc, type(exc, (Exception,), {}))
+
+    return {
+        "gspread": gs,
+        "gspread.exceptions": gs.exceptions,
+        "gspread.utils": gs.utils,
+        "google.oauth2.service_account": sa,
+        "openai": oa,
+    }
+
+@pytest.fixture
+def fake_backends(monkeypatch, tmp_path):
+    """
+    Fresh app modules over the fake Sheets / OpenAI modules (the app reaches them through
+    utils.lazy_imports and utils.llm), with env pointed at them and files written under
+    tmp_path. Returns the in-memory spreadsheets by key.
+    """
+    for name in [m for m in sys.modules if m.split(".")[0] in ("utils", "components")]:
+        monkeypatch.delitem(sys.modules, name)   # module-level caches start empty
+    for key, value in {
+        "GCP_CREDS_B64": base64.b64encode(b"{}").decode("ascii"),
+        "JOBS_SHEET_ID": JOBS_SHEET_ID,
+        "BOOSTBRIDGE_ACCESS_SHEET_ID": ACCESS_SHEET_ID,
+        "OPENAI_API_KEY": "flow-budget",
+        "USERS_FETCH_MIN_S": "0",
+        "METRICS_DB_DIR": str(tmp_path),
+        "PROFILE_DB_DIR": str(tmp_path),
+    }.items():
+        monkeypatch.setenv(key, value)
+    monkeypatch.chdir(tmp_path)   # history/ and data/ files land in the temp dir
+    monkeypatch.setattr(_OpenAI, "calls", [])
+
+    from utils.auth import USERS_SHEET_ID
+    books = _seed_books(USERS_SHEET_ID)
+    for name, module in _fake_modules(books).items():
+        monkeypatch.setitem(sys.modules, name, module)
+    return books
+
+# ---------- the walk ----------
+
+def _button(at, label: str):
+    for b in at.button:
+        if b.label == label and not b.disabled:
+            return b
+    raise AssertionError(f"step {at.session_state['step']}: no enabled button {label!r}")
+
+def _run(at):
+    at.run(timeout=RUN_TIMEOUT_S)
+    if at.exception:
+        raise AssertionError(f"step {at.session_state['step']}: {at.exception[0].message}")
+    return at
+
+def _expect_step(at, step) -> None:
+    got = at.session_state["step"] if "step" in at.session_state else None
+    if got != step:
+        errors = "; ".join(e.value for e in at.error) or "no error shown"
+        raise AssertionError(f"expected step {step}, on step {got} ({errors})")
+
+def walk() -> dict:
+    """Step 1 -> 8 as a logged-in user with one account item; returns session_stats()."""
+    from streamlit.testing.v1 import AppTest
+    from utils import run_stats
+
+    at = AppTest.from_file(APP_FILE, default_timeout=RUN_TIMEOUT_S)
+    for name in ("STRIPE_LINK_INDIVIDUAL", "STRIPE_LINK_PRO", "STRIPE_PORTAL_LINK"):
+        at.secrets[name] = ""                  # app.py falls back to st.secrets for these
+    at.session_state["user"] = {
+        "email": TEST_EMAIL,
+        "plan": "pro",
+        "record": dict(zip(USERS_HEADERS, TEST_USER)),
+    }
+    _run(at)                                   # bootstrap -> Step 1
+    _expect_step(at, 1)
+
+    at.checkbox(key="s1_agree_cb").check()
+    _run(at)
+    at.button(key="s1_continue_btn").click()
+    _run(at)
+    _expect_step(at, 2)
+
+    at.multiselect[0].select(at.multiselect[0].options[0])
+    _button(at, "Next").click()
+    _run(at)
+    _run(at)                                   # Step 2 sets the step without st.rerun()
+    _expect_step(at, 3)
+
+    at.radio(key="selected_bureau_widget").set_value("Experian")
+    _button(at, "Next ➡️").click()
+    _run(at)
+    _expect_step(at, 4)
+
+    at.radio(key="dispute_type_select").set_value("Account (charge-offs, collections, etc.)")
+    _button(at, "Next ➡️").click()
+    _run(at)
+    _expect_step(at, 4.5)
+
+    at.text_input(key="f_ai_name").input("Capital One")
+    at.text_input(key="f_ai_last4").input("1234")
+    at.text_area(key="f_ai_issue").input("Reported as 120 days late but I was never late.")
+    _button(at, "➕ Add to Letter").click()
+    _run(at)
+    _button(at, "Save & Continue ➡️").click()
+    _run(at)
+    _expect_step(at, 5)
+
+    _button(at, "Next ➡️").click()
+    _run(at)
+    _expect_step(at, 6)
+
+    _button(at, "➡️ Next").click()
+    _run(at)
+    _run(at)                                   # Step 6 sets the step without st.rerun()
+    _expect_step(at, 7)
+
+    for key, value in (
+        ("user_full_name", "Flow Budget"), ("user_address", "1 Main St"),
+        ("user_city", "Springfield"), ("user_state", "IL"), ("user_zip_code", "62701"),
+        ("user_dob", "01/1990"), ("user_ssn_last4", "1234"),
+    ):
+        at.text_input(key=key).input(value)
+    _button(at, "➡️ Next").click()
+    _run(at)
+    _expect_step(at, 7.5)
+
+    at.checkbox[-1].check()                    # "I confirm the above information ..."
+    _run(at)
+    _button(at, "Generate Letter ➡️").click()
+    _run(at)
+    _expect_step(at, 8)
+
+    at.checkbox(key="s8_agree_cb").check()
+    _run(at)
+    at.button(key="s8_generate_btn").click()
+    _run(at)
+    if "s8_generated" not in at.session_state or not at.session_state["s8_generated"]:
+        errors = "; ".join(e.value for e in at.error + at.warning) or "nothing shown"
+        raise AssertionError(f"step 8: no letter generated ({errors})")
+
+    return run_stats.session_stats(at.session_state)
+
+# ---------- budget ----------
+
+def over_budget(stats: dict, budget: dict) -> list[str]:
+    """Every figure of the walk above its budget, as readable lines (empty = within budget)."""
+    over = []
+    for k in ("runs", "sheets", "llm"):
+        if stats[k] > budget.get(k, 0):
+            over.append(f"total {k}: {stats[k]} > {budget.get(k, 0)}")
+    for step, got in sorted(stats["by_step"].items()):
+        allowed = budget.get("by_step", {}).get(step, {})
+        for k, v in sorted(got.items()):
+            if v > allowed.get(k, 0):
+                over.append(f"step {step} {k}: {v} > {allowed.get(k, 0)}")
+    return over
+
+def report(stats: dict, budget: dict | None) -> str:
+    lines = [f"{'step':<8}{'runs':>6}{'sheets':>8}{'llm':>6}"]
+    for step, v in sorted(stats["by_step"].items(), key=lambda kv: (kv[0] == "landing", kv[0])):
+        b = (budget or {}).get("by_step", {}).get(step, {})
+        lines.append(f"{step:<8}{v['runs']:>6}{v['sheets']:>8}{v['llm']:>6}"
+                     + (f"   budget {b.get('runs', 0)}/{b.get('sheets', 0)}/{b.get('llm', 0)}" if budget else ""))
+    lines.append(f"{'total':<8}{stats['runs']:>6}{stats['sheets']:>8}{stats['llm']:>6}"
+                 + (f"   budget {budget['runs']}/{budget['sheets']}/{budget['llm']}" if budget else ""))
+    return "\n".join(lines)
+
+def _load_budget() -> dict | None:
+    try:
+        with open(BUDGET_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _write_budget(stats: dict) -> None:
+    budget = {
+        "updated": datetime.now().strftime("%Y-%m-%d"),
+        **{k: stats[k] for k in ("runs", "sheets", "llm")},
+        "by_step": stats["by_step"],
+        "transitions": stats["transitions"],
+    }
+    with open(BUDGET_FILE, "w", encoding="utf-8") as f:
+        json.dump(budget, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+def test_wizard_within_budget(fake_backends):
+    stats = walk()
+    if os.getenv("FLOW_BUDGET_UPDATE"):
+        _write_budget(stats)
+        pytest.skip(f"budget written to {os.path.relpath(BUDGET_FILE, ROOT)}")
+
+    budget = _load_budget()
+    assert budget is not None, "no budget yet; run with FLOW_BUDGET_UPDATE=1"
+    over = over_budget(stats, budget)
+    assert not over, "over budget:\n  " + "\n  ".join(over) + "\n" + report(stats, budget)
@@ -0,0 +1,81 @@
+# tests/test_issue_signals.py
+# issue_signals() against the flag logic build_prompt had inline before it was extracted.
+import itertools
+
+import pytest
+
+from utils.issue_signals import NO_SIGNALS, IssueSignals, issue_signals
+
+# ---------- the inline checks, as they were ----------
+
+MONTHLY_COLLECTION = ["every month", "each month", "monthly", "re-aging", "reaging", "re aged", "reaged"]
+MONTHLY_CHARGEOFF = [
+    "charge off every month", "monthly charge-off", "charged off each month",
+    "every month", "each month", "monthly", "re-aging", "reaging", "re aged", "reaged"
+]
+NO_NOTICE = ["no notice", "did not receive", "never received", "no letter", "no written notice"]
+
+def baseline(text: str) -> dict:
+    hay = (text or "").lower()
+    return {
+        "collection": "collection" in hay,
+        "monthly_collection": any(p in hay for p in MONTHLY_COLLECTION),
+        "monthly_chargeoff": any(p in hay for p in MONTHLY_CHARGEOFF),
+        "past_due_after_co": "past due" in hay and ("co" in hay or "charge-off" in hay or "charge off" in hay),
+        "no_notice": any(kw in hay for kw in NO_NOTICE),
+    }
+
+def assert_matches_baseline(text: str) -> None:
+    sig, base = issue_signals(text), baseline(text)
+    assert sig.collection == base["collection"], text
+    assert sig.monthly == base["monthly_collection"] == base["monthly_chargeoff"], text
+    assert sig.past_due_after_co == base["past_due_after_co"], text
+    assert sig.no_notice == base["no_notice"], text
+
+# ---------- cases ----------
+
+CASES = [
+    "",
+    " ",
+    "N/A",
+    "Paid in full",
+    "COLLECTION account",
+    "Sent to Collections",
+    "Reported MONTHLY as late",
+    "charge off every month",
+    "Monthly Charge-Off",
+    "charged off each month",
+    "Re-Aging of the debt",
+    "reaged / re aged",
+    "Past Due after charge off",
+    "PAST DUE balance after Charge-Off",
+    "past due",                                   # no charge-off wording
+    "past due on a Costco card",                  # bare "co" counts, as it always did
+    "past-due after charge off",                  # hyphen: not "past due"
+    "I never received a letter",
+    "No Written Notice was sent",
+    "did not receive anything; no letter",
+    "notice received",
+    "Collection agency re-aging it every month, past due after charge-off, no notice of reinsertion",
+    "collection\nmonthly\npast due CO",
+    "COLLECTIONS reported each month",
+]
+
+@pytest.mark.parametrize("text", CASES)
+def test_matches_inline_logic(text):
+    assert_matches_baseline(text)
+
+def test_phrase_combinations_match_inline_logic():
+    fragments = ["collection", "Monthly", "past due", "Charge-Off", "co", "never received",
+                 "re aged", "no letter", "paid", ""]
+    for a, b, c in itertools.product(fragments, repeat=3):
+        assert_matches_baseline(f"{a} {b}. {c}")
+        assert_matches_baseline(f"{a.upper()}{b}{c.title()}")
+
+def test_empty_text_has_no_signals():
+    assert issue_signals("") == NO_SIGNALS == IssueSignals()
+    assert issue_signals(None) == NO_SIGNALS
+
+def test_multi_signal_text_sets_every_flag():
+    sig = issue_signals("Collection re-aged EVERY MONTH; Past Due after Charge Off; never received notice")
+    assert sig == IssueSignals(collection=True, monthly=True, past_due_after_co=True, no_notice=True)
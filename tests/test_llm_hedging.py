@@ -0,0 +1,111 @@
+# tests/test_llm_hedging.py
+# Request hedging against a fake OpenAI-compatible server on localhost: the first request
+# stalls before its first token, the backup answers at once.
+import json, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+openai = pytest.importorskip("openai")
+
+from utils import llm, llm_router
+
+STALL_S = 5.0
+
+def _chunk(**fields) -> bytes:
+    body = {"id": "c", "object": "chat.completion.chunk", "created": 0, "model": "fake", "choices": [], **fields}
+    return b"data: " + json.dumps(body).encode() + b"\n\n"
+
+class _FakeLLM(BaseHTTPRequestHandler):
+    """The first request sends headers and then stalls; every later one streams at once."""
+    protocol_version = "HTTP/1.1"
+    requests = 0
+    lock = threading.Lock()
+    stalled_closed = threading.Event()   # the stalled request's client hung up
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.lock:
+            type(self).requests += 1
+            n = type(self).requests
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.flush()
+        if n == 1:
+            t0 = time.monotonic()
+            while time.monotonic() - t0 < STALL_S:
+                time.sleep(0.05)
+                try:
+                    self.wfile.write(b": keep-alive\n\n")
+                    self.wfile.flush()
+                except OSError:
+                    type(self).stalled_closed.set()
+                    return
+            text = "slow"
+        else:
+            text = "fast"
+        delta = {"index": 0, "delta": {"content": text}, "finish_reason": None}
+        self.wfile.write(_chunk(choices=[delta]))
+        self.wfile.write(_chunk(usage={"prompt_tokens": 3, "completion_tokens": 1, "total_tokens": 4}))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    _FakeLLM.requests = 0
+    _FakeLLM.stalled_closed = threading.Event()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeLLM)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = openai.OpenAI(api_key="test", base_url=f"http://127.0.0.1:{server.server_port}/v1")
+    monkeypatch.setitem(llm._CLIENT, "client", client)
+    monkeypatch.setattr(llm_router, "HEDGE_ENABLED", True)
+    monkeypatch.setattr(llm_router, "HEDGE_DEFAULT_S", 0.3)
+    monkeypatch.setattr(llm_router, "_HEDGES", llm_router.deque())
+    monkeypatch.setattr(llm_router, "_TTFT", {})
+    monkeypatch.setattr(llm_router, "_HEALTH", {})
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def _call():
+    return llm_router._call("fake", [{"role": "user", "content": "hi"}], 16, 10, 0.0)
+
+def test_backup_wins_and_closes_the_stalled_stream(fake_llm):
+    t0 = time.monotonic()
+    text, usage, ttft, wall, hedged = _call()
+    assert hedged is True
+    assert text == "fast"
+    assert usage["prompt_tokens"] == 3
+    assert time.monotonic() - t0 < STALL_S / 2
+    assert ttft >= llm_router.HEDGE_DEFAULT_S          # measured from the first request's start
+    assert _FakeLLM.stalled_closed.wait(2), "the losing stream was left open"
+    assert _FakeLLM.requests == 2
+    # the closed loser is not counted against the model's health
+    assert all(ok for _, _, ok in llm_router._HEALTH["fake"])
+
+def test_no_backup_once_the_hedge_budget_is_spent(fake_llm, monkeypatch):
+    monkeypatch.setattr(llm_router, "HEDGE_PER_MINUTE", 0)
+    monkeypatch.setattr(llm_router, "HEDGE_DEFAULT_S", 0.1)
+    text, _, _, wall, hedged = _call()
+    assert hedged is False
+    assert text == "slow"
+    assert wall >= STALL_S
+    assert _FakeLLM.requests == 1
+
+def test_primary_is_not_queued_behind_other_calls(fake_llm, monkeypatch):
+    # More concurrent calls than the old pool had workers: none may wait past its deadline.
+    monkeypatch.setattr(llm_router, "HEDGE_PER_MINUTE", 0)
+    _FakeLLM.requests = 1   # no request stalls
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(_call())) for _ in range(12)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    assert len(results) == 12
+    assert all(r[0] == "fast" and r[4] is False for r in results)
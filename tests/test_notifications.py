@@ -0,0 +1,289 @@
+# tests/test_notifications.py
+# Email delivery against local stand-ins: a SendGrid stub served by http.server
+# (through the SENDGRID_URL override) and an aiosmtpd server for the SMTP pool.
+import sys, json, time, socket, smtplib, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+requests = pytest.importorskip("requests")
+
+class SendGridStub:
+    """
+    A keep-alive HTTP/1.1 server that records every mail/send body and the client
+    port it came from. Personalizations addressed to "bad..." are rejected with a
+    SendGrid-style 400 naming their index; `status` forces every reply instead.
+    """
+
+    def __init__(self):
+        self.requests = []   # (client_port, body, Authorization header)
+        self.status = None
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stub.requests.append((self.client_address[1], body, self.headers.get("Authorization")))
+                self._reply(*stub.reply(body))
+
+            def _reply(self, code, payload):
+                raw = json.dumps(payload).encode() if payload is not None else b""
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v3/mail/send"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def reply(self, body):
+        if self.status:
+            return self.status, {"errors": [{"message": "stub says no"}]}
+        errors = [
+            {"field": f"personalizations.{n}.to.0.email", "message": "Invalid email"}
+            for n, p in enumerate(body["personalizations"])
+            if p["to"][0]["email"].startswith("bad")
+        ]
+        return (400, {"errors": errors}) if errors else (202, None)
+
+    def recipients(self, n):
+        return [p["to"][0]["email"] for p in self.requests[n][1]["personalizations"]]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def sendgrid(monkeypatch, tmp_path):
+    """Fresh utils.notifications / utils.dispatcher pointed at a SendGrid stub."""
+    stub = SendGridStub()
+    for name in [m for m in sys.modules if m.split(".")[0] == "utils"]:
+        monkeypatch.delitem(sys.modules, name)
+    monkeypatch.setenv("SENDGRID_API_KEY", "test-key")
+    monkeypatch.setenv("SENDGRID_URL", stub.url)
+    monkeypatch.setenv("DISPATCH_DB_DIR", str(tmp_path))
+    from utils import notifications
+    yield notifications, stub
+    if notifications._SG["session"] is not None:
+        notifications._SG["session"].close()
+    stub.close()
+
+def test_personalizations_are_chunked_over_one_keep_alive_session(sendgrid, monkeypatch):
+    n, stub = sendgrid
+    monkeypatch.setattr(n, "SENDGRID_MAX_PERSONALIZATIONS", 2)
+    people = [{"to": f"u{i}@example.com", "vars": {"bureau": "Equifax", "round": f"R{i}"}} for i in range(5)]
+    people.insert(2, {"to": "", "vars": {"bureau": "Equifax"}})   # no address: never sent
+
+    oks = n.send_sendgrid_batch("Your {round} letter", "<p>{bureau}</p>", people)
+    assert oks == [True, True, False, True, True, True]
+    assert [len(b["personalizations"]) for _, b, _ in stub.requests] == [2, 2, 1]
+    assert len({port for port, _, _ in stub.requests}) == 1   # one TCP connection, reused
+    assert {auth for _, _, auth in stub.requests} == {"Bearer test-key"}
+    first = stub.requests[0][1]
+    assert first["subject"] == "Your -round- letter"
+    assert first["personalizations"][1]["substitutions"] == {"-bureau-": "Equifax", "-round-": "R1"}
+
+def test_rejected_personalizations_are_dropped_and_the_rest_retried(sendgrid):
+    n, stub = sendgrid
+    people = [{"to": "a@example.com"}, {"to": "bad@example"}, {"to": "c@example.com"}]
+    assert n.send_sendgrid_batch("s", "h", people) == [True, False, True]
+    assert stub.recipients(0) == ["a@example.com", "bad@example", "c@example.com"]
+    assert stub.recipients(1) == ["a@example.com", "c@example.com"]
+
+def test_a_server_error_fails_the_chunk_without_a_retry(sendgrid):
+    n, stub = sendgrid
+    stub.status = 500
+    assert n.send_sendgrid_batch("s", "h", [{"to": "a@example.com"}, {"to": "b@example.com"}]) == [False, False]
+    assert len(stub.requests) == 1
+
+def test_deliver_email_batch_reports_each_recipient_and_retries_only_failures(sendgrid, monkeypatch):
+    _, stub = sendgrid
+    from utils import dispatcher
+    monkeypatch.setattr(dispatcher, "MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(dispatcher, "_backoff", lambda attempt: 0)
+    dispatcher._ensure_db()
+    rems = [
+        {"reminder_id": "r1", "email": "a@example.com", "topic": "", "payload": {"bureau": "Experian"}},
+        {"reminder_id": "r2", "email": "bad@example", "topic": "", "payload": {}},
+        {"reminder_id": "r3", "email": "c@example.com", "topic": "", "payload": {}},
+    ]
+
+    outcomes = {o["reminder_id"]: o for o in dispatcher.deliver_email_batch(rems)}
+    assert {rid: (o["sent_ok"], o["attempts"]) for rid, o in outcomes.items()} == {
+        "r1": (True, 1), "r2": (False, 2), "r3": (True, 1),
+    }
+    assert stub.recipients(2) == ["bad@example"]   # second attempt carries only the failure
+    assert stub.requests[0][1]["personalizations"][0]["substitutions"]["-bureau-"] == "Experian"
+    assert [dispatcher._claim(r["reminder_id"]) for r in rems] == ["sent", "failed", "sent"]
+
+# ---------- SMTP pool ----------
+
+class SmtpServer:
+    """
+    aiosmtpd handler that counts logins and NOOPs and records (peer, rcpt) per message.
+    RCPT "bad@..." is refused (550), a body containing "REJECT" gets 554 at DATA, and
+    `drop` closes that many connections at MAIL FROM. `noop_code` answers NOOP.
+    """
+
+    def __init__(self):
+        self.logins = 0
+        self.noops = 0
+        self.noop_code = 250
+        self.drop = 0
+        self.messages = []
+
+    def authenticate(self, server, session, envelope, mechanism, auth_data):
+        from aiosmtpd.smtp import AuthResult
+        self.logins += 1
+        return AuthResult(success=True)
+
+    async def handle_NOOP(self, server, session, envelope, arg):
+        self.noops += 1
+        return f"{self.noop_code} {'OK' if self.noop_code == 250 else 'closing'}"
+
+    async def handle_MAIL(self, server, session, envelope, address, mail_options):
+        if self.drop:
+            self.drop -= 1
+            server.transport.close()
+            return "421 dropped"
+        envelope.mail_from = address
+        return "250 OK"
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("bad@"):
+            return "550 no such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        if b"REJECT" in envelope.original_content:
+            return "554 rejected"
+        self.messages.append((session.peer, envelope.rcpt_tos[0]))
+        return "250 OK"
+
+@pytest.fixture
+def smtp(monkeypatch):
+    """Fresh utils.notifications configured for SMTP against a local aiosmtpd server."""
+    controller_mod = pytest.importorskip("aiosmtpd.controller")
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = SmtpServer()
+    controller = controller_mod.Controller(
+        server, hostname="127.0.0.1", port=port,
+        authenticator=server.authenticate, auth_require_tls=False,
+    )
+    controller.start()
+
+    for name in [m for m in sys.modules if m.split(".")[0] == "utils"]:
+        monkeypatch.delitem(sys.modules, name)
+    monkeypatch.delenv("SENDGRID_API_KEY", raising=False)
+    monkeypatch.setenv("SMTP_HOST", "127.0.0.1")
+    monkeypatch.setenv("SMTP_PORT", str(port))
+    monkeypatch.setenv("SMTP_USER", "bot")
+    monkeypatch.setenv("SMTP_PASS", "secret")
+    monkeypatch.setenv("SMTP_TLS", "false")
+    monkeypatch.setenv("SMTP_POOL_SIZE", "2")
+    from utils import notifications
+    yield notifications, server
+    if notifications._POOL["smtp"] is not None:
+        notifications._POOL["smtp"].close_all()
+    controller.stop()
+
+def _mime(n, to, body="<p>hi</p>"):
+    return n._build_mime(to, "Reminder", body)
+
+def test_a_checked_in_session_is_reused_without_logging_in_again(smtp):
+    n, server = smtp
+    pool = n._SmtpPool(size=2)
+    with pool.session() as sess:
+        sess.send("a@example.com", _mime(n, "a@example.com"))
+    assert pool._idle.qsize() == 1
+    with pool.session() as sess:
+        sess.send("b@example.com", _mime(n, "b@example.com"))
+        assert pool._idle.qsize() == 0   # checked out
+    assert server.logins == 1 and pool._idle.qsize() == 1
+    assert len({peer for peer, _ in server.messages}) == 1
+    pool.close_all()
+
+def test_a_session_is_rotated_after_max_messages(smtp, monkeypatch):
+    n, server = smtp
+    monkeypatch.setattr(n, "SMTP_MAX_PER_CONN", 2)
+    pool = n._SmtpPool(size=1)
+    with pool.session() as sess:
+        for i in range(5):
+            sess.send(f"u{i}@example.com", _mime(n, f"u{i}@example.com"))
+    assert len(server.messages) == 5 and server.logins == 3
+    assert len({peer for peer, _ in server.messages}) == 3
+    with pool.session() as sess:   # the checked-in session already sent 1 of 2; one more fits
+        sess.send("v@example.com", _mime(n, "v@example.com"))
+    assert server.logins == 3
+    pool.close_all()
+
+def test_an_idle_session_gets_a_noop_and_is_replaced_if_it_fails(smtp, monkeypatch):
+    n, server = smtp
+    monkeypatch.setattr(n, "SMTP_IDLE_NOOP_S", 0.01)
+    pool = n._SmtpPool(size=1)
+    with pool.session() as sess:
+        sess.send("a@example.com", _mime(n, "a@example.com"))
+    time.sleep(0.05)
+    with pool.session() as sess:
+        sess.send("b@example.com", _mime(n, "b@example.com"))
+    assert server.noops == 1 and server.logins == 1   # healthy: reused
+
+    server.noop_code = 421
+    time.sleep(0.05)
+    with pool.session() as sess:
+        sess.send("c@example.com", _mime(n, "c@example.com"))
+    assert server.noops == 2 and server.logins == 2   # unhealthy: replaced
+    pool.close_all()
+
+def test_a_dropped_session_reconnects_once_and_resends(smtp):
+    n, server = smtp
+    pool = n._SmtpPool(size=1)
+    with pool.session() as sess:
+        sess.send("a@example.com", _mime(n, "a@example.com"))
+        server.drop = 1   # the server goes away mid-session
+        sess.send("b@example.com", _mime(n, "b@example.com"))
+    assert [rcpt for _, rcpt in server.messages] == ["a@example.com", "b@example.com"]
+    assert server.logins == 2
+    assert server.messages[0][0] != server.messages[1][0]
+
+    server.drop = 2   # dropped again on the resend: give up
+    with pytest.raises(smtplib.SMTPServerDisconnected):
+        with pool.session() as sess:
+            sess.send("c@example.com", _mime(n, "c@example.com"))
+    assert [rcpt for _, rcpt in server.messages][-1] == "b@example.com"
+    pool.close_all()
+
+def test_a_rejected_message_keeps_the_session_in_the_pool(smtp):
+    n, server = smtp
+    pool = n._SmtpPool(size=1)
+    with pytest.raises(smtplib.SMTPResponseException):
+        with pool.session() as sess:
+            sess.send("a@example.com", _mime(n, "a@example.com", body="REJECT me"))
+    assert pool._idle.qsize() == 1   # checked in, not closed
+    with pool.session() as sess:
+        sess.send("b@example.com", _mime(n, "b@example.com"))
+    assert server.logins == 1
+    pool.close_all()
+
+def test_send_emails_over_the_pool_reports_each_message(smtp):
+    n, server = smtp
+    batch = [{"to": f"u{i}@example.com", "subject": "s", "html": "<p>h</p>"} for i in range(6)]
+    batch[2]["to"] = "bad@example.com"
+    batch[4]["html"] = "<p>REJECT</p>"
+    batch.append({"to": "", "subject": "s", "html": "h"})
+
+    assert n.send_emails(batch) == [True, True, False, True, False, True, False]
+    assert sorted(rcpt for _, rcpt in server.messages) == ["u0@example.com", "u1@example.com",
+                                                           "u3@example.com", "u5@example.com"]
+    assert server.logins == 2   # SMTP_POOL_SIZE sessions, each sending several messages
@@ -0,0 +1,89 @@
+# tests/test_prompt_builder.py
+# batch_build_prompts against build_prompt, and the token budget over representative intakes.
+import pytest
+
+from utils import token_budget
+from utils.prompt_builder import batch_build_prompts, build_prompt, normalize_round
+from utils.token_budget import TRIM_STEPS, estimate_tokens, prompt_budget, shorten
+
+USER = {"full_name": "Ada Lovelace", "address": "1 Main St", "dob": "1990-01-01", "last4": "1234"}
+
+LONG = (
+    "I paid this account in full in 2019 and have the bank statements to prove it. "
+    "The furnisher keeps reporting it as past due after the charge-off, and it is re-aged every month. "
+) * 25
+DOCS = "Bank statements from 2019 showing the final payment; the payoff letter; certified mail receipts. " * 15
+
+def account(name, last4, issue="Reported 30 days late; I was never late.", docs=""):
+    return {"name": name, "last4": last4, "issue": issue, "docs": docs, "dofd_ym": "2019-04", "event_ym": ""}
+
+SHORT_INTAKES = [
+    dict(dispute_details={"personal_info": {"wrong": "Ada Lovelase", "correct": "Ada Lovelace"}},
+         dispute_types=["personal_info"], bureau="Equifax", round_num="Personal Info", law_selection=[]),
+    dict(dispute_details={"account_items": [account("Capital One", "1234"), account("Chase", "9876")]},
+         dispute_types=["account"], bureau="Experian", round_num=1, law_selection=[]),
+    dict(dispute_details={"collection": {"name": "Midland", "last4": "5555",
+                                         "issue": "Collection re-aged every month."}},
+         dispute_types=["collection"], bureau="TransUnion", round_num="2", law_selection=[], strategy="mov"),
+    dict(dispute_details={"inquiry": {"name": "Acme Auto", "reason": "I never applied."},
+                          "reinserted": {"details": "Deleted in May, back in June; I never received notice."}},
+         dispute_types=["inquiry", "reinserted"], bureau="Experian", round_num="Round 3",
+         law_selection=["FCRA §604"], strategy="factual"),
+]
+
+LONG_INTAKES = [
+    dict(dispute_details={"account_items": [account(f"Bank {i}", f"{i}{i}{i}{i}", LONG, DOCS) for i in range(5)]},
+         dispute_types=["account"], bureau="Experian", round_num=2, law_selection=[], strategy="mov"),
+    dict(dispute_details={"account_items": [account("Capital One", "1234", LONG, DOCS)],
+                          "duplicate": {"name": "Capital One", "details": LONG},
+                          "repo": {"type": "voluntary", "issue": LONG}},
+         dispute_types=["account", "duplicate", "repo"], bureau="Equifax", round_num=3,
+         law_selection=[], strategy="factual"),
+    dict(dispute_details={"mixed_file": {"issue": LONG}, "other": {"details": DOCS}},
+         dispute_types=["mixed_file", "other"], bureau="TransUnion", round_num=1, law_selection=[]),
+]
+
+def _build(intake) -> str:
+    return build_prompt(user_info=USER, **intake)
+
+def _untrimmed(intake, monkeypatch) -> dict:
+    with monkeypatch.context() as m:
+        m.setattr(token_budget, "PROMPT_BUDGET_SCALE", 1000.0)
+        return batch_build_prompts([dict(intake, user_info=USER)])[0]
+
+def test_batch_matches_build_prompt_one_by_one():
+    intakes = SHORT_INTAKES + LONG_INTAKES
+    built = batch_build_prompts([dict(i, user_info=USER) for i in intakes])
+    assert len(built) == len(intakes)
+    for intake, b in zip(intakes, built):
+        assert "error" not in b, b
+        assert b["prompt"] == _build(intake)
+        assert (b["mode"], b["strategy"]) == normalize_round(intake["round_num"], intake.get("strategy"))
+
+def test_a_bad_intake_gets_an_error_and_the_rest_still_build():
+    intakes = [dict(SHORT_INTAKES[1], user_info=USER), {"dispute_details": "not a dict", "round_num": 1},
+               dict(SHORT_INTAKES[0], user_info=USER)]
+    built = batch_build_prompts(intakes)
+    assert "error" in built[1]
+    assert built[0]["prompt"] == _build(SHORT_INTAKES[1]) and built[2]["prompt"] == _build(SHORT_INTAKES[0])
+
+@pytest.mark.parametrize("intake", SHORT_INTAKES, ids=lambda i: str(i["round_num"]))
+def test_a_prompt_that_fits_is_not_trimmed(intake, monkeypatch):
+    prompt = _build(intake)
+    assert prompt == _untrimmed(intake, monkeypatch)["prompt"]
+    mode, s = normalize_round(intake["round_num"], intake.get("strategy"))
+    assert estimate_tokens(prompt) <= prompt_budget(mode, s)
+
+@pytest.mark.parametrize("intake", LONG_INTAKES, ids=lambda i: "+".join(i["dispute_types"]))
+def test_a_long_prompt_is_trimmed_into_its_budget(intake, monkeypatch):
+    untrimmed = _untrimmed(intake, monkeypatch)
+    (b,) = batch_build_prompts([dict(intake, user_info=USER)])
+    budget = prompt_budget(b["mode"], b["strategy"])
+    assert untrimmed["est_tokens"] > budget
+    assert b["est_tokens"] <= budget
+    assert b["flags"] == untrimmed["flags"]   # guidance comes from the full text
+    # free text is cut at one of the TRIM_STEPS; names and last4s are never cut
+    assert LONG.strip() not in b["prompt"]
+    assert any(shorten(LONG, cap) in b["prompt"] for cap in TRIM_STEPS)
+    for it in intake["dispute_details"].get("account_items", []):
+        assert it["name"] in b["prompt"] and it["last4"] in b["prompt"]
@@ -0,0 +1,54 @@
+# tests/test_run_stats.py
+# Request counts are charged to the session that made them, including work it handed to
+# pool threads.
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils import run_stats
+
+@pytest.fixture
+def as_session(monkeypatch):
+    monkeypatch.setattr(run_stats, "_TOTALS", run_stats.OrderedDict())
+
+    def bind(sid):
+        run_stats._BOUND.session = sid
+    yield bind
+    run_stats._BOUND.session = None
+
+def test_pool_work_counts_for_the_submitting_session(as_session):
+    as_session("a")
+    work_a = run_stats.in_session(lambda: run_stats.count("llm"))
+    as_session("b")
+    run_stats.count("sheets", 2)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        pool.submit(work_a).result()
+        pool.submit(run_stats.count, "llm").result()   # not bound: no session
+    assert run_stats.totals("a") == {"sheets": 0, "llm": 1}
+    assert run_stats.totals("b") == {"sheets": 2, "llm": 0}
+    assert run_stats.totals("") == {"sheets": 0, "llm": 1}
+
+def test_concurrent_sessions_are_charged_separately(as_session):
+    states = {"a": {}, "b": {}}
+
+    def session(sid, n):
+        as_session(sid)
+        run_stats.begin_run(states[sid], 1)
+        for _ in range(n):
+            run_stats.count("sheets")
+        run_stats.begin_run(states[sid], 2)
+        run_stats.count("llm")
+
+    threads = [threading.Thread(target=session, args=(sid, n)) for sid, n in (("a", 3), ("b", 5))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    as_session("")   # read from outside either session
+    a, b = run_stats.session_stats(states["a"]), run_stats.session_stats(states["b"])
+    assert (a["runs"], a["sheets"], a["llm"]) == (2, 3, 1)
+    assert (b["runs"], b["sheets"], b["llm"]) == (2, 5, 1)
+    assert a["by_step"]["1"]["sheets"] == 3 and a["by_step"]["2"]["llm"] == 1
+    assert a["transitions"] == {"1->2": 1}
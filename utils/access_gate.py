@@ -4,9 +4,8 @@ from typing import Tuple, Optional, Dict
 from datetime import datetime, date
 
 import streamlit as st
-import gspread
-from google.oauth2.service_account import Credentials
-from gspread.exceptions import WorksheetNotFound, APIError
+from utils.lazy_imports import gspread, service_account_credentials, api_error, worksheet_not_found, rowcol_to_a1
+from utils.run_stats import counting_sheets
 
 # Worksheets in the BoostBridgeDIY Access spreadsheet
 USERS_SHEET   = "UsersAccess"
@@ -36,28 +35,28 @@ def _gc_from_env():
     b64 = os.getenv("GCP_CREDS_B64")
     if b64:
         info = json.loads(base64.b64decode(b64).decode("utf-8"))
-        creds = Credentials.from_service_account_info(info, scopes=SHEETS_SCOPE)
-        return gspread.authorize(creds)
+        creds = service_account_credentials().from_service_account_info(info, scopes=SHEETS_SCOPE)
+        return counting_sheets(gspread().authorize(creds))
 
     # 2) Streamlit secrets (recommended on Cloud)
     try:
         if hasattr(st, "secrets") and "gcp_service_account" in st.secrets:
             info = dict(st.secrets["gcp_service_account"])
-            creds = Credentials.from_service_account_info(info, scopes=SHEETS_SCOPE)
-            return gspread.authorize(creds)
+            creds = service_account_credentials().from_service_account_info(info, scopes=SHEETS_SCOPE)
+            return counting_sheets(gspread().authorize(creds))
     except Exception:
         pass
 
     # 3) GOOGLE_APPLICATION_CREDENTIALS file path
     gac = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
     if gac and os.path.exists(gac):
-        creds = Credentials.from_service_account_file(gac, scopes=SHEETS_SCOPE)
-        return gspread.authorize(creds)
+        creds = service_account_credentials().from_service_account_file(gac, scopes=SHEETS_SCOPE)
+        return counting_sheets(gspread().authorize(creds))
 
     # 4) local file in repo (if you ever added it)
     if os.path.exists("service_account.json"):
-        creds = Credentials.from_service_account_file("service_account.json", scopes=SHEETS_SCOPE)
-        return gspread.authorize(creds)
+        creds = service_account_credentials().from_service_account_file("service_account.json", scopes=SHEETS_SCOPE)
+        return counting_sheets(gspread().authorize(creds))
 
     raise RuntimeError(
         "Google credentials not found. Provide gcp_service_account in secrets, "
@@ -80,7 +79,7 @@ def _open_sheet(gc, wks_name: str):
 
     try:
         return sh.worksheet(wks_name)
-    except WorksheetNotFound:
+    except worksheet_not_found():
         # Create with appropriate size + headers
         try:
             if wks_name == USERS_SHEET:
@@ -114,7 +113,7 @@ def _open_sheet(gc, wks_name: str):
                 # Generic sheet create if ever called with a different name
                 ws = sh.add_worksheet(title=wks_name, rows=1000, cols=10)
                 return ws
-        except APIError as e:
+        except api_error() as e:
             # If another process created it milliseconds earlier, just open it
             if "already exists" in str(e).lower():
                 return sh.worksheet(wks_name)
@@ -222,7 +221,7 @@ def _find_user_row(ws, email: str) -> Optional[int]:
 def _write_user(ws, user: Dict, headers: list, row_idx: int):
     row_values = [user.get(h, "") for h in headers]
     ws.update(
-        f"A{row_idx}:{gspread.utils.rowcol_to_a1(row_idx, len(headers))}",
+        f"A{row_idx}:{rowcol_to_a1(row_idx, len(headers))}",
         [row_values],
         value_input_option="USER_ENTERED"
     )
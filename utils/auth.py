@@ -1,18 +1,16 @@
 # utils/auth.py
 # Quota-friendly auth with cached worksheet, single read per minute, and 429 guards.
 
-import os, json, base64, time
+import os, json, base64, time, threading
 from datetime import datetime, date
 from pathlib import Path
 from typing import Dict, Tuple, Optional, List
 
 import streamlit as st
-import gspread
-from google.oauth2.service_account import Credentials
 import time
-from gspread.exceptions import APIError
-import bcrypt
-from gspread.utils import rowcol_to_a1
+from utils.lazy_imports import gspread, service_account_credentials, api_error, rowcol_to_a1, bcrypt
+from utils.run_stats import counting_sheets
+from utils import background_retry
 
 # ====== CONFIG ======
 USERS_SHEET_ID = "18JDLhCFyMWFTM4JKS3OvvLuJz0Ltkr11D3Y286xOKaQ"
@@ -43,7 +41,7 @@ def _with_backoff(fn, *args, **kwargs):
     for _ in range(6):  # ~0.5 + 1 + 2 + 4 + 8 + 8s
         try:
             return fn(*args, **kwargs)
-        except APIError as e:
+        except api_error() as e:
             msg = str(e).lower()
             status = getattr(getattr(e, "response", None), "status_code", None)
             if status == 429 or "429" in msg or "quota" in msg:
@@ -59,25 +57,25 @@ def _get_google_client():
     b64 = os.getenv("GCP_CREDS_B64")
     if b64:
         info = json.loads(base64.b64decode(b64).decode("utf-8"))
-        creds = Credentials.from_service_account_info(info, scopes=SHEETS_SCOPE)
-        return gspread.authorize(creds)
+        creds = service_account_credentials().from_service_account_info(info, scopes=SHEETS_SCOPE)
+        return counting_sheets(gspread().authorize(creds))
 
     if hasattr(st, "secrets") and "gcp_service_account" in st.secrets:
-        creds = Credentials.from_service_account_info(
+        creds = service_account_credentials().from_service_account_info(
             st.secrets["gcp_service_account"], scopes=SHEETS_SCOPE
         )
-        return gspread.authorize(creds)
+        return counting_sheets(gspread().authorize(creds))
 
     gac = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
     if gac and os.path.exists(gac):
-        creds = Credentials.from_service_account_file(gac, scopes=SHEETS_SCOPE)
-        return gspread.authorize(creds)
+        creds = service_account_credentials().from_service_account_file(gac, scopes=SHEETS_SCOPE)
+        return counting_sheets(gspread().authorize(creds))
 
     proj = Path(__file__).resolve().parents[1]
     p = proj / os.getenv("GOOGLE_CREDS_PATH", "google_creds.json")
     if p.exists():
-        creds = Credentials.from_service_account_file(str(p), scopes=SHEETS_SCOPE)
-        return gspread.authorize(creds)
+        creds = service_account_credentials().from_service_account_file(str(p), scopes=SHEETS_SCOPE)
+        return counting_sheets(gspread().authorize(creds))
 
     raise RuntimeError("Google credentials not found for Users sheet.")
 
@@ -96,12 +94,13 @@ def _get_users_sheet():
 # ====== PASSWORDS ======
 def hash_password(password: str) -> str:
     salted = (password + PEPPER).encode("utf-8")
-    return bcrypt.hashpw(salted, bcrypt.gensalt()).decode("utf-8")
+    bc = bcrypt()
+    return bc.hashpw(salted, bc.gensalt()).decode("utf-8")
 
 def check_password(password: str, hashed: str) -> bool:
     salted = (password + PEPPER).encode("utf-8")
     try:
-        return bcrypt.checkpw(salted, hashed.encode("utf-8"))
+        return bcrypt().checkpw(salted, hashed.encode("utf-8"))
     except Exception:
         return False
 # ====== PASSWORD RESET (OTP) ======
@@ -228,7 +227,9 @@ def _cached_all_users() -> tuple[list[str], list[list[str]]]:
     ws = _get_users_sheet()
 
     # --- Cross-process anti-stampede throttle ---
-    # You can tune via env: USERS_FETCH_MIN_S (default 2.5s)
+    # You can tune via env: USERS_FETCH_MIN_S (default 2.5s). Inside the window this fails
+    # like a 429 (nothing is cached): callers serve the last good table and the read is
+    # retried in the background, so no script thread waits here.
     min_interval = float(os.getenv("USERS_FETCH_MIN_S", "2.5"))
     gate_file = Path(os.getenv("TMPDIR", "/tmp")) / "bb_users_last_fetch.txt"
     now = time.time()
@@ -238,10 +239,11 @@ def _cached_all_users() -> tuple[list[str], list[list[str]]]:
         last = 0.0
     wait = (last + min_interval) - now
     if wait > 0:
-        time.sleep(wait)
+        raise background_retry.quota_error(f"Users sheet read by another process; next read in {wait:.1f}s")
 
-    # Single read
-    values = _with_backoff(ws.get, "A1:Z10000")
+    # Single read, single attempt: on 429 the caller serves the last good table and the
+    # read is retried in the background (see _users_table), not in the script thread.
+    values = ws.get("A1:Z10000")
 
     # Stamp the last fetch time (best-effort)
     try:
@@ -255,9 +257,29 @@ def _cached_all_users() -> tuple[list[str], list[list[str]]]:
     rows = values[1:]
     return headers, rows
 
+USERS_TABLE_KEY = "users_table"
+
+def _users_table(fresh: bool = False) -> tuple[list[str], list[list[str]]]:
+    """
+    _cached_all_users(), or the last good table while the Users sheet is over quota.
+    With fresh (login, sign-up), never the last good table: a quota error is raised once
+    the read is scheduled in the background, so the caller can wait for it.
+    """
+    if not fresh:
+        table, _ = background_retry.fresh_or_stale(USERS_TABLE_KEY, _cached_all_users)
+        return table
+    try:
+        table = _cached_all_users()
+    except Exception as e:
+        if background_retry.is_quota_error(e):
+            background_retry.schedule(USERS_TABLE_KEY, _cached_all_users)
+        raise
+    background_retry.remember(USERS_TABLE_KEY, table)
+    return table
+
 
 def _rows_as_dicts_cached() -> List[Dict]:
-    headers, rows = _cached_all_users()
+    headers, rows = _users_table()
     out = []
     for r in rows:
         d = {headers[i]: (r[i] if i < len(r) else "") for i in range(len(headers))}
@@ -266,6 +288,7 @@ def _rows_as_dicts_cached() -> List[Dict]:
 
 def _clear_user_cache():
     _cached_all_users.clear()
+    background_retry.forget(USERS_TABLE_KEY)   # don't serve the pre-write table on a 429
 
 # ====== HELPERS ======
 def _find_row_index_by_email(headers: list[str], rows: list[list[str]], email: str) -> Optional[int]:
@@ -282,13 +305,14 @@ def _find_row_index_by_email(headers: list[str], rows: list[list[str]], email: s
     return None
 
 # ====== USER OPS (quota-safe) ======
-def find_user(email: str):
+def find_user(email: str, fresh: bool = False):
+    """The user's row as a dict, or None. fresh: see _users_table."""
     if not email:
         return None
     email_l = email.strip().lower()
     try:
-        headers, raw_rows = _cached_all_users()  # 0 reads if cache warm
-    except APIError as e:
+        headers, raw_rows = _users_table(fresh)  # 0 reads if cache warm; last good table on 429 unless fresh
+    except api_error() as e:
         raise  # Let caller handle 429 gracefully
     if not headers:
         return None
@@ -297,12 +321,16 @@ def find_user(email: str):
         return None
     row_vals = raw_rows[idx - 2]  # zero-based
     d = {headers[i]: (row_vals[i] if i < len(row_vals) else "") for i in range(len(headers))}
+    with _COUNTS_LOCK:
+        unwritten = _COUNTS.get(email_l)
+    if unwritten:  # record_generation's counts win over a sheet row that predates them
+        d.update(zip(COUNT_FIELDS, map(str, unwritten)))
     return d
 
 def create_user(email: str, password: str, plan="individual"):
     if not email or not password:
         return False, "Email and password are required."
-    if find_user(email):
+    if find_user(email, fresh=True):  # a stale table could miss a just-created account
         return False, "Email already registered."
 
     ws = _get_users_sheet()
@@ -315,7 +343,11 @@ def create_user(email: str, password: str, plan="individual"):
     return True, "Account created."
 
 def update_user_counts(email: str, daily_count, daily_date, month_count, month_yyyymm):
-    headers, rows = _cached_all_users()
+    """
+    Rewrite the user's row with these counts. One attempt per call: record_generation
+    runs it on the background_retry pool, which retries quota errors.
+    """
+    headers, rows = _cached_all_users()  # rewrites the whole row: never from a stale table
     if not headers:
         return
     row_idx = _find_row_index_by_email(headers, rows, email)
@@ -330,9 +362,34 @@ def update_user_counts(email: str, daily_count, daily_date, month_count, month_y
 
     ws = _get_users_sheet()
     end_a1 = rowcol_to_a1(row_idx, len(headers))
-    _with_backoff(ws.update, f"A{row_idx}:{end_a1}", [values], value_input_option="USER_ENTERED")
+    ws.update(f"A{row_idx}:{end_a1}", [values], value_input_option="USER_ENTERED")
     _clear_user_cache()
 
+# Counts record_generation has taken but not yet written: {email: (daily_count, daily_date,
+# month_count, month_yyyymm)}. An entry is dropped once the Users sheet has it.
+COUNT_FIELDS = ("daily_count", "daily_date", "month_count", "month_yyyymm")
+_COUNTS: Dict[str, tuple] = {}
+_COUNTS_LOCK = threading.Lock()
+
+def _write_user_counts(email: str) -> None:
+    """Write email's latest unwritten counts (background_retry pool)."""
+    with _COUNTS_LOCK:
+        counts = _COUNTS.get(email)
+    if counts is None:
+        return
+    update_user_counts(email, *counts)
+    with _COUNTS_LOCK:
+        if _COUNTS.get(email) == counts:
+            del _COUNTS[email]
+
+def _schedule_user_counts(email: str) -> None:
+    fut = background_retry.schedule(f"user_counts:{email}", _write_user_counts, email)
+    # counts taken while a write was already running go out in a follow-up write; after a
+    # failed write they wait for the next record_generation
+    fut.add_done_callback(
+        lambda f: f.exception() is None and email in _COUNTS and _schedule_user_counts(email)
+    )
+
 def refresh_cached_user():
     """Refresh st.session_state.user['record'] from the cached sheet."""
     u = st.session_state.get("user")
@@ -351,7 +408,7 @@ def admin_reset_password(email: str, new_password: str) -> tuple[bool, str]:
     if not user:
         return False, "User not found."
 
-    headers, rows = _cached_all_users()
+    headers, rows = _with_backoff(_cached_all_users)  # rewrites the whole row: never from a stale table
     if not headers:
         return False, "Users sheet unavailable."
 
@@ -394,14 +451,21 @@ def can_generate_letter(user_record: dict):
     return (daily_count < limits["daily"]) and (month_count < limits["monthly"])
 
 
-def record_generation(user_record: dict):
+def record_generation(user_record: dict, n: int = 1):
+    """
+    Count n generations on user_record now; the Users sheet row is written in the
+    background (utils.background_retry), so a slow or over-quota sheet never holds
+    the script thread. find_user serves these counts until the write lands.
+    """
     daily_count, daily_date, month_count, month_yyyymm = _rollover_counts(user_record)
-    daily_count += 1
-    month_count += 1
-    email = user_record["email"]
-    update_user_counts(email, daily_count, daily_date, month_count, month_yyyymm)
-    user_record["daily_count"] = str(daily_count)
-    user_record["month_count"] = str(month_count)
+    daily_count += n
+    month_count += n
+    email = (user_record["email"] or "").strip().lower()
+    counts = (daily_count, daily_date, month_count, month_yyyymm)
+    user_record.update(zip(COUNT_FIELDS, map(str, counts)))
+    with _COUNTS_LOCK:
+        _COUNTS[email] = counts
+    _schedule_user_counts(email)
 
 def remaining_quota(user_record: dict):
     plan = (user_record.get("plan") or "individual").lower()
@@ -415,26 +479,35 @@ def remaining_quota(user_record: dict):
     }
 
 # ====== UI ======
+@st.fragment
+def _account_panel():
+    """
+    Logged-in account box, drawn as a fragment. Refresh and Logout rerun the whole app:
+    the wizard step reads the refreshed quota and plan too.
+    """
+    u = st.session_state.get("user") or {}
+    st.success(f"{u.get('email', '')} • plan: {u.get('plan','individual')}")
+    rec = u.get("record") or {}
+    if rec:
+        q = remaining_quota(rec)
+        st.caption(f"Daily: {q['daily_left']}/{q['daily_limit']} • Monthly: {q['monthly_left']}/{q['monthly_limit']}")
+    cols = st.columns(2)
+    with cols[0]:
+        if st.button("Refresh", key="auth_refresh"):
+            refresh_cached_user()
+            st.rerun(scope="app")
+    with cols[1]:
+        if st.button("Logout", key="auth_logout"):
+            st.session_state.pop("user", None)
+            st.rerun(scope="app")
+
 def auth_ui():
     st.sidebar.subheader("🔐 Account")
 
     # Already logged in?
     if st.session_state.get("user"):
-        u = st.session_state["user"]
-        st.sidebar.success(f"{u['email']} • plan: {u.get('plan','individual')}")
-        rec = u.get("record") or {}
-        if rec:
-            q = remaining_quota(rec)
-            st.sidebar.caption(f"Daily: {q['daily_left']}/{q['daily_limit']} • Monthly: {q['monthly_left']}/{q['monthly_limit']}")
-        cols = st.sidebar.columns(2)
-        with cols[0]:
-            if st.button("Refresh", key="auth_refresh"):
-                refresh_cached_user()
-                st.rerun()
-        with cols[1]:
-            if st.button("Logout", key="auth_logout"):
-                st.session_state.pop("user", None)
-                st.rerun()
+        with st.sidebar:
+            _account_panel()
         return True
 
     # -----------------------------------------
@@ -450,7 +523,7 @@ def auth_ui():
             if c1.button("Send code", key="fp_send"):
                 try:
                     ok = request_password_reset((email or "").strip())
-                except APIError:
+                except api_error():
                     st.info("Syncing… try again in a moment.")
                     ok = False
                 if ok:
@@ -473,7 +546,7 @@ def auth_ui():
                 email = (st.session_state.get("_fp_email") or "").strip()
                 try:
                     ok, msg = verify_reset_code_and_update_password(email, (code or "").strip(), (new_pw or ""))
-                except APIError:
+                except api_error():
                     ok, msg = False, "We’re syncing with Google. Please try again."
                 if ok:
                     st.success("Password updated. You can log in now.")
@@ -512,7 +585,14 @@ def auth_ui():
         if "_auth_retry" not in st.session_state:
             st.session_state["_auth_retry"] = 0
 
-        if login_click:
+        # A login that hit Sheets quota runs again by itself once the background Users read
+        # lands (the form keeps the typed email/password); nothing sleeps in this thread.
+        login_retry = (st.session_state.get("_auth_login_waiting")
+                       and not background_retry.pending(USERS_TABLE_KEY))
+        if login_retry:
+            st.session_state["_auth_login_waiting"] = False
+
+        if login_click or login_retry:
             # in-flight guard
             if st.session_state.get("_auth_login_inflight"):
                 st.info("Signing you in…")
@@ -520,15 +600,16 @@ def auth_ui():
             st.session_state["_auth_login_inflight"] = True
 
             try:
-                user = find_user(li_email)  # single cached read
-            except APIError:
+                user = find_user(li_email, fresh=True)  # single cached read; waits out a 429, never stale
+            except api_error():
                 attempt = st.session_state["_auth_retry"]
-                if attempt < 3:
+                if attempt < 3 and background_retry.pending(USERS_TABLE_KEY):
                     st.info("Syncing your account… one sec.")
                     st.session_state["_auth_retry"] += 1
-                    time.sleep(1.2 * (attempt + 1))  # 1.2s, 2.4s, 3.6s
                     st.session_state["_auth_login_inflight"] = False
-                    st.rerun()
+                    st.session_state["_auth_login_waiting"] = True
+                    background_retry.rerun_when_ready(USERS_TABLE_KEY)
+                    st.stop()
                 else:
                     st.session_state["_auth_retry"] = 0
                     st.session_state["_auth_login_inflight"] = False
@@ -574,24 +655,38 @@ def auth_ui():
             su_pw2 = st.text_input("Confirm Password", type="password", key="auth_signup_pw2")
             signup_click = st.form_submit_button("Create Account", use_container_width=True)
 
-        if signup_click:
-            if su_pw != su_pw2 or len(su_pw) < 8:
+        # A sign-up that hit Sheets quota is finished in the background; this picks up its
+        # result on the rerun that follows.
+        signup_task = None
+        signup_key = st.session_state.get("_signup_waiting")
+        if signup_key:
+            signup_task = background_retry.take(signup_key)
+            if signup_task is None:
+                st.info("Creating your account… one sec.")
+                background_retry.rerun_when_ready(signup_key)
+            else:
+                st.session_state["_signup_waiting"] = None
+
+        if signup_click or signup_task is not None:
+            if signup_click and (su_pw != su_pw2 or len(su_pw) < 8):
                 st.error("Passwords must match and be at least 8 chars.")
                 st.stop()
 
             try:
-                ok, msg = create_user(su_email, su_pw, plan="individual")
-            except APIError:
-                # brief retry like login
-                if st.session_state.get("_signup_retry", 0) < 3:
+                if signup_task is not None:
+                    ok, msg = signup_task.result()
+                else:
+                    ok, msg = create_user(su_email, su_pw, plan="individual")
+            except api_error():
+                if signup_task is None:
+                    key = f"signup:{(su_email or '').strip().lower()}"
+                    background_retry.schedule(key, create_user, su_email, su_pw, plan="individual")
+                    st.session_state["_signup_waiting"] = key
                     st.info("Creating your account… one sec.")
-                    st.session_state["_signup_retry"] = st.session_state.get("_signup_retry", 0) + 1
-                    time.sleep(1.2 * st.session_state["_signup_retry"])
-                    st.rerun()
+                    background_retry.rerun_when_ready(key)
                 else:
-                    st.session_state["_signup_retry"] = 0
                     st.error("We’re syncing with Google. Please try again in a few seconds.")
-                    st.stop()
+                st.stop()
 
             if ok:
                 # Build a minimal local record to avoid another read right now.
@@ -610,7 +705,6 @@ def auth_ui():
                     "plan": new_record["plan"],
                     "record": new_record,
                 }
-                st.session_state["_signup_retry"] = 0
 
                 # pre-warm caches (best-effort)
                 try:
@@ -0,0 +1,193 @@
+# utils/background_retry.py
+# Non-blocking retries for Sheets calls that hit quota (429) in the script thread.
+# Instead of sleeping and calling st.rerun(), the script:
+#   - serves the last good value for the call if there is one no older than
+#     RETRY_STALE_MAX_S (stale, marked as such),
+#   - hands the call to a small process-wide pool that retries it with backoff
+#     (one in-flight task per key, shared by every session that needs it),
+#   - and registers a fragment that polls every RETRY_POLL_S and reruns the page once
+#     the task has finished (or a due time has passed).
+# During a quota incident the script threads return at once; only the pool's few
+# threads wait, however many sessions are open. Writes follow the same rule:
+# run_or_schedule tries once and hands a write that hit quota to the pool.
+import os, json, time, logging, threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from dotenv import load_dotenv
+
+from utils.lazy_imports import api_error
+from utils.run_stats import in_session
+
+load_dotenv()
+
+log = logging.getLogger("boostbridge.background_retry")
+
+RETRY_WORKERS  = int(os.getenv("RETRY_WORKERS", "2"))
+RETRY_ATTEMPTS = int(os.getenv("RETRY_ATTEMPTS", "6"))
+RETRY_BASE_S   = float(os.getenv("RETRY_BASE_S", "0.8"))
+RETRY_MAX_S    = float(os.getenv("RETRY_MAX_S", "8"))
+RETRY_POLL_S   = float(os.getenv("RETRY_POLL_S", "1"))
+LAST_GOOD_MAX  = int(os.getenv("RETRY_LAST_GOOD_MAX", "500"))
+STALE_MAX_S    = float(os.getenv("RETRY_STALE_MAX_S", "600"))   # older last good values are not served
+
+_POOL = {"pool": None}
+_TASKS: dict[str, Future] = {}
+_EPOCH: dict[str, int] = {}   # bumped by forget(): tasks started before it are not remembered
+_LAST_GOOD: "OrderedDict[str, tuple[object, float]]" = OrderedDict()   # key -> (value, stored_at)
+_LOCK = threading.Lock()
+
+def in_script_thread() -> bool:
+    """True in a Streamlit script run, where any wait holds the user's page."""
+    return get_script_run_ctx(suppress_warning=True) is not None
+
+def quota_error(message: str) -> Exception:
+    """A gspread APIError shaped like a 429, for callers that throttle themselves."""
+    import requests
+    resp = requests.Response()
+    resp.status_code = 429
+    resp._content = json.dumps({"error": {"code": 429, "message": message, "status": "RESOURCE_EXHAUSTED"}}).encode()
+    return api_error()(resp)
+
+def is_quota_error(e: BaseException) -> bool:
+    """A gspread APIError for 429 / quota exceeded."""
+    if not isinstance(e, api_error()):
+        return False
+    status = getattr(getattr(e, "response", None), "status_code", None)
+    msg = str(e).lower()
+    return status == 429 or "429" in msg or "quota" in msg
+
+# ---------- last good values ----------
+
+def remember(key: str, value, epoch: int | None = None) -> None:
+    """Store value as key's last good value (unless key was forgotten since `epoch`)."""
+    with _LOCK:
+        if epoch is not None and _EPOCH.get(key, 0) != epoch:
+            return
+        _LAST_GOOD[key] = (value, time.time())
+        _LAST_GOOD.move_to_end(key)
+        while len(_LAST_GOOD) > LAST_GOOD_MAX:
+            _LAST_GOOD.popitem(last=False)
+
+def last_good(key: str, max_age_s: float | None = None):
+    """(value, age_s) of the last successful call for key, or (None, None) if none is that recent."""
+    max_age_s = STALE_MAX_S if max_age_s is None else max_age_s
+    with _LOCK:
+        hit = _LAST_GOOD.get(key)
+    if not hit:
+        return None, None
+    age = time.time() - hit[1]
+    if age > max_age_s:
+        return None, None
+    return hit[0], age
+
+def forget(key: str) -> None:
+    """
+    Drop key's last good value and any result not yet taken (e.g. after a write has made
+    them wrong). A task still running for key finishes, but its value is not remembered.
+    """
+    with _LOCK:
+        _LAST_GOOD.pop(key, None)
+        _TASKS.pop(key, None)
+        _EPOCH[key] = _EPOCH.get(key, 0) + 1
+
+# ---------- background tasks ----------
+
+def _pool() -> ThreadPoolExecutor:
+    if _POOL["pool"] is None:
+        with _LOCK:
+            if _POOL["pool"] is None:
+                _POOL["pool"] = ThreadPoolExecutor(max_workers=RETRY_WORKERS, thread_name_prefix="retry")
+    return _POOL["pool"]
+
+def _with_retries(key: str, epoch: int, fn, args, kwargs):
+    delay = RETRY_BASE_S
+    for attempt in range(1, RETRY_ATTEMPTS + 1):
+        try:
+            value = fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == RETRY_ATTEMPTS or not is_quota_error(e):
+                log.warning("retry key=%s gave up after %d attempt(s): %s", key, attempt, e)
+                raise
+            time.sleep(delay)   # pool thread, not a script thread
+            delay = min(delay * 2, RETRY_MAX_S)
+            continue
+        remember(key, value, epoch)
+        if attempt > 1:
+            log.info("retry key=%s ok after %d attempts", key, attempt)
+        return value
+
+def schedule(key: str, fn, *args, **kwargs) -> Future:
+    """Retry fn(*args, **kwargs) in the background, unless a task for key is already in flight."""
+    with _LOCK:
+        fut = _TASKS.get(key)
+        if fut is not None and not fut.done():
+            return fut
+        epoch = _EPOCH.get(key, 0)
+    fut = _pool().submit(in_session(_with_retries), key, epoch, fn, args, kwargs)
+    with _LOCK:
+        _TASKS[key] = fut
+    return fut
+
+def run_or_schedule(key: str, fn, *args, **kwargs) -> bool:
+    """
+    fn(*args, **kwargs) now (True), or, on a quota error, retried in the background
+    under key (False). Other errors are raised.
+    """
+    try:
+        fn(*args, **kwargs)
+    except Exception as e:
+        if not is_quota_error(e):
+            raise
+        schedule(key, fn, *args, **kwargs)
+        return False
+    return True
+
+def pending(key: str) -> bool:
+    with _LOCK:
+        fut = _TASKS.get(key)
+    return fut is not None and not fut.done()
+
+def take(key: str) -> Future | None:
+    """The finished task for key (removed), or None if there is none or it is still running."""
+    with _LOCK:
+        fut = _TASKS.get(key)
+        if fut is None or not fut.done():
+            return None
+        return _TASKS.pop(key)
+
+def fresh_or_stale(key: str, fn, *args, **kwargs):
+    """
+    (value, age_s): fn(*args, **kwargs) with age 0, remembered as key's last good value.
+    On a quota error, fn is retried in the background and the last good value is returned
+    with its age; with no last good value (or only one older than STALE_MAX_S), the error
+    is raised.
+    """
+    try:
+        value = fn(*args, **kwargs)
+    except Exception as e:
+        if not is_quota_error(e):
+            raise
+        schedule(key, fn, *args, **kwargs)
+        value, age = last_good(key)
+        if age is None:
+            raise
+        log.info("stale key=%s age=%.0fs (quota)", key, age)
+        return value, age
+    remember(key, value)
+    return value, 0.0
+
+# ---------- UI: rerun when the retry lands ----------
+
+@st.fragment(run_every=RETRY_POLL_S)
+def _poll(key: str | None, due_at: float):
+    if (key is None or not pending(key)) and time.time() >= due_at:
+        st.rerun(scope="app")
+
+def rerun_when_ready(key: str | None = None, delay_s: float = 0.0) -> None:
+    """
+    Rerun the whole page once key's background task has finished and delay_s has passed,
+    without holding this script run. Call once per run; nothing is drawn.
+    """
+    _poll(key, time.time() + delay_s)
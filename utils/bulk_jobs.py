@@ -0,0 +1,434 @@
+# utils/bulk_jobs.py
+# Bulk (offline) letter generation for bulk_queued Jobs rows — re-queued needs_fix jobs and
+# pro-plan batches, where throughput and cost matter more than latency. All prompts are
+# built up front with build_prompt and sent as ONE batch job through a pluggable backend;
+# results are QA'd and written back to the sheet with one batch_update.
+#
+# Claimed rows are marked bulk_inflight and carry their batch id (bulk_batch_id), so a pass
+# that dies while waiting does not lose the batch: the next pass polls it again and writes
+# its results back. A claim that never got a batch id is released after BULK_CLAIM_TTL_S;
+# a batch still running past BULK_MAX_WAIT_S is cancelled before its rows are re-queued,
+# so the same rows are not billed twice. A row that fails (or cannot be built into a
+# prompt) BULK_MAX_ATTEMPTS times is parked as needs_fix with a note for the user.
+#
+# The interactive path (Step 8 -> llm_router) is left alone: bulk requests never touch the
+# router's health stats or hedge budget, and the OpenAI Batch API runs on its own rate-limit
+# pool (optionally a separate key via BULK_OPENAI_API_KEY).
+#
+#   python -m utils.bulk_jobs            # one pass over bulk_queued rows
+#   python -m utils.bulk_jobs 200        # at most 200 rows
+import os, re, sys, json, time, logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+from utils.llm import get_client
+from utils.llm_router import ROUTES
+from utils.letter_body import SYSTEM_PROMPT, assemble_letter, strip_salutation_and_signature
+from utils.letter_qa import check_letter, qa_notes_json
+from utils.metrics import record_llm_call, usage_from
+from utils.run_stats import count
+from utils.prompt_builder import batch_build_prompts
+
+load_dotenv()
+
+log = logging.getLogger("boostbridge.bulk_jobs")
+
+BULK_BACKEND       = os.getenv("BULK_BACKEND", "openai_batch")   # openai_batch / local
+BULK_LIMIT         = int(os.getenv("BULK_LIMIT", "500"))
+BULK_POLL_S        = float(os.getenv("BULK_POLL_S", "30"))
+BULK_MAX_WAIT_S    = float(os.getenv("BULK_MAX_WAIT_S", str(24 * 3600)))  # Batch API completion window
+BULK_LOCAL_WORKERS = int(os.getenv("BULK_LOCAL_WORKERS", "2"))           # keep small: shares the live key
+BULK_CLAIM_TTL_S   = float(os.getenv("BULK_CLAIM_TTL_S", "3600"))         # in flight with no batch id
+BULK_MAX_ATTEMPTS  = int(os.getenv("BULK_MAX_ATTEMPTS", "3"))             # then needs_fix, not bulk_queued
+BULK_TEMPERATURE   = 0.6
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+TERMINAL = {"completed", "failed", "expired", "cancelled"}
+
+_BULK_CLIENT = {"client": None}
+
+def _client():
+    """Batch-only OpenAI client when BULK_OPENAI_API_KEY is set, else the shared one."""
+    key = os.getenv("BULK_OPENAI_API_KEY")
+    if not key:
+        return get_client()
+    if _BULK_CLIENT["client"] is None:
+        from openai import OpenAI
+        _BULK_CLIENT["client"] = OpenAI(api_key=key)
+    return _BULK_CLIENT["client"]
+
+# ---------- Jobs row -> build_prompt inputs ----------
+
+def _round_num(label) -> str:
+    """Jobs rows store "R1" / "Round 2" / "Personal Info"; build_prompt wants 1/2/3 or "Personal Info"."""
+    low = str(label or "").strip().lower()
+    if "personal" in low:
+        return "Personal Info"
+    m = re.search(r"[123]", low)
+    return m.group(0) if m else "1"
+
+def inputs_from_job(job: dict) -> dict:
+    """
+    Rebuild build_prompt's keyword arguments from a Jobs row (payload_json written
+    by Step 4.5: {"user", "items", "bureau", "round", "notes"}).
+    """
+    payload = json.loads(job.get("payload_json") or "{}")
+    user = payload.get("user") or {}
+    items = payload.get("items") or []
+    dtype = (job.get("dispute_type") or "").strip() or (items[0].get("type", "") if items else "")
+
+    if dtype == "account":
+        details = {"account_items": items}
+    else:
+        # single-item intakes; the item's own fields are that type's details
+        details = {dtype: dict(items[0])} if items else {}
+
+    return {
+        "user_info": {
+            "full_name": user.get("full_name", ""),
+            "address":   user.get("address", ""),
+            "dob":       user.get("dob", ""),
+            "ssn_last4": user.get("last4", ""),
+        },
+        "dispute_details": details,
+        "dispute_types":   [dtype] if dtype else [],
+        "bureau":          payload.get("bureau") or job.get("bureau", ""),
+        "round_num":       _round_num(payload.get("round") or job.get("round_name") or job.get("round")),
+        "law_selection":   [],
+        "strategy":        None,
+    }
+
+# ---------- backends ----------
+# A backend takes [{"custom_id", "body"}] (body = chat.completions arguments) and returns
+# {custom_id: (text, usage) | Exception} once the batch reaches a terminal status.
+# cancel(batch_id) stops a batch that is no longer wanted.
+
+class OpenAIBatchBackend:
+    """OpenAI Batch API: one JSONL upload, one batch, results from the output/error files."""
+
+    def submit(self, requests: list[dict]) -> str:
+        lines = [
+            json.dumps({"custom_id": r["custom_id"], "method": "POST", "url": BATCH_ENDPOINT, "body": r["body"]},
+                       ensure_ascii=False)
+            for r in requests
+        ]
+        client = _client()
+        upload = client.files.create(file=("bulk_jobs.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch")
+        batch = client.batches.create(input_file_id=upload.id, endpoint=BATCH_ENDPOINT,
+                                      completion_window="24h", metadata={"source": "bulk_jobs"})
+        return batch.id
+
+    def poll(self, batch_id: str) -> str:
+        return _client().batches.retrieve(batch_id).status
+
+    def cancel(self, batch_id: str) -> None:
+        _client().batches.cancel(batch_id)
+
+    def results(self, batch_id: str) -> dict:
+        client = _client()
+        batch = client.batches.retrieve(batch_id)
+        out = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                rec = json.loads(line)
+                resp = rec.get("response") or {}
+                body = resp.get("body") or {}
+                if resp.get("status_code") == 200 and body.get("choices"):
+                    out[rec["custom_id"]] = (body["choices"][0]["message"].get("content") or "",
+                                             _usage_dict(body.get("usage")))
+                else:
+                    err = rec.get("error") or body.get("error") or f"status {resp.get('status_code')}"
+                    out[rec["custom_id"]] = RuntimeError(str(err))
+        return out
+
+class LocalBackend:
+    """Stand-in for a batch API: runs the requests on a small private thread pool."""
+
+    def __init__(self, workers: int = BULK_LOCAL_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="bulk")
+        self._batches: dict[str, dict] = {}
+
+    @staticmethod
+    def _run(body: dict) -> tuple[str, dict]:
+        count("llm")
+        resp = _client().chat.completions.create(**body)
+        return (resp.choices[0].message.content or ""), usage_from(resp)
+
+    def submit(self, requests: list[dict]) -> str:
+        batch_id = f"local-{int(time.time() * 1000)}"
+        self._batches[batch_id] = {r["custom_id"]: self._pool.submit(self._run, r["body"]) for r in requests}
+        return batch_id
+
+    def poll(self, batch_id: str) -> str:
+        futs = self._batches.get(batch_id)
+        if futs is None:
+            return "expired"   # local batches do not outlive the process that ran them
+        return "completed" if all(f.done() for f in futs.values()) else "in_progress"
+
+    def cancel(self, batch_id: str) -> None:
+        for fut in self._batches.pop(batch_id, {}).values():
+            fut.cancel()
+
+    def results(self, batch_id: str) -> dict:
+        out = {}
+        for cid, fut in self._batches.pop(batch_id, {}).items():
+            try:
+                out[cid] = fut.result()
+            except Exception as e:
+                out[cid] = e
+        return out
+
+BACKENDS = {
+    "openai_batch": OpenAIBatchBackend,
+    "local": LocalBackend,
+}
+
+def get_backend(name: str = BULK_BACKEND):
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown BULK_BACKEND '{name}' (expected one of {', '.join(BACKENDS)})")
+
+def _usage_dict(u: dict | None) -> dict:
+    """Batch output carries usage as plain JSON; same shape as metrics.usage_from."""
+    u = u or {}
+    return {
+        "prompt_tokens": int(u.get("prompt_tokens") or 0),
+        "completion_tokens": int(u.get("completion_tokens") or 0),
+        "cached_tokens": int((u.get("prompt_tokens_details") or {}).get("cached_tokens") or 0),
+    }
+
+def wait_for(backend, batch_id: str, poll_s: float | None = None, max_wait_s: float | None = None) -> str:
+    """Poll until the batch is terminal (default BULK_POLL_S / BULK_MAX_WAIT_S). Returns the final status."""
+    poll_s = BULK_POLL_S if poll_s is None else poll_s
+    max_wait_s = BULK_MAX_WAIT_S if max_wait_s is None else max_wait_s
+    deadline = time.monotonic() + max_wait_s
+    while True:
+        status = backend.poll(batch_id)
+        if status in TERMINAL:
+            return status
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"batch {batch_id} still '{status}' after {max_wait_s:.0f}s")
+        time.sleep(poll_s)
+
+# ---------- one pass ----------
+
+def build_requests(jobs: list[dict]) -> tuple[list[dict], dict]:
+    """
+    Batch requests for these rows, plus {letter_id: (inputs, mode, strategy, model)}.
+    Requests are grouped by (mode, strategy) so rows sharing a static prompt prefix
+    sit next to each other for the provider's prompt cache.
+    """
+    parsed = []
+    for job in jobs:
+        lid = job.get("letter_id", "")
+        try:
+            parsed.append((lid, inputs_from_job(job)))
+        except Exception as e:
+            log.warning("skipping %s: bad payload (%s)", lid, e)
+
+    reqs, ctx = [], {}
+    for (lid, inputs), built in zip(parsed, batch_build_prompts([inp for _, inp in parsed])):
+        if "error" in built:
+            log.warning("skipping %s: %s", lid, built["error"])
+            continue
+        mode, strategy, prompt = built["mode"], built["strategy"], built["prompt"]
+        route = ROUTES.get((mode, strategy)) or ROUTES[("r1", "")]
+        reqs.append({
+            "custom_id": lid,
+            "key": (mode, strategy),
+            "body": {
+                "model": route["model"],
+                "messages": [
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt},
+                ],
+                "max_tokens": route["max_tokens"],
+                "temperature": BULK_TEMPERATURE,
+            },
+        })
+        ctx[lid] = (inputs, mode, strategy, route["model"])
+    reqs.sort(key=lambda r: r.pop("key"))
+    return reqs, ctx
+
+def _claim_age_s(job: dict) -> float | None:
+    """Seconds since the row was claimed (bulk_claimed_at, local time), or None."""
+    from utils.jobs import LOCAL_TZ
+    try:
+        claimed = datetime.strptime((job.get("bulk_claimed_at") or "").strip(), "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return None
+    return (datetime.now(LOCAL_TZ) - claimed.replace(tzinfo=LOCAL_TZ)).total_seconds()
+
+def _release(lids) -> None:
+    """Put in-flight rows back in the queue for the next pass."""
+    from utils.jobs import BULK_QUEUED, BULK_INFLIGHT, write_job_results
+    lids = list(lids)
+    if lids:
+        write_job_results({lid: {"status": BULK_QUEUED, "bulk_batch_id": ""} for lid in lids},
+                          only_status=BULK_INFLIGHT)
+
+def _retry_or_park(job: dict | None, reason: str) -> dict:
+    """
+    Columns for a row the worker could not finish: back to bulk_queued, or needs_fix
+    with a note once it has been claimed BULK_MAX_ATTEMPTS times.
+    """
+    from utils.jobs import BULK_QUEUED
+    try:
+        attempts = int((job or {}).get("bulk_attempts") or 0)
+    except ValueError:
+        attempts = 0
+    if attempts < BULK_MAX_ATTEMPTS:
+        return {"status": BULK_QUEUED, "bulk_batch_id": ""}
+    note = {"status": "needs_fix", "issues": [{
+        "check": "bulk", "severity": "error",
+        "detail": f"Bulk generation gave up after {attempts} attempts: {reason}",
+    }]}
+    return {"status": "needs_fix", "bulk_batch_id": "", "qa_notes": qa_notes_json(note)}
+
+def _cancel(backend, batch_id: str) -> None:
+    try:
+        backend.cancel(batch_id)
+    except Exception as e:
+        log.warning("bulk: cancelling %s failed: %s", batch_id, e)
+
+def _write_back(backend, batch_id: str, status: str, jobs: list[dict], ctx: dict, wall: float,
+                summary: dict) -> None:
+    """
+    QA the batch's results and write them to the rows still in flight (ONE batch_update):
+    letter_text, qa_notes, llm_metrics, status -> approved / needs_fix. Failed rows, and
+    rows of `jobs` that never made it into the batch, are re-queued (_retry_or_park).
+    """
+    from utils.jobs import BULK_INFLIGHT, write_job_results
+
+    by_id = {j.get("letter_id"): j for j in jobs}
+    results = backend.results(batch_id) if ctx else {}
+    updates = {lid: _retry_or_park(job, "the payload could not be built into a prompt")
+               for lid, job in by_id.items() if lid and lid not in ctx}
+    for lid, (inputs, mode, strategy, model) in ctx.items():
+        res = results.get(lid) or RuntimeError(f"no result in batch output (batch {status})")
+        if isinstance(res, Exception):
+            log.warning("bulk: %s failed: %s", lid, res)
+            record_llm_call("bulk", mode=mode, strategy=strategy, model=model, wall_s=wall, ok=False)
+            summary["failed"] += 1
+            updates[lid] = _retry_or_park(by_id.get(lid), str(res))
+            continue
+        text, usage = res
+        qa = check_letter(strip_salutation_and_signature(text), inputs)  # as Step 8 does; assemble_letter strips them too
+        record_llm_call("bulk", mode=mode, strategy=strategy, model=model, wall_s=wall, **usage)
+        updates[lid] = {
+            "letter_text": assemble_letter(inputs["user_info"], inputs["bureau"], text),
+            "qa_notes": qa_notes_json(qa),
+            "status": "needs_fix" if qa["status"] == "needs_fix" else "approved",
+            "llm_metrics": {"model": model, "mode": mode, "strategy": strategy, "batch_id": batch_id,
+                            "backend": backend.__class__.__name__, **usage},
+        }
+        summary[updates[lid]["status"]] += 1
+
+    skipped = write_job_results(updates, only_status=BULK_INFLIGHT)
+    if skipped:
+        log.info("bulk: %d row(s) changed while in flight, not overwritten: %s", len(skipped), ", ".join(skipped))
+    for lid in skipped:
+        if "letter_text" in updates[lid]:
+            summary[updates[lid]["status"]] -= 1
+    parked = [lid for lid, u in updates.items()
+              if lid not in skipped and u["status"] == "needs_fix" and "letter_text" not in u]
+    if parked:
+        log.warning("bulk: gave up on %s after %d attempts", ", ".join(parked), BULK_MAX_ATTEMPTS)
+    summary["parked"] = summary.get("parked", 0) + len(parked)
+    summary["skipped"] = summary.get("skipped", 0) + len(skipped)
+
+def resume_inflight(backend, summary: dict) -> None:
+    """
+    Pick up rows an earlier pass left bulk_inflight: write back batches that have finished,
+    cancel and re-queue batches past BULK_MAX_WAIT_S, and release claims that never got
+    a batch id within BULK_CLAIM_TTL_S. Batches still running are left alone.
+    """
+    from utils.jobs import BULK_INFLIGHT, list_jobs_by_status
+
+    batches: dict[str, list[dict]] = {}
+    orphans = []
+    for job in list_jobs_by_status(BULK_INFLIGHT, limit=10 * BULK_LIMIT):
+        bid = (job.get("bulk_batch_id") or "").strip()
+        if bid:
+            batches.setdefault(bid, []).append(job)
+        else:
+            age = _claim_age_s(job)
+            if age is None or age > BULK_CLAIM_TTL_S:
+                orphans.append(job["letter_id"])
+    if orphans:
+        log.warning("bulk: releasing %d claim(s) with no batch: %s", len(orphans), ", ".join(orphans))
+        _release(orphans)
+        summary["released"] = summary.get("released", 0) + len(orphans)
+
+    for batch_id, jobs in batches.items():
+        try:
+            status = backend.poll(batch_id)
+        except Exception as e:
+            log.warning("bulk: cannot poll %s (%s); trying again next pass", batch_id, e)
+            continue
+        if status not in TERMINAL:
+            ages = [a for a in (_claim_age_s(j) for j in jobs) if a is not None]
+            if ages and max(ages) > BULK_MAX_WAIT_S:
+                log.warning("bulk: %s still '%s' after %.0fs; cancelling", batch_id, status, max(ages))
+                _cancel(backend, batch_id)
+                _release(j["letter_id"] for j in jobs)
+            continue
+        _, ctx = build_requests(jobs)
+        log.info("bulk: resuming %s (%s, %d rows)", batch_id, status, len(jobs))
+        _write_back(backend, batch_id, status, jobs, ctx, 0.0, summary)
+        summary["resumed"] = summary.get("resumed", 0) + len(jobs)
+
+def run_bulk(limit: int = BULK_LIMIT, backend=None) -> dict:
+    """
+    Finish batches left in flight by an earlier pass (resume_inflight), then generate
+    letters for 'bulk_queued' Jobs rows in one batch and write them back: letter_text,
+    qa_notes and llm_metrics, status -> approved / needs_fix. Rows are marked bulk_inflight
+    before submitting and get the batch id right after; a row whose status changed meanwhile
+    (e.g. the user regenerated it in Step 8) is not overwritten. Failed rows go back to
+    bulk_queued until BULK_MAX_ATTEMPTS, then stop at needs_fix.
+    """
+    from utils.jobs import BULK_INFLIGHT, claim_bulk_jobs, write_job_results  # Streamlit-backed
+
+    backend = backend or get_backend()
+    summary = {"queued": 0, "submitted": 0, "approved": 0, "needs_fix": 0, "failed": 0}
+    resume_inflight(backend, summary)
+
+    jobs = claim_bulk_jobs(limit=limit)
+    reqs, ctx = build_requests(jobs)
+    summary.update(queued=len(jobs), submitted=len(reqs))
+    if not reqs:
+        _write_back(None, "", "not submitted", jobs, ctx, 0.0, summary)
+        log.info("bulk: nothing to do %s", summary)
+        return summary
+
+    t0 = time.monotonic()
+    try:
+        batch_id = backend.submit(reqs)
+    except Exception:
+        _release(j["letter_id"] for j in jobs)   # nothing was sent; the next pass retries
+        raise
+    log.info("bulk: submitted %d requests as %s", len(reqs), batch_id)
+    # from here on the batch is paid for: the rows keep its id until its results are written
+    write_job_results({lid: {"bulk_batch_id": batch_id} for lid in ctx}, only_status=BULK_INFLIGHT)
+    try:
+        status = wait_for(backend, batch_id)
+    except TimeoutError:
+        _cancel(backend, batch_id)
+        _release(ctx)
+        raise
+    wall = round(time.monotonic() - t0, 3)
+    summary.update(batch_id=batch_id, batch_status=status, wall_s=wall)
+
+    _write_back(backend, batch_id, status, jobs, ctx, wall, summary)
+    log.info("bulk: %s", summary)
+    return summary
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    print(run_bulk(limit=int(sys.argv[1]) if len(sys.argv) > 1 else BULK_LIMIT))
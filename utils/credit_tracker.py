@@ -55,6 +55,16 @@ def lock_or_validate_user(user_info: dict) -> bool:
     # Already locked: must match
     return locked == key_now
 
+def identity_ok(user_info: dict) -> bool:
+    """What lock_or_validate_user would return, without setting the lock."""
+    if st.session_state.get("credit_mode") == "pro":
+        return True
+    key_now = make_user_key(user_info)
+    locked = st.session_state.get("locked_user_key")
+    if not locked:
+        return not (key_now.strip("|") == "" or "||" in key_now)
+    return locked == key_now
+
 def cannot_spend_reason() -> str | None:
     """Return reason string if user cannot spend credit, else None."""
     if st.session_state.get("credit_mode") == "pro":
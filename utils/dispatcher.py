@@ -0,0 +1,331 @@
+# utils/dispatcher.py
+# Background worker that drains due reminders and delivers them concurrently.
+#
+# Run it next to the app (not inside Streamlit):
+#   python -m utils.dispatcher            # loop forever
+#   python -m utils.dispatcher --once     # single pass (cron-friendly)
+#
+# - One bounded thread pool PER CHANNEL, so a slow SMTP host never holds back SMS.
+# - Idempotent: a local SQLite ledger keyed by reminder_id records claims/outcomes,
+#   so a crash or a second dispatcher never double-sends.
+# - Retries use exponential backoff with jitter.
+# - Outcomes are written back to the Reminders sheet in one batch_update per pass.
+# - Digests (default on): all of a user's reminders due today go out as ONE
+#   message per channel per day instead of one message per reminder. The digest
+#   is sent as soon as one of them is due, so members due later that (local) day
+#   go out early with it; a reminder due later today with nothing due now waits.
+#   A digest succeeds or fails as a whole: every member gets the same outcome.
+import os, sys, time, random, sqlite3, threading, logging
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor, wait
+from dotenv import load_dotenv
+
+from utils import notifications
+from utils.reminders import (
+    list_due_reminders, mark_sent_many, render_reminder,
+    reminder_template, reminder_context,
+    coalesce_reminders, render_digest, end_of_local_day_utc,
+)
+
+load_dotenv()
+log = logging.getLogger("bb.dispatcher")
+
+# ---- tuning (env overrides) ----
+EMAIL_WORKERS = int(os.getenv("DISPATCH_EMAIL_WORKERS", "16") or "16")
+SMS_WORKERS   = int(os.getenv("DISPATCH_SMS_WORKERS", "8") or "8")
+MAX_ATTEMPTS  = int(os.getenv("DISPATCH_MAX_ATTEMPTS", "4") or "4")
+BACKOFF_BASE  = float(os.getenv("DISPATCH_BACKOFF_S", "1.0") or "1.0")
+BACKOFF_MAX   = float(os.getenv("DISPATCH_BACKOFF_MAX_S", "30") or "30")
+POLL_SECONDS  = float(os.getenv("DISPATCH_POLL_S", "60") or "60")
+PASS_LIMIT    = int(os.getenv("DISPATCH_PASS_LIMIT", "10000") or "10000")
+WRITE_CHUNK   = int(os.getenv("DISPATCH_WRITE_CHUNK", "500") or "500")
+CLAIM_TTL_S   = int(os.getenv("DISPATCH_CLAIM_TTL_S", "900") or "900")  # stale claims become retryable
+DIGESTS       = (os.getenv("DISPATCH_DIGESTS", "true").lower() == "true")
+
+# Ledger lives next to profiles.db by default (writable on Streamlit Cloud).
+DB_DIR  = os.environ.get("DISPATCH_DB_DIR", os.environ.get("PROFILE_DB_DIR", "/mount/data"))
+DB_PATH = os.path.join(DB_DIR, "dispatch.db")
+
+DDL = """
+CREATE TABLE IF NOT EXISTS deliveries (
+  reminder_id TEXT PRIMARY KEY,
+  status      TEXT NOT NULL,            -- claimed / sent / failed
+  attempts    INTEGER DEFAULT 0,
+  claimed_at  REAL DEFAULT 0,
+  updated_at  TEXT DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+_DB_LOCK = threading.Lock()
+
+# ---------- idempotency ledger ----------
+def _connect() -> sqlite3.Connection:
+    # autocommit: each statement is its own transaction; callers close the connection
+    return sqlite3.connect(DB_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+
+def _ensure_db():
+    os.makedirs(DB_DIR, exist_ok=True)
+    with closing(_connect()) as conn:
+        conn.execute(DDL)
+
+def _claim(reminder_id: str) -> str:
+    """
+    Try to take ownership of a reminder.
+    Returns "claimed" (go deliver), "sent"/"failed" (already final; just re-sync the sheet),
+    or "busy" (another worker holds a fresh claim).
+
+    The claim is one conditional upsert, so it is atomic across dispatcher processes
+    (the thread lock alone only covers this one): a new row, or an existing row that is
+    neither final nor freshly claimed, becomes ours; anything else is left untouched.
+    """
+    now = time.time()
+    with _DB_LOCK, closing(_connect()) as conn:
+        cur = conn.execute(
+            """
+            INSERT INTO deliveries(reminder_id, status, attempts, claimed_at, updated_at)
+            VALUES(?, 'claimed', 0, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(reminder_id) DO UPDATE
+            SET status='claimed', claimed_at=excluded.claimed_at, updated_at=CURRENT_TIMESTAMP
+            WHERE deliveries.status NOT IN ('sent', 'failed') AND deliveries.claimed_at < ?
+            """,
+            (reminder_id, now, now - CLAIM_TTL_S),
+        )
+        if cur.rowcount == 1:
+            return "claimed"
+        row = conn.execute(
+            "SELECT status FROM deliveries WHERE reminder_id=?", (reminder_id,)
+        ).fetchone()
+    status = row[0] if row else ""
+    return status if status in ("sent", "failed") else "busy"
+
+def _finish(reminder_id: str, sent_ok: bool, attempts: int) -> None:
+    with _DB_LOCK, closing(_connect()) as conn:
+        conn.execute(
+            "UPDATE deliveries SET status=?, attempts=?, updated_at=CURRENT_TIMESTAMP WHERE reminder_id=?",
+            ("sent" if sent_ok else "failed", attempts, reminder_id),
+        )
+
+# ---------- delivery ----------
+def _backoff(attempt: int) -> float:
+    """1s, 2s, 4s, ... capped, with +/-25% jitter so retries don't stampede the provider."""
+    delay = min(BACKOFF_BASE * (2 ** attempt), BACKOFF_MAX)
+    return delay * random.uniform(0.75, 1.25)
+
+def _send_once(rem: dict) -> bool:
+    subject, html, sms = render_reminder(rem)
+    if (rem.get("channel") or "email").strip().lower() == "sms":
+        return notifications.send_sms(rem.get("phone", ""), sms)
+    return notifications.send_email(rem.get("email", ""), subject, html)
+
+def deliver(rem: dict) -> dict:
+    """Deliver one reminder with idempotency + exponential backoff. Returns an outcome dict."""
+    rid = rem["reminder_id"]
+    state = _claim(rid)
+    if state in ("sent", "failed"):
+        return {"reminder_id": rid, "sent_ok": state == "sent", "attempts": 0, "skipped": True}
+    if state == "busy":
+        return {"reminder_id": rid, "sent_ok": None, "attempts": 0, "skipped": True}
+
+    ok, attempt = False, 0
+    while attempt < MAX_ATTEMPTS:
+        attempt += 1
+        try:
+            ok = bool(_send_once(rem))
+        except Exception as e:
+            log.warning("reminder %s attempt %d raised: %s", rid, attempt, e)
+            ok = False
+        if ok:
+            break
+        if attempt < MAX_ATTEMPTS:
+            time.sleep(_backoff(attempt - 1))
+
+    _finish(rid, ok, attempt)
+    return {"reminder_id": rid, "sent_ok": ok, "attempts": attempt, "skipped": False}
+
+def deliver_email_batch(rems: list[dict]) -> list[dict]:
+    """
+    SendGrid path: reminders sharing a topic share one template, so they go out
+    as multi-personalization requests (up to 1000 recipients per HTTPS call).
+    Same idempotency + backoff rules as deliver(); only failed recipients are retried.
+    """
+    outcomes, pending = [], []
+    for rem in rems:
+        rid = rem["reminder_id"]
+        state = _claim(rid)
+        if state in ("sent", "failed"):
+            outcomes.append({"reminder_id": rid, "sent_ok": state == "sent", "attempts": 0, "skipped": True})
+        elif state == "busy":
+            outcomes.append({"reminder_id": rid, "sent_ok": None, "attempts": 0, "skipped": True})
+        else:
+            pending.append(rem)
+    if not pending:
+        return outcomes
+
+    subject_t, html_t, _ = reminder_template(pending[0].get("topic", ""))
+    attempt = 0
+    while pending and attempt < MAX_ATTEMPTS:
+        attempt += 1
+        try:
+            oks = notifications.send_sendgrid_batch(
+                subject_t, html_t,
+                [{"to": r.get("email", ""), "vars": reminder_context(r)} for r in pending],
+            )
+        except Exception as e:
+            log.warning("sendgrid batch attempt %d raised: %s", attempt, e)
+            oks = [False] * len(pending)
+        retry = []
+        for rem, ok in zip(pending, oks):
+            if ok:
+                _finish(rem["reminder_id"], True, attempt)
+                outcomes.append({"reminder_id": rem["reminder_id"], "sent_ok": True, "attempts": attempt, "skipped": False})
+            else:
+                retry.append(rem)
+        pending = retry
+        if pending and attempt < MAX_ATTEMPTS:
+            time.sleep(_backoff(attempt - 1))
+
+    for rem in pending:
+        _finish(rem["reminder_id"], False, attempt)
+        outcomes.append({"reminder_id": rem["reminder_id"], "sent_ok": False, "attempts": attempt, "skipped": False})
+    return outcomes
+
+def deliver_digest(group: list[dict]) -> list[dict]:
+    """
+    Deliver several reminders for one recipient/channel as a single digest.
+    Every member is claimed in the ledger; members already final are only re-synced.
+    """
+    outcomes, pending = [], []
+    for rem in group:
+        rid = rem["reminder_id"]
+        state = _claim(rid)
+        if state in ("sent", "failed"):
+            outcomes.append({"reminder_id": rid, "sent_ok": state == "sent", "attempts": 0, "skipped": True})
+        elif state == "busy":
+            outcomes.append({"reminder_id": rid, "sent_ok": None, "attempts": 0, "skipped": True})
+        else:
+            pending.append(rem)
+    if not pending:
+        return outcomes
+
+    subject, html, sms = render_digest(pending)
+    first = pending[0]
+    is_sms = _channel_of(first) == "sms"
+    ok, attempt = False, 0
+    while attempt < MAX_ATTEMPTS:
+        attempt += 1
+        try:
+            if is_sms:
+                ok = bool(notifications.send_sms(first.get("phone", ""), sms))
+            else:
+                ok = bool(notifications.send_email(first.get("email", ""), subject, html))
+        except Exception as e:
+            log.warning("digest for %s attempt %d raised: %s", first["reminder_id"], attempt, e)
+            ok = False
+        if ok:
+            break
+        if attempt < MAX_ATTEMPTS:
+            time.sleep(_backoff(attempt - 1))
+
+    for rem in pending:
+        _finish(rem["reminder_id"], ok, attempt)
+        outcomes.append({"reminder_id": rem["reminder_id"], "sent_ok": ok, "attempts": attempt, "skipped": False})
+    return outcomes
+
+# ---------- one pass ----------
+def _channel_of(rem: dict) -> str:
+    return "sms" if (rem.get("channel") or "").strip().lower() == "sms" else "email"
+
+def run_once(limit: int = PASS_LIMIT, pools: dict | None = None) -> dict:
+    """
+    Pull up to `limit` due reminders, fan them out to per-channel pools,
+    then write all outcomes back in batched sheet updates.
+    Returns a small summary dict.
+    """
+    _ensure_db()
+    if DIGESTS:
+        # look ahead to the end of the local day so today's reminders share one message
+        groups = coalesce_reminders(list_due_reminders(limit=limit, until=end_of_local_day_utc()))
+        due = [g[0] for g in groups if len(g) == 1]
+        digests = [g for g in groups if len(g) > 1]
+    else:
+        due, digests = list_due_reminders(limit=limit), []
+    if not due and not digests:
+        return {"due": 0, "digests": 0, "sent": 0, "failed": 0, "skipped": 0}
+
+    own_pools = pools is None
+    if own_pools:
+        pools = {
+            "email": ThreadPoolExecutor(max_workers=EMAIL_WORKERS, thread_name_prefix="bb-email"),
+            "sms":   ThreadPoolExecutor(max_workers=SMS_WORKERS, thread_name_prefix="bb-sms"),
+        }
+    try:
+        futures = []
+        if notifications.SENDGRID_API_KEY:
+            # group email reminders by topic -> one template per SendGrid request
+            by_topic: dict[str, list[dict]] = {}
+            for r in due:
+                if _channel_of(r) == "email":
+                    by_topic.setdefault(r.get("topic", ""), []).append(r)
+                else:
+                    futures.append(pools["sms"].submit(deliver, r))
+            for rems in by_topic.values():
+                for i in range(0, len(rems), notifications.SENDGRID_MAX_PERSONALIZATIONS):
+                    futures.append(pools["email"].submit(deliver_email_batch, rems[i:i + notifications.SENDGRID_MAX_PERSONALIZATIONS]))
+        else:
+            futures = [pools[_channel_of(r)].submit(deliver, r) for r in due]
+        for g in digests:
+            futures.append(pools[_channel_of(g[0])].submit(deliver_digest, g))
+        wait(futures)
+    finally:
+        if own_pools:
+            for p in pools.values():
+                p.shutdown(wait=True)
+
+    outcomes = []
+    for f in futures:
+        if f.exception():
+            continue
+        res = f.result()
+        outcomes.extend(res if isinstance(res, list) else [res])
+    for f in futures:
+        if f.exception():
+            log.error("delivery crashed: %s", f.exception())
+
+    # Only final outcomes go to the sheet; "busy" rows belong to another worker.
+    to_write = [o for o in outcomes if o["sent_ok"] is not None]
+    for i in range(0, len(to_write), WRITE_CHUNK):
+        mark_sent_many(to_write[i:i + WRITE_CHUNK])
+
+    summary = {
+        "due": len(due) + sum(len(g) for g in digests),
+        "digests": len(digests),
+        "sent": sum(1 for o in outcomes if o["sent_ok"] and not o["skipped"]),
+        "failed": sum(1 for o in outcomes if o["sent_ok"] is False and not o["skipped"]),
+        "skipped": sum(1 for o in outcomes if o["skipped"]),
+    }
+    log.info("dispatch pass: %s", summary)
+    return summary
+
+def run_forever(poll_seconds: float = POLL_SECONDS):
+    """Loop: drain, sleep, repeat. Pools are reused across passes."""
+    pools = {
+        "email": ThreadPoolExecutor(max_workers=EMAIL_WORKERS, thread_name_prefix="bb-email"),
+        "sms":   ThreadPoolExecutor(max_workers=SMS_WORKERS, thread_name_prefix="bb-sms"),
+    }
+    try:
+        while True:
+            try:
+                run_once(pools=pools)
+            except Exception as e:
+                log.exception("dispatch pass failed: %s", e)
+            time.sleep(poll_seconds)
+    finally:
+        for p in pools.values():
+            p.shutdown(wait=True)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    if "--once" in sys.argv:
+        print(run_once())
+    else:
+        run_forever()
@@ -1,7 +1,6 @@
 # utils/history.py
-import os, io, re, uuid, datetime
-import pandas as pd
-from fpdf import FPDF
+import os, io, re, uuid, zipfile, datetime
+from utils.lazy_imports import pandas, fpdf
 
 # Where we keep history + saved letters
 DATA_DIR = "data"
@@ -13,6 +12,7 @@ STATUS_CHOICES = ["Prepared", "Sent", "Responded", "Resolved", "Closed"]
 def _ensure_dirs():
     os.makedirs(DATA_DIR, exist_ok=True)
     os.makedirs(LETTERS_DIR, exist_ok=True)
+    pd = pandas()
     if not os.path.exists(HISTORY_PATH):
         df = pd.DataFrame(columns=[
             "id","created_at","full_name","owner_email","bureau","round","dispute_types",
@@ -31,17 +31,19 @@ def _slugify(s: str) -> str:
     s = re.sub(r"[^a-z0-9]+", "-", s)
     return re.sub(r"-+", "-", s).strip("-") or "letter"
 
-def save_letter_files(letter_text: str, full_name: str, bureau: str) -> tuple[str, str]:
+def save_letter_files(letter_text: str, full_name: str, bureau: str, part: int | None = None) -> tuple[str, str]:
     _ensure_dirs()
     stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
     base = f"{_slugify(full_name)}-{_slugify(bureau)}-{stamp}"
+    if part:
+        base += f"-p{part}"  # one intake split into several letters to the same bureau
 
     txt_path = os.path.join(LETTERS_DIR, f"{base}.txt")
     with open(txt_path, "w", encoding="utf-8", newline="\n") as f:
         f.write(letter_text)
 
     pdf_path = os.path.join(LETTERS_DIR, f"{base}.pdf")
-    pdf = FPDF()
+    pdf = fpdf()()
     pdf.add_page()
     pdf.set_font("Arial", size=12)
     for line in letter_text.split("\n"):
@@ -63,29 +65,61 @@ def log_dispute(full_name: str,
     """
     Append a row to the history CSV.
     """
-    _ensure_dirs()
-    row = {
-        "id": str(uuid.uuid4()),
-        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+    return log_disputes([{
         "full_name": full_name,
-        "owner_email": owner_email or "",
         "bureau": bureau,
-        "round": str(round_num),
-        "dispute_types": ", ".join([dt.replace("_"," ").title() for dt in dispute_types]) if dispute_types else "",
-        "status": "Prepared",
+        "round_num": round_num,
+        "dispute_types": dispute_types,
         "txt_path": txt_path,
         "pdf_path": pdf_path,
-    }
+        "owner_email": owner_email,
+    }])[0]
+
+def log_disputes(entries: list[dict]) -> list[str]:
+    """
+    Append several rows (same keys as log_dispute's arguments) with one
+    read/write of the history CSV. Returns the new row ids in order.
+    """
+    _ensure_dirs()
+    now = datetime.datetime.now().isoformat(timespec="seconds")
+    rows = []
+    for e in entries:
+        dispute_types = e.get("dispute_types") or []
+        rows.append({
+            "id": str(uuid.uuid4()),
+            "created_at": now,
+            "full_name": e.get("full_name", ""),
+            "owner_email": e.get("owner_email") or "",
+            "bureau": e.get("bureau", ""),
+            "round": str(e.get("round_num", "")),
+            "dispute_types": ", ".join([dt.replace("_"," ").title() for dt in dispute_types]) if dispute_types else "",
+            "status": "Prepared",
+            "txt_path": e.get("txt_path", ""),
+            "pdf_path": e.get("pdf_path", ""),
+        })
+    if not rows:
+        return []
+    pd = pandas()
     df = pd.read_csv(HISTORY_PATH)
-    for k in row.keys():
+    for k in rows[0].keys():
         if k not in df.columns:
             df[k] = ""
-    df = pd.concat([df, pd.DataFrame([row])], ignore_index=True)
+    df = pd.concat([df, pd.DataFrame(rows)], ignore_index=True)
     df.to_csv(HISTORY_PATH, index=False)
-    return row["id"]
+    return [r["id"] for r in rows]
+
+def zip_letter_files(paths: list[str]) -> bytes:
+    """Bundle saved letter files into one in-memory zip (for a combined download)."""
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for path in paths:
+            if path and os.path.exists(path):
+                zf.write(path, arcname=os.path.basename(path))
+    return buf.getvalue()
 
-def load_history() -> pd.DataFrame:
+def load_history() -> "pandas.DataFrame":
     _ensure_dirs()
+    pd = pandas()
     try:
         return pd.read_csv(HISTORY_PATH)
     except Exception:
@@ -96,7 +130,7 @@ def load_history() -> pd.DataFrame:
 
 def update_status(row_id: str, new_status: str) -> bool:
     _ensure_dirs()
-    df = pd.read_csv(HISTORY_PATH)
+    df = pandas().read_csv(HISTORY_PATH)
     if row_id not in set(df["id"].astype(str)):
         return False
     if new_status not in STATUS_CHOICES:
@@ -0,0 +1,34 @@
+# utils/issue_signals.py
+# Phrase signals in free-text dispute issues (collections, monthly re-reporting / re-aging,
+# past-due after charge-off, reinsertion without notice). build_prompt asks for every
+# signal of a string with one call and turns the result into its guidance flags.
+#
+# Matching is plain substring on the lowercased text. The phrase groups are written out
+# as `in` / `or` chains: in CPython that beats both a combined regex (which would also
+# need lookaheads to catch overlapping phrases) and any() over a tuple.
+from typing import NamedTuple
+
+class IssueSignals(NamedTuple):
+    collection: bool = False          # "collection"
+    monthly: bool = False             # reported every/each month, monthly, re-aged
+    past_due_after_co: bool = False   # "past due" plus "co" / "charge-off" / "charge off"
+    no_notice: bool = False           # says no reinsertion notice was received
+
+NO_SIGNALS = IssueSignals()
+
+def issue_signals(text: str) -> IssueSignals:
+    """Every signal in `text` (case-insensitive), lowercasing once."""
+    if not text:
+        return NO_SIGNALS
+    low = text.lower()
+    return IssueSignals(
+        "collection" in low,
+        # ("charge off every month", "monthly charge-off", "charged off each month" were
+        # listed separately before; each contains one of these.)
+        ("every month" in low or "each month" in low or "monthly" in low or "re-aging" in low
+         or "reaging" in low or "re aged" in low or "reaged" in low),
+        # "co" is deliberately a bare substring, as it always was.
+        "past due" in low and ("co" in low or "charge-off" in low or "charge off" in low),
+        ("no notice" in low or "did not receive" in low or "never received" in low
+         or "no letter" in low or "no written notice" in low),
+    )
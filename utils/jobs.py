@@ -3,10 +3,9 @@ import os, json, time, base64
 from pathlib import Path
 
 import streamlit as st
-import gspread
-from gspread.exceptions import APIError
-from gspread.utils import rowcol_to_a1
-from google.oauth2.service_account import Credentials
+from utils.lazy_imports import gspread, service_account_credentials, api_error, worksheet_not_found, rowcol_to_a1
+from utils.run_stats import counting_sheets
+from utils.background_retry import in_script_thread
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
@@ -40,6 +39,25 @@ FOLLOWUP_COLS = [
     "sms_status",         # e.g., "pending", "sent", "failed"
 ]
 
+# Per-generation LLM telemetry (JSON: model, mode, tokens, wall_s, ttft_s)
+TELEMETRY_COLS = [
+    "llm_metrics",
+]
+
+# Statuses owned by the offline worker (utils/bulk_jobs.py). Interactive Step 8 rows use
+# "queued"; only requeue_job (or a pro-plan batch) hands a row to the worker, and the worker
+# marks what it took as in flight so a second pass or a user edit can't be overwritten.
+BULK_QUEUED   = "bulk_queued"
+BULK_INFLIGHT = "bulk_inflight"
+
+# Offline worker bookkeeping: which batch holds an in-flight row, when it was claimed,
+# and how many times the worker has taken it (reset by requeue_job)
+BULK_COLS = [
+    "bulk_batch_id",
+    "bulk_claimed_at",
+    "bulk_attempts",
+]
+
 # Your main headers (keep as-is to match your sheet)
 HEADERS = [
     "letter_id", "status", "email", "bureau", "dispute_type", "round_name",
@@ -50,13 +68,17 @@ def now_local_str():
     return datetime.now(LOCAL_TZ).strftime("%Y-%m-%d %H:%M:%S")
 
 def _with_backoff(fn, *args, **kwargs):
-    """Retry Sheets calls on quota/429; raise last error if all retries fail."""
+    """
+    Retry Sheets calls on quota/429; raise last error if all retries fail.
+    In a Streamlit script thread there is one attempt: the page hands a write that hit
+    quota to utils.background_retry instead of sleeping here.
+    """
     delay = 1.5
     last_exc = None
-    for _ in range(5):
+    for _ in range(1 if in_script_thread() else 5):
         try:
             return fn(*args, **kwargs)
-        except APIError as e:
+        except api_error() as e:
             last_exc = e
             msg = str(e).lower()
             if "429" in msg or "quota" in msg:
@@ -79,25 +101,25 @@ def _client():
 
     # 1) Streamlit Secrets
     if "gcp_service_account" in st.secrets:
-        creds = Credentials.from_service_account_info(
+        creds = service_account_credentials().from_service_account_info(
             st.secrets["gcp_service_account"], scopes=SCOPE
         )
 
     # 2) Base64 env var
     elif os.getenv("GCP_CREDS_B64"):
         info = json.loads(base64.b64decode(os.environ["GCP_CREDS_B64"]).decode("utf-8"))
-        creds = Credentials.from_service_account_info(info, scopes=SCOPE)
+        creds = service_account_credentials().from_service_account_info(info, scopes=SCOPE)
 
     # 3) File path (local/dev)
     elif GA_CRED_PATH and os.path.exists(GA_CRED_PATH):
-        creds = Credentials.from_service_account_file(GA_CRED_PATH, scopes=SCOPE)
+        creds = service_account_credentials().from_service_account_file(GA_CRED_PATH, scopes=SCOPE)
 
     # 4) Local repo file (local/dev)
     else:
         project_root = Path(__file__).resolve().parents[1]
         guess = project_root / os.getenv("GOOGLE_CREDS_PATH", "google_creds.json")
         if guess.exists():
-            creds = Credentials.from_service_account_file(str(guess), scopes=SCOPE)
+            creds = service_account_credentials().from_service_account_file(str(guess), scopes=SCOPE)
 
     if creds is None:
         raise FileNotFoundError(
@@ -109,7 +131,7 @@ def _client():
             "JOBS_SHEET_ID is not set. Add it to Streamlit Secrets (or env)."
         )
 
-    return gspread.authorize(creds)
+    return counting_sheets(gspread().authorize(creds))
 
 def _open_jobs_ws():
     """
@@ -123,7 +145,7 @@ def _open_jobs_ws():
     sh = _with_backoff(gc.open_by_key, JOBS_SHEET_ID)
     try:
         ws = _with_backoff(sh.worksheet, "Jobs")
-    except gspread.WorksheetNotFound:
+    except worksheet_not_found():
         # try to use the first sheet if it already has our headers
         ws = sh.sheet1
         first_row = _with_backoff(ws.row_values, 1) or []
@@ -164,11 +186,11 @@ def _ensure_min_cols(ws, min_cols: int):
 
 def _ensure_followup_columns(ws):
     """
-    Guarantee FOLLOWUP_COLS exist on header row; grow grid first if needed,
-    then write missing headers in one range update.
+    Guarantee FOLLOWUP_COLS (and TELEMETRY_COLS, BULK_COLS) exist on header row; grow grid
+    first if needed, then write missing headers in one range update.
     """
     headers = _with_backoff(ws.row_values, 1) or []
-    missing = [h for h in FOLLOWUP_COLS if h not in headers]
+    missing = [h for h in FOLLOWUP_COLS + TELEMETRY_COLS + BULK_COLS if h not in headers]
     if not missing:
         return
 
@@ -188,27 +210,16 @@ def _pick_header(headers: list[str], options: list[str]) -> str | None:
             return lowers[opt.lower()]
     return None
 
-def add_job_row(letter_id: str, email: str, bureau: str, dispute_type: str,
-                round_name: str, payload: dict):
-    """
-    Append ONE row including follow-up columns — no extra reads after append.
-    Keeps API traffic low to avoid 429s.
-    """
-    ws = _open_jobs_ws()
-
-    # ensure follow-up headers exist (single update to header row)
-    _ensure_followup_columns(ws)
-
-    # snapshot headers and build index map
-    headers = _with_backoff(ws.row_values, 1) or []
-    colmap  = {h: i for i, h in enumerate(headers)}  # 0-based
+def _job_row(headers: list[str], created_ts: str, letter_id: str, email: str, bureau: str,
+             dispute_type: str, round_name: str, payload: dict, llm_metrics: dict | None = None,
+             qa_notes: str = "", status: str = "queued") -> list:
+    """Build one full Jobs row (core + follow-up columns) sized to the header row."""
+    colmap = {h: i for i, h in enumerate(headers)}  # 0-based
 
     # choose whichever timestamp headers your sheet actually has
     created_hdr = _pick_header(headers, ["created_at_local", "created_at"])
     updated_hdr = _pick_header(headers, ["updated_at_local", "updated_at"])
 
-    created_ts = now_local_str()
-
     # derive follow-up values from payload
     user   = (payload or {}).get("user", {}) or {}
     phone  = (user.get("phone") or "").strip()
@@ -228,7 +239,7 @@ def add_job_row(letter_id: str, email: str, bureau: str, dispute_type: str,
 
     # core cols
     setv("letter_id", letter_id)
-    setv("status", "queued")
+    setv("status", status or "queued")
     setv("email", email)
     setv("bureau", bureau)
     setv("dispute_type", dispute_type)
@@ -237,7 +248,7 @@ def add_job_row(letter_id: str, email: str, bureau: str, dispute_type: str,
     setv("round_name", round_name)
     setv("payload_json", json.dumps(payload, ensure_ascii=False))
     setv("letter_text", "")
-    setv("qa_notes", "")
+    setv("qa_notes", qa_notes or "")
     if created_hdr: setv(created_hdr, created_ts)
     if updated_hdr: setv(updated_hdr, created_ts)
 
@@ -248,8 +259,50 @@ def add_job_row(letter_id: str, email: str, bureau: str, dispute_type: str,
     setv("last_sms_at", "")
     setv("sms_status", "pending" if (sms_ok and phone) else "")
 
+    if llm_metrics:
+        setv("llm_metrics", json.dumps(llm_metrics, ensure_ascii=False))
+    return row
+
+def add_job_row(letter_id: str, email: str, bureau: str, dispute_type: str,
+                round_name: str, payload: dict):
+    """
+    Append ONE row including follow-up columns — no extra reads after append.
+    Keeps API traffic low to avoid 429s.
+    """
+    add_job_rows([{
+        "letter_id": letter_id,
+        "email": email,
+        "bureau": bureau,
+        "dispute_type": dispute_type,
+        "round_name": round_name,
+        "payload": payload,
+    }])
+
+def add_job_rows(jobs: list[dict]):
+    """
+    Append several jobs (each a dict of add_job_row's arguments, plus optional
+    "llm_metrics" / "qa_notes" / "status") with a single append_rows call — e.g.
+    one intake fanned out to several bureaus.
+    """
+    if not jobs:
+        return
+    ws = _open_jobs_ws()
+
+    # ensure follow-up headers exist (single update to header row)
+    _ensure_followup_columns(ws)
+
+    # snapshot headers once for the whole batch
+    headers = _with_backoff(ws.row_values, 1) or []
+    created_ts = now_local_str()
+    rows = [
+        _job_row(headers, created_ts, j["letter_id"], j.get("email", ""), j.get("bureau", ""),
+                 j.get("dispute_type", ""), j.get("round_name", ""), j.get("payload") or {},
+                 j.get("llm_metrics"), j.get("qa_notes", ""), j.get("status", "queued"))
+        for j in jobs
+    ]
+
     # one API call
-    _with_backoff(ws.append_row, row, value_input_option="USER_ENTERED")
+    _with_backoff(ws.append_rows, rows, value_input_option="USER_ENTERED")
 
 def get_job_by_id(letter_id: str) -> dict | None:
     ws = _open_jobs_ws()
@@ -280,9 +333,12 @@ def list_jobs_for_email(email: str, limit: int = 25) -> list[dict]:
     if _LIST_CACHE["key"] == key and (time.time() - _LIST_CACHE["ts"] < 20):
         return _LIST_CACHE["rows"]
 
+    # Single attempt per read: Step 8 calls this from the script thread, so a 429 is raised
+    # at once and retried in the background (utils.background_retry) while it shows the
+    # last good list.
     ws = _open_jobs_ws()
-    headers = _with_backoff(ws.row_values, 1) or []
-    rows = _with_backoff(ws.get_all_values) or []
+    headers = ws.row_values(1) or []
+    rows = ws.get_all_values() or []
     out = []
     low = (email or "").lower()
     for i in range(1, len(rows)):
@@ -358,6 +414,150 @@ def update_job_fields(letter_id: str, **fields):
     if updates:
         _with_backoff(ws.batch_update, updates, value_input_option="USER_ENTERED")
 
+def attach_llm_metrics(letter_id: str, metrics: dict, **fields):
+    """
+    Store one generation's telemetry (JSON) in the job's llm_metrics column,
+    plus any other columns (e.g. qa_notes, status) in the same write.
+    """
+    ws = _open_jobs_ws()
+    _ensure_followup_columns(ws)
+    update_job_fields(letter_id, llm_metrics=metrics, **fields)
+
+def list_sms_followups_due(limit: int = 1000) -> list[dict]:
+    """
+    Jobs whose first follow-up SMS is due: sms_status 'pending', opted in,
+    phone present and first_sms_due_at (YYYY-MM-DD, local) on or before today.
+    """
+    ws = _open_jobs_ws()
+    headers = _with_backoff(ws.row_values, 1) or []
+    if "sms_status" not in headers:
+        return []
+    rows = _with_backoff(ws.get_all_values) or []
+    today = datetime.now(LOCAL_TZ).strftime("%Y-%m-%d")
+    out = []
+    for i in range(1, len(rows)):
+        r = rows[i]
+        rec = {h: (r[idx] if idx < len(r) else "") for idx, h in enumerate(headers)}
+        due = (rec.get("first_sms_due_at") or "").strip()[:10]
+        if (rec.get("sms_status") or "").strip().lower() != "pending":
+            continue
+        if (rec.get("sms_opt_in") or "").strip().upper() not in {"TRUE", "1", "YES"}:
+            continue
+        if not (rec.get("phone_cached") or "").strip() or not due or due > today:
+            continue
+        out.append(rec)
+        if len(out) >= limit:
+            break
+    return out
+
+def mark_sms_results(results: dict[str, bool]):
+    """
+    Write follow-up SMS outcomes ({letter_id: ok}) back in ONE batch_update:
+    sms_status -> sent/failed, last_sms_at -> now (local).
+    """
+    if not results:
+        return
+    ws = _open_jobs_ws()
+    headers = _with_backoff(ws.row_values, 1) or []
+    colmap = {h: idx + 1 for idx, h in enumerate(headers)}
+    rows = _with_backoff(ws.get_all_values) or []
+    updated_hdr = _pick_header(headers, ["updated_at_local", "updated_at"])
+    now = now_local_str()
+
+    updates = []
+    for i in range(1, len(rows)):
+        lid = rows[i][0] if rows[i] else ""
+        if lid not in results:
+            continue
+        fields = {"sms_status": "sent" if results[lid] else "failed", "last_sms_at": now}
+        if updated_hdr:
+            fields[updated_hdr] = now
+        for k, v in fields.items():
+            c = colmap.get(k)
+            if c:
+                updates.append({"range": rowcol_to_a1(i + 1, c), "values": [[v]]})
+    if updates:
+        _with_backoff(ws.batch_update, updates, value_input_option="USER_ENTERED")
+
+def list_jobs_by_status(status: str = BULK_QUEUED, limit: int = 500) -> list[dict]:
+    """Jobs with this status, oldest first."""
+    ws = _open_jobs_ws()
+    headers = _with_backoff(ws.row_values, 1) or []
+    rows = _with_backoff(ws.get_all_values) or []
+    want = (status or "").strip().lower()
+    out = []
+    for i in range(1, len(rows)):
+        r = rows[i]
+        rec = {h: (r[idx] if idx < len(r) else "") for idx, h in enumerate(headers)}
+        if (rec.get("status") or "").strip().lower() != want:
+            continue
+        out.append(rec)
+        if len(out) >= limit:
+            break
+    return out
+
+def claim_bulk_jobs(limit: int = 500) -> list[dict]:
+    """
+    Take up to `limit` bulk_queued rows for the offline worker: their status is set to
+    bulk_inflight, bulk_claimed_at stamped and bulk_attempts bumped (ONE batch_update)
+    before anything is submitted. Returns the rows, with their new bulk_attempts.
+    """
+    jobs = [j for j in list_jobs_by_status(BULK_QUEUED, limit=limit) if j.get("letter_id")]
+    now = now_local_str()
+    for j in jobs:
+        try:
+            j["bulk_attempts"] = int(j.get("bulk_attempts") or 0) + 1
+        except ValueError:
+            j["bulk_attempts"] = 1
+    lost = set(write_job_results(
+        {j["letter_id"]: {"status": BULK_INFLIGHT, "bulk_batch_id": "", "bulk_claimed_at": now,
+                          "bulk_attempts": j["bulk_attempts"]} for j in jobs},
+        only_status=BULK_QUEUED,
+    ))
+    return [j for j in jobs if j["letter_id"] not in lost]
+
+def write_job_results(results: dict[str, dict], only_status: str | None = None) -> list[str]:
+    """
+    Write many jobs' columns ({letter_id: {column: value}}) back in ONE batch_update,
+    stamping updated_at on each. Unknown columns and letter_ids are skipped, and so are
+    rows whose current status is not only_status (when given). Returns the skipped ids.
+    """
+    if not results:
+        return []
+    ws = _open_jobs_ws()
+    _ensure_followup_columns(ws)
+    headers = _with_backoff(ws.row_values, 1) or []
+    colmap = {h: idx + 1 for idx, h in enumerate(headers)}
+    rows = _with_backoff(ws.get_all_values) or []
+    updated_hdr = _pick_header(headers, ["updated_at_local", "updated_at"])
+    now = now_local_str()
+
+    status_idx = headers.index("status") if "status" in headers else None
+    skipped = set(results)
+    updates = []
+    for i in range(1, len(rows)):
+        lid = rows[i][0] if rows[i] else ""
+        if lid not in results:
+            continue
+        if only_status is not None and status_idx is not None:
+            current = rows[i][status_idx] if status_idx < len(rows[i]) else ""
+            if current.strip().lower() != only_status:
+                continue
+        skipped.discard(lid)
+        fields = dict(results[lid])
+        if updated_hdr and updated_hdr not in fields:
+            fields[updated_hdr] = now
+        for k, v in fields.items():
+            c = colmap.get(k)
+            if not c:
+                continue
+            if isinstance(v, (dict, list)):
+                v = json.dumps(v, ensure_ascii=False)
+            updates.append({"range": rowcol_to_a1(i + 1, c), "values": [[v]]})
+    if updates:
+        _with_backoff(ws.batch_update, updates, value_input_option="USER_ENTERED")
+    return sorted(skipped)
+
 def find_job_in_list(jobs: list[dict], letter_id: str) -> dict | None:
     """Return the job dict with this letter_id from a pre-fetched list; None if not found."""
     lid = (letter_id or "").strip()
@@ -370,10 +570,10 @@ def find_job_in_list(jobs: list[dict], letter_id: str) -> dict | None:
 
 def requeue_job(letter_id: str, payload: dict | None = None):
     """
-    Set status back to 'queued', optionally replace payload_json,
-    and clear qa_notes so the worker starts fresh.
+    Hand a job to the offline worker (status bulk_queued), optionally replace
+    payload_json, and clear qa_notes and bulk_attempts so the worker starts fresh.
     """
-    fields = {"status": "queued", "qa_notes": ""}
+    fields = {"status": BULK_QUEUED, "qa_notes": "", "bulk_attempts": 0}
     if payload is not None:
         fields["payload_json"] = json.dumps(payload, ensure_ascii=False)
     update_job_fields(letter_id, **fields)
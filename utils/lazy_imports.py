@@ -0,0 +1,43 @@
+# utils/lazy_imports.py
+# Accessors for the heavy third-party libraries (gspread + google-auth, bcrypt, fpdf,
+# pandas). Each imports its library on first call, so a script run that never touches
+# Sheets, passwords, PDFs or DataFrames (the public landing page, a fresh worker before
+# its first job) never pays for them. The OpenAI client is built the same way by
+# utils.llm.get_client. `python -m utils.startup_audit` checks the import paths stay lean.
+#
+# Exception classes are accessors too, so `except api_error():` only imports gspread
+# when an exception actually reaches the handler.
+import importlib
+
+def _module(name: str):
+    return importlib.import_module(name)  # sys.modules after the first call
+
+# ---------- Google Sheets ----------
+
+def gspread():
+    return _module("gspread")
+
+def service_account_credentials():
+    """google.oauth2.service_account.Credentials"""
+    return _module("google.oauth2.service_account").Credentials
+
+def api_error():
+    return _module("gspread.exceptions").APIError
+
+def worksheet_not_found():
+    return _module("gspread.exceptions").WorksheetNotFound
+
+def rowcol_to_a1(row: int, col: int) -> str:
+    return _module("gspread.utils").rowcol_to_a1(row, col)
+
+# ---------- passwords / files ----------
+
+def bcrypt():
+    return _module("bcrypt")
+
+def fpdf():
+    """The FPDF class."""
+    return _module("fpdf").FPDF
+
+def pandas():
+    return _module("pandas")
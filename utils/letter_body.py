@@ -0,0 +1,250 @@
+# utils/letter_body.py
+# Wizard inputs -> letter body: snapshot build_prompt's inputs from session state,
+# hash them, and run the routed LLM call. Shared by Step 8 and speculative generation.
+# Personal Info letters can skip the model (pi_template) per plan or when it is slow/down;
+# with SECTIONED_LETTERS=1 other letters are built from cached paragraphs (letter_sections).
+import os, re, json, time, hashlib, logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from dotenv import load_dotenv
+
+from utils.prompt_builder import build_prompt, normalize_round
+from utils.issue_signals import issue_signals
+from utils.llm_router import complete
+from utils.metrics import record_llm_call
+from utils.pi_template import render_pi_body
+from utils.run_stats import in_session
+from utils import letter_sections
+
+load_dotenv()
+
+log = logging.getLogger("boostbridge.letter_body")
+
+# Plans whose Personal Info letters always use the template (e.g. "individual,pro").
+PI_TEMPLATE_PLANS = {p.strip().lower() for p in os.getenv("PI_TEMPLATE_PLANS", "").split(",") if p.strip()}
+# Other plans try the model first and fall back to the template past this deadline or on error.
+PI_LLM_DEADLINE_S = float(os.getenv("PI_LLM_DEADLINE_S", "10"))
+
+SYSTEM_PROMPT = (
+    "You are a credit repair expert. "
+    "Return ONLY the body paragraphs of the dispute letter. "
+    "No header, no date, no salutation, no signature."
+)
+
+BUREAU_ADDRESSES = {
+    "Equifax": "Equifax Information Services LLC\nP.O. Box 740256\nAtlanta, GA 30374",
+    "Experian": "Experian\nP.O. Box 4500\nAllen, TX 75013",
+    "TransUnion": "TransUnion Consumer Solutions\nP.O. Box 2000\nChester, PA 19016-2000",
+}
+
+# build_prompt covers at most this many account_items; longer lists are split into
+# several letters (chunk_account_items).
+MAX_ITEMS_PER_LETTER = 5
+
+# build_prompt only uses the bureau on its "Context" line, so a fan-out builds the
+# prompt once with this slot and fills it per bureau.
+_BUREAU_SLOT = "\x00bureau\x00"
+
+_PI_POOL = {"pool": None}
+
+def _pi_pool() -> ThreadPoolExecutor:
+    if _PI_POOL["pool"] is None:
+        _PI_POOL["pool"] = ThreadPoolExecutor(max_workers=8, thread_name_prefix="pi-llm")
+    return _PI_POOL["pool"]
+
+def inputs_from_state(state) -> dict:
+    """
+    Snapshot the build_prompt inputs from session state as plain JSON data
+    (a deep copy, so it is safe to hand to a background thread).
+    """
+    snap = {
+        "user_info":       state.get("user_info", {}) or {},
+        "dispute_details": state.get("dispute_details", {}) or {},
+        "dispute_types":   state.get("dispute_types", []) or [],
+        "bureau":          state.get("selected_bureau", ""),
+        "round_num":       state.get("dispute_round", "Round 1"),
+        "law_selection":   state.get("law_selection", []) or [],
+        "strategy":        state.get("round_strategy"),
+    }
+    return json.loads(json.dumps(snap, default=str))
+
+def input_key(inputs: dict) -> str:
+    """Stable hash of a snapshot; equal keys mean build_prompt would see identical inputs."""
+    raw = json.dumps(inputs, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+def _complete_prompt(prompt: str, inputs: dict) -> tuple[str, dict]:
+    mode, strategy = normalize_round(inputs.get("round_num"), inputs.get("strategy"))
+    return complete(
+        mode,
+        strategy,
+        [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0.6,
+    )
+
+def uses_pi_template(inputs: dict, plan: str | None = None) -> bool:
+    """True if this letter is rendered from the PI template without asking the model."""
+    mode, _ = normalize_round(inputs.get("round_num"), inputs.get("strategy"))
+    return mode == "pi" and (plan or "").strip().lower() in PI_TEMPLATE_PLANS
+
+def _template_body(inputs: dict, reason: str) -> tuple[str, dict]:
+    t0 = time.monotonic()
+    text = render_pi_body(inputs)
+    wall = round(time.monotonic() - t0, 4)
+    record_llm_call("letter", mode="pi", model="template", wall_s=wall, fell_back=reason != "plan")
+    return text, {
+        "model": "template", "mode": "pi", "strategy": "", "seconds": wall, "ttft_s": None,
+        "fell_back": reason != "plan", "hedged": False, "reason": f"pi template: {reason}",
+        "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0,
+    }
+
+def _sectioned(inputs: dict) -> bool:
+    mode, _ = normalize_round(inputs.get("round_num"), inputs.get("strategy"))
+    return letter_sections.SECTIONED_ENABLED and mode != "pi"
+
+def _body_for(prompt: str, inputs: dict, plan: str | None = None, cache=None) -> tuple[str, dict]:
+    """Routed completion, or the PI template (by plan, or when the model is slow or fails)."""
+    if uses_pi_template(inputs, plan):
+        return _template_body(inputs, "plan")
+    mode, _ = normalize_round(inputs.get("round_num"), inputs.get("strategy"))
+    if mode != "pi":
+        if letter_sections.SECTIONED_ENABLED:
+            return letter_sections.generate_sectioned(inputs, cache)
+        return _complete_prompt(prompt, inputs)
+
+    fut = _pi_pool().submit(in_session(_complete_prompt), prompt, inputs)
+    try:
+        return fut.result(timeout=PI_LLM_DEADLINE_S)
+    except FutureTimeout:
+        # the call keeps running and is simply never read
+        log.warning("PI completion over %.1fs; using template", PI_LLM_DEADLINE_S)
+        return _template_body(inputs, "llm slow")
+    except Exception as e:
+        log.warning("PI completion failed (%s); using template", e.__class__.__name__)
+        return _template_body(inputs, f"llm error {e.__class__.__name__}")
+
+def generate_body(inputs: dict, plan: str | None = None, cache=None) -> tuple[str, dict]:
+    """
+    Build the prompt and run it on the routed model (or the PI template). Returns (raw_body, info).
+    cache is the session's letter_sections.section_cache, for sectioned letters.
+    """
+    if uses_pi_template(inputs, plan):
+        return _template_body(inputs, "plan")
+    if _sectioned(inputs):
+        return letter_sections.generate_sectioned(inputs, cache)
+    return _body_for(build_prompt(**inputs), inputs, plan, cache)
+
+def generate_bodies(inputs: dict, bureaus: list[str], plan: str | None = None,
+                    cache=None) -> dict[str, tuple[str, dict] | Exception]:
+    """
+    Fan one intake out to several bureaus: build the prompt once, then run one
+    completion per bureau concurrently. Returns {bureau: (raw_body, info)} or
+    {bureau: exception} for a bureau whose call failed.
+    """
+    out = {}
+    if _sectioned(inputs) and len(bureaus) > 1:
+        # only the opening names the bureau: generate the first letter, and the rest
+        # reuse its fact and closing paragraphs from the section cache
+        try:
+            out[bureaus[0]] = letter_sections.generate_sectioned(dict(inputs, bureau=bureaus[0]), cache)
+        except Exception as e:
+            out[bureaus[0]] = e
+        bureaus = bureaus[1:]
+
+    shared = build_prompt(**dict(inputs, bureau=_BUREAU_SLOT))
+    with ThreadPoolExecutor(max_workers=max(1, len(bureaus)), thread_name_prefix="fanout") as pool:
+        futs = {
+            b: pool.submit(in_session(_body_for), shared.replace(_BUREAU_SLOT, b), dict(inputs, bureau=b), plan, cache)
+            for b in bureaus
+        }
+        for b, fut in futs.items():
+            try:
+                out[b] = fut.result()
+            except Exception as e:
+                out[b] = e
+    return out
+
+def _signal_group(item: dict) -> int:
+    """Sort key grouping items whose issues call for the same requests and hints."""
+    sig = issue_signals(item.get("issue") or "")
+    if sig.collection:
+        return 0
+    if sig.monthly or sig.past_due_after_co:
+        return 1
+    return 2
+
+def chunk_account_items(items: list[dict], size: int = MAX_ITEMS_PER_LETTER) -> list[list[dict]]:
+    """
+    Split account items into letter-sized groups: as few letters as possible, sizes as
+    even as possible, and items with the same kind of issue (collections, re-aging /
+    past-due after charge-off, other) kept together so each letter's guidance fits it.
+    """
+    if len(items) <= size:
+        return [list(items)]
+    ordered = sorted(items, key=_signal_group)  # stable: user order within a group
+    n = -(-len(ordered) // size)
+    base, extra = divmod(len(ordered), n)
+    chunks, i = [], 0
+    for k in range(n):
+        step = base + (1 if k < extra else 0)
+        chunks.append(ordered[i:i + step])
+        i += step
+    return chunks
+
+def split_inputs(inputs: dict) -> list[dict]:
+    """One inputs snapshot per letter: the intake itself, or one per chunk of account_items."""
+    dd = inputs.get("dispute_details") or {}
+    items = dd.get("account_items")
+    if not isinstance(items, list) or len(items) <= MAX_ITEMS_PER_LETTER:
+        return [inputs]
+    return [dict(inputs, dispute_details=dict(dd, account_items=chunk)) for chunk in chunk_account_items(items)]
+
+def generate_parts(parts: list[dict], bureaus: list[str], plan: str | None = None, cache=None) -> list[dict]:
+    """
+    Generate every (part, bureau) letter at once: one generate_bodies fan-out per part,
+    all parts concurrently. Returns [{bureau: (raw_body, info) | Exception}] in part order.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, len(parts)), thread_name_prefix="parts") as pool:
+        futs = [pool.submit(in_session(generate_bodies), p, bureaus, plan, cache) for p in parts]
+        out = []
+        for fut in futs:
+            try:
+                out.append(fut.result())
+            except Exception as e:
+                out.append({b: e for b in bureaus})
+        return out
+
+def strip_salutation_and_signature(text: str) -> str:
+    t = text.strip()
+    t = re.sub(r'^(?:\s*(?:dear\b[^\n]*,|to whom[^\n]*,?|hello[^\n]*,?)\s*\n)+','',t,flags=re.IGNORECASE).lstrip()
+    t = re.sub(r'\n\s*(?:dear\b[^\n]*,|to whom[^\n]*,?|hello[^\n]*,?)\s*\n','\n',t,flags=re.IGNORECASE)
+    t = re.split(r'\n\s*(?:sincerely|regards|respectfully)\b.*', t, flags=re.IGNORECASE)[0].rstrip()
+    return re.sub(r'\n{3,}', '\n\n', t)
+
+def assemble_letter(user_info: dict, bureau: str, raw_body: str) -> str:
+    """Consumer header + bureau address + date + salutation, the body, and the signature."""
+    body = strip_salutation_and_signature(raw_body)
+    full_name = user_info.get("full_name", "")
+    address = user_info.get("address", "")
+    city = user_info.get("city", "")
+    state = user_info.get("state", "")
+    zip_code = user_info.get("zip") or user_info.get("zip_code", "")
+    dob = user_info.get("dob", "")
+    ssn_last4 = user_info.get("ssn_last4", "")
+    bureau_block = BUREAU_ADDRESSES.get(bureau, bureau)
+    today_str = datetime.now().strftime("%B %d, %Y")
+
+    dob_line = f"Date of Birth: {dob}\n" if dob else ""
+    ssn_line = f"SSN Last 4: {ssn_last4}\n" if ssn_last4 else ""
+
+    header_block = (
+        f"{full_name}\n{address}\n{city}, {state} {zip_code}\n\n"
+        f"{dob_line}{ssn_line}\n"
+        f"{bureau_block}\n\n{today_str}\n\n"
+        f"Dear {bureau},\n"
+    )
+    signature = f"\nSincerely,\n{full_name}"
+    return f"{header_block}\n{body}{signature}"
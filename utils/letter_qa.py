@@ -0,0 +1,138 @@
+# utils/letter_qa.py
+# Local, rule-based QA for a generated letter body. Checks the body against the
+# build_prompt contract (word range, requested remedies, account facts, forbidden
+# phrasing) and returns structured notes for the Jobs sheet's qa_notes column.
+import re, json
+
+from utils.prompt_builder import build_prompt, normalize_round, word_range_bounds
+
+WORD_SLACK = 0.10          # outside the range by more than this -> error, else warning
+REQUEST_MIN_OVERLAP = 0.4  # share of a request bullet's key words the body must echo
+
+_STOP = {
+    "the", "and", "that", "this", "with", "from", "have", "been", "were", "into", "them",
+    "then", "than", "only", "also", "such", "will", "would", "should", "could", "your",
+    "their", "there", "these", "those", "which", "where", "when", "what", "item", "items",
+    "file", "apply", "send", "copy", "please", "ensure", "provide", "cannot", "across",
+    "versions", "updated", "report", "include", "applicable", "within", "normal", "timeline",
+}
+
+_WORD_RE = re.compile(r"[A-Za-z][A-Za-z'’-]+")
+_BULLET_RE = re.compile(r"^\s*-\s+(.*\S)\s*$")
+
+# first-person denial of ownership (only allowed when identity theft / mixed file is in play)
+_DENIAL_RE = re.compile(
+    r"\b(?:not\s+mine|isn['’]?t\s+mine|is\s+not\s+my\s+(?:account|debt)|"
+    r"never\s+(?:opened|owned|had)\s+(?:this|that|the|an?)\b|does\s+not\s+belong\s+to\s+me|"
+    r"doesn['’]t\s+belong\s+to\s+me|i\s+do\s+not\s+owe|i\s+don['’]t\s+owe)",
+    re.IGNORECASE,
+)
+_SALUTATION_RE = re.compile(r"^\s*(?:dear\b|to whom it may concern|hello\b)", re.IGNORECASE | re.MULTILINE)
+_SIGNOFF_RE = re.compile(r"^\s*(?:sincerely|regards|best regards|respectfully|thank you,?)\s*,?\s*$",
+                         re.IGNORECASE | re.MULTILINE)
+_PLACEHOLDER_RE = re.compile(r"\[(?:your|insert|name|date|address|account)[^\]]*\]", re.IGNORECASE)
+
+def _stem(w: str) -> str:
+    """Crude prefix stem: "verified"/"verification" -> "verif", "reinvestigation" -> "inves"."""
+    w = w.lower().replace("’", "'")
+    if w.startswith("rein") and len(w) > 8:
+        w = w[2:]
+    return w[:5]
+
+def _key_words(text: str) -> set[str]:
+    return {_stem(w) for w in _WORD_RE.findall(text) if len(w) > 3 and w.lower() not in _STOP}
+
+def _bullets(prompt: str, header: str) -> list[str]:
+    """Bullet lines that follow `header` in the prompt, up to the next blank line."""
+    idx = prompt.find(header)
+    if idx < 0:
+        return []
+    out = []
+    for line in prompt[idx + len(header):].splitlines()[1:]:
+        if not line.strip():
+            if out:
+                break
+            continue
+        m = _BULLET_RE.match(line)
+        if m:
+            out.append(m.group(1))
+        elif out:
+            break
+    return out
+
+def _fact_refs(fact: str) -> list[str]:
+    """Tokens a letter should mention for an account-like fact: furnisher/agency name and last4."""
+    refs = []
+    m = re.search(r"(?:Furnisher|Agency|Creditor|Name):\s*([^;]+)", fact)
+    if m and m.group(1).strip().lower() not in {"unknown", "n/a", ""}:
+        refs.append(m.group(1).strip())
+    m = re.search(r"Last4:\s*(\d{2,4})", fact)
+    if m:
+        refs.append(m.group(1))
+    return refs
+
+def check_letter(body: str, inputs: dict) -> dict:
+    """
+    QA one letter body against the prompt it was generated from.
+    `inputs` are build_prompt's keyword arguments (see letter_body.inputs_from_state).
+    Returns {"status": "ok"|"needs_fix", "mode", "word_count", "word_range", "issues": [...]},
+    each issue {"check", "severity": "error"|"warn", "detail"}.
+    """
+    body = body or ""
+    prompt = build_prompt(**inputs)
+    mode, strategy = normalize_round(inputs.get("round_num"), inputs.get("strategy"))
+    lo, hi = word_range_bounds(mode, strategy)
+    issues = []
+
+    def issue(check, severity, detail):
+        issues.append({"check": check, "severity": severity, "detail": detail})
+
+    # 1) length
+    n_words = len(_WORD_RE.findall(body))
+    if n_words < lo * (1 - WORD_SLACK) or n_words > hi * (1 + WORD_SLACK):
+        issue("word_count", "error", f"{n_words} words; expected {lo}–{hi}")
+    elif n_words < lo or n_words > hi:
+        issue("word_count", "warn", f"{n_words} words; slightly outside {lo}–{hi}")
+
+    # 2) each requested remedy is echoed
+    body_words = _key_words(body)
+    for req in _bullets(prompt, "Requests to include:"):
+        want = _key_words(req)
+        if want and len(want & body_words) / len(want) < REQUEST_MIN_OVERLAP:
+            issue("request_missing", "error", req)
+
+    # 3) each account-like fact is referenced (by name or last4)
+    low_body = body.lower()
+    for fact in _bullets(prompt, "Facts to address"):
+        refs = _fact_refs(fact)
+        if refs and not any(r.lower() in low_body for r in refs):
+            issue("fact_unreferenced", "error", fact)
+
+    # 4) forbidden phrasing
+    facts_text = " ".join(_bullets(prompt, "Facts to address")).lower()
+    theft_ok = ("identity theft" in facts_text or "fraud" in facts_text or "mixed file" in facts_text)
+    if mode == "r1" and not theft_ok:
+        m = _DENIAL_RE.search(body)
+        if m:
+            issue("ownership_denial", "error", f"Round 1 must not deny ownership: \"{m.group(0)}\"")
+    m = _SALUTATION_RE.search(body)
+    if m:
+        issue("salutation", "error", f"Body contains a salutation: \"{m.group(0).strip()}\"")
+    m = _SIGNOFF_RE.search(body)
+    if m:
+        issue("signature", "error", f"Body contains a sign-off: \"{m.group(0).strip()}\"")
+    m = _PLACEHOLDER_RE.search(body)
+    if m:
+        issue("placeholder", "error", f"Unfilled placeholder: \"{m.group(0)}\"")
+
+    return {
+        "status": "needs_fix" if any(i["severity"] == "error" for i in issues) else "ok",
+        "mode": mode + (f"/{strategy}" if strategy else ""),
+        "word_count": n_words,
+        "word_range": f"{lo}–{hi}",
+        "issues": issues,
+    }
+
+def qa_notes_json(report: dict) -> str:
+    """Serialize a report for the qa_notes column."""
+    return json.dumps(report, ensure_ascii=False)
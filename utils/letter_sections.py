@@ -0,0 +1,178 @@
+# utils/letter_sections.py
+# Sectioned letter bodies for edit-and-regenerate loops. The body is generated as
+# addressable paragraphs: an opening, one per fact line, and a closing with the requests
+# and laws. Each paragraph's prompt is hashed; regenerating after a small edit re-requests
+# only the paragraphs whose prompt changed and reuses cached text for the rest.
+# The cache lives in the user's session state (section_cache), so a paragraph is only ever
+# reused for the session that generated it.
+import os, time, hashlib, logging, threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from dotenv import load_dotenv
+
+from utils.prompt_builder import VOICE, PURPOSES, prompt_parts, word_range_bounds
+from utils.llm_router import complete
+from utils.run_stats import in_session
+
+load_dotenv()
+
+log = logging.getLogger("boostbridge.letter_sections")
+
+SECTIONED_ENABLED = os.getenv("SECTIONED_LETTERS", "0").lower() in ("1", "true", "yes")
+SECTION_CACHE_MAX = int(os.getenv("SECTION_CACHE_MAX", "200"))   # paragraphs per session
+SECTION_TTL_S     = int(os.getenv("SECTION_TTL_S", "3600"))
+
+SECTION_SYSTEM_PROMPT = (
+    "You are a credit repair expert. "
+    "Return ONLY the one paragraph asked for. "
+    "No header, no date, no salutation, no signature."
+)
+
+OPENING_WORDS = (25, 40)
+CLOSING_WORDS = (40, 65)
+MIN_FACT_WORDS = (15, 25)
+
+# build_prompt adds this for an "account" type with no single-account details, even when
+# account_items are present; a paragraph about it would say nothing.
+_EMPTY_ACCOUNT = "Account — Furnisher: Unknown; Last4: N/A; Issue: N/A; Docs: N/A"
+
+STATE_KEY = "_letter_sections"
+_LOCK = threading.Lock()   # a session's cache is filled from several generation threads
+
+@lru_cache(maxsize=None)
+def section_prefix(mode: str, strategy: str = "") -> str:
+    """Shared head of every paragraph prompt for a mode (stable, so the provider can cache it)."""
+    return f"""
+Write ONE paragraph of the body of a consumer credit letter.
+The other paragraphs are written separately and joined in order, so do not greet, sign off,
+summarize the whole letter, or repeat what other paragraphs cover.
+
+{VOICE[(mode, strategy)]}
+
+Purpose: {PURPOSES[(mode, strategy)]}
+""".strip()
+
+def _word_targets(mode: str, strategy: str, n_facts: int) -> tuple[int, int]:
+    """Per-fact paragraph words so opening + facts + closing lands in the mode's range."""
+    lo, hi = word_range_bounds(mode, strategy)
+    n = max(1, n_facts)
+    f_lo = max(MIN_FACT_WORDS[0], (lo - OPENING_WORDS[0] - CLOSING_WORDS[0]) // n)
+    f_hi = max(MIN_FACT_WORDS[1], (hi - OPENING_WORDS[1] - CLOSING_WORDS[1]) // n)
+    return f_lo, max(f_lo + 5, f_hi)
+
+def plan_sections(inputs: dict) -> tuple[str, str, list[dict]]:
+    """
+    (mode, strategy, sections) for build_prompt inputs. Each section is
+    {"id": "opening" | "fact:<n>" | "closing", "prompt", "key"}; the key hashes
+    everything the paragraph depends on.
+    """
+    parts = prompt_parts(**inputs)
+    mode, s = parts["mode"], parts["strategy"]
+    facts = [ln for ln in parts["fact_lines"] if ln != _EMPTY_ACCOUNT] or parts["fact_lines"]
+    prefix = section_prefix(mode, s)
+    fa, fb = _word_targets(mode, s, len(facts))
+
+    bodies = [("opening", f"""
+Paragraph: opening ({OPENING_WORDS[0]}–{OPENING_WORDS[1]} words).
+- Bureau: {inputs.get("bureau", "")}
+- Say why I am writing: {len(facts)} item(s) on my report need review; each is described in its own paragraph after this one. Do not describe the items here.
+""")]
+    for i, line in enumerate(facts, 1):
+        bodies.append((f"fact:{i}", f"""
+Paragraph: one disputed item ({fa}–{fb} words).
+Say what is inaccurate about it and that it should be corrected or deleted. Name the furnisher and last 4 digits when given. Use only this fact; do not invent details.
+- {line}
+"""))
+    bodies.append(("closing", f"""
+Paragraph: closing ({CLOSING_WORDS[0]}–{CLOSING_WORDS[1]} words). Briefly make each request below, referring to {parts["laws"]}.
+{parts["requests"]}
+
+{parts["hints"]}
+"""))
+
+    sections = []
+    for sid, body in bodies:
+        prompt = prefix + "\n\n" + body.strip()
+        key = hashlib.sha256(f"{mode}|{s}|{prompt}".encode("utf-8")).hexdigest()[:32]
+        sections.append({"id": sid, "prompt": prompt, "key": key})
+    return mode, s, sections
+
+def section_cache(state) -> "OrderedDict[str, tuple[str, float]]":
+    """This session's paragraph cache (key -> (text, stored_at)), kept in its session state."""
+    return state.setdefault(STATE_KEY, OrderedDict())
+
+def _cached(cache, key: str) -> str | None:
+    if cache is None:
+        return None
+    with _LOCK:
+        hit = cache.get(key)
+        if not hit:
+            return None
+        if time.time() - hit[1] > SECTION_TTL_S:
+            cache.pop(key, None)
+            return None
+        cache.move_to_end(key)
+        return hit[0]
+
+def _store(cache, key: str, text: str) -> None:
+    if cache is None:
+        return
+    with _LOCK:
+        cache[key] = (text, time.time())
+        cache.move_to_end(key)
+        while len(cache) > SECTION_CACHE_MAX:
+            cache.popitem(last=False)
+
+def _generate(mode: str, strategy: str, prompt: str) -> tuple[str, dict]:
+    return complete(
+        mode,
+        strategy,
+        [
+            {"role": "system", "content": SECTION_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0.6,
+    )
+
+def generate_sectioned(inputs: dict, cache=None) -> tuple[str, dict]:
+    """
+    Letter body from cached + freshly generated paragraphs. Only paragraphs whose prompt
+    changed since they were last generated in this session's `cache` (section_cache) are
+    requested (concurrently); with no cache, every paragraph is.
+    Returns (raw_body, info) with the same keys as llm_router.complete plus "sections":
+    {"total", "reused": [ids], "regenerated": [ids]}.
+    """
+    t0 = time.monotonic()
+    mode, s, sections = plan_sections(inputs)
+    texts = {sec["key"]: _cached(cache, sec["key"]) for sec in sections}
+    todo = [sec for sec in sections if texts[sec["key"]] is None]
+
+    infos = []
+    if todo:
+        with ThreadPoolExecutor(max_workers=len(todo), thread_name_prefix="section") as pool:
+            futs = {sec["key"]: pool.submit(in_session(_generate), mode, s, sec["prompt"]) for sec in todo}
+            for key, fut in futs.items():
+                text, info = fut.result()  # a failed paragraph fails the letter, as a whole-body call would
+                texts[key] = text.strip()
+                _store(cache, key, texts[key])
+                infos.append(info)
+
+    reused = [sec["id"] for sec in sections if sec not in todo]
+    log.info("sectioned mode=%s strategy=%s reused=%d regenerated=%d",
+             mode, s or "-", len(reused), len(todo))
+    body = "\n\n".join(texts[sec["key"]] for sec in sections if texts[sec["key"]])
+    return body, {
+        "model": ",".join(sorted({i.get("model", "") for i in infos})) or "cache",
+        "mode": mode,
+        "strategy": s,
+        "seconds": round(time.monotonic() - t0, 3),
+        "ttft_s": max((i["ttft_s"] for i in infos if i.get("ttft_s") is not None), default=None),
+        "fell_back": any(i.get("fell_back") for i in infos),
+        "hedged": any(i.get("hedged") for i in infos),
+        "reason": "sectioned",
+        "prompt_tokens": sum(i.get("prompt_tokens", 0) for i in infos),
+        "completion_tokens": sum(i.get("completion_tokens", 0) for i in infos),
+        "cached_tokens": sum(i.get("cached_tokens", 0) for i in infos),
+        "sections": {"total": len(sections), "reused": reused, "regenerated": [sec["id"] for sec in todo]},
+    }
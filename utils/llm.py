@@ -0,0 +1,15 @@
+# utils/llm.py
+# Shared OpenAI access: one lazily-built client per process.
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+_CLIENT = {"client": None}
+
+def get_client():
+    """Return the process-wide OpenAI client (built on first use)."""
+    if _CLIENT["client"] is None:
+        from openai import OpenAI
+        _CLIENT["client"] = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _CLIENT["client"]
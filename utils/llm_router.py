@@ -0,0 +1,341 @@
+# utils/llm_router.py
+# Letter-generation model routing: one route per (mode, strategy) from build_prompt.
+# Each route carries a model, max_tokens sized from the mode's word range, a timeout,
+# and a fallback model used when the primary's p95 latency or error rate is over budget.
+# Optional request hedging trims the latency tail (LLM_HEDGE=1).
+import os, time, math, random, logging, threading
+from collections import deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
+
+from utils.llm import get_client
+from utils.metrics import record_llm_call, usage_from
+from utils.prompt_builder import WORD_RANGES, word_range_bounds
+from utils.token_budget import completion_tokens_for
+from utils.run_stats import count, in_session
+
+load_dotenv()
+
+log = logging.getLogger("boostbridge.llm_router")
+
+FAST_MODEL   = os.getenv("LLM_FAST_MODEL", "gpt-4o-mini")
+STRONG_MODEL = os.getenv("LLM_STRONG_MODEL", "gpt-4o")
+
+HEALTH_WINDOW      = int(os.getenv("LLM_HEALTH_WINDOW", "50"))   # recent calls per model
+HEALTH_MIN_SAMPLES = int(os.getenv("LLM_HEALTH_MIN_SAMPLES", "10"))
+HEALTH_MAX_AGE_S   = float(os.getenv("LLM_HEALTH_MAX_AGE_S", "600"))  # older samples no longer count
+# While a primary is over budget, this share of its calls still go to it so fresh samples
+# can bring it back under budget (old ones also age out after HEALTH_MAX_AGE_S).
+PROBE_SHARE        = float(os.getenv("LLM_PROBE_SHARE", "0.05"))
+
+# Hedging: if the first request has no token by the model's TTFT percentile, fire one
+# identical backup; first to finish wins and closes the loser's stream. Each attempt runs on
+# its own thread, so the primary never queues behind other sessions' requests.
+HEDGE_ENABLED      = os.getenv("LLM_HEDGE", "0").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE   = float(os.getenv("LLM_HEDGE_PERCENTILE", "90"))
+HEDGE_DEFAULT_S    = float(os.getenv("LLM_HEDGE_DEFAULT_S", "4"))    # until enough TTFT samples
+HEDGE_MIN_S        = float(os.getenv("LLM_HEDGE_MIN_S", "1"))
+HEDGE_PER_MINUTE   = int(os.getenv("LLM_HEDGE_PER_MINUTE", "6"))      # cost bound: hedges per rolling minute
+
+# PI / Round 1 (and R2 MOV, which is mostly a structured ask) go to the fast model;
+# the factual rounds keep the stronger one.
+_FAST   = {"model": FAST_MODEL,   "fallback": STRONG_MODEL, "timeout_s": 20, "p95_s": 8,  "max_error_rate": 0.2}
+_STRONG = {"model": STRONG_MODEL, "fallback": FAST_MODEL,   "timeout_s": 45, "p95_s": 25, "max_error_rate": 0.2}
+
+ROUTE_POLICY = {
+    ("pi", ""):        _FAST,
+    ("r1", ""):        _FAST,
+    ("r2", "mov"):     _FAST,
+    ("r2", "factual"): _STRONG,
+    ("r3", "mov"):     _STRONG,
+    ("r3", "factual"): _STRONG,
+}
+
+def max_tokens_for(mode: str, strategy: str = "") -> int:
+    """Completion budget for a mode: top of its word range, converted to tokens, plus headroom."""
+    _, hi = word_range_bounds(mode, strategy)
+    return completion_tokens_for(hi)
+
+ROUTES = {
+    key: dict(policy, max_tokens=max_tokens_for(*key))
+    for key, policy in ROUTE_POLICY.items()
+    if key in WORD_RANGES
+}
+
+# ---------- per-model health (rolling window, process-wide) ----------
+_HEALTH: dict[str, deque] = {}
+_TTFT: dict[str, deque] = {}
+_HEALTH_LOCK = threading.Lock()
+
+def record(model: str, seconds: float, ok: bool, ttft: float | None = None) -> None:
+    with _HEALTH_LOCK:
+        _HEALTH.setdefault(model, deque(maxlen=HEALTH_WINDOW)).append((time.monotonic(), seconds, ok))
+        if ttft is not None:
+            _TTFT.setdefault(model, deque(maxlen=HEALTH_WINDOW)).append(ttft)
+
+def model_health(model: str) -> dict:
+    """
+    {"n", "p95_s", "error_rate"} over the recent window (the last HEALTH_WINDOW calls no older
+    than HEALTH_MAX_AGE_S); p95 is None until there are samples.
+    """
+    cutoff = time.monotonic() - HEALTH_MAX_AGE_S
+    with _HEALTH_LOCK:
+        samples = [(s, ok) for t, s, ok in _HEALTH.get(model, ()) if t >= cutoff]
+    if not samples:
+        return {"n": 0, "p95_s": None, "error_rate": 0.0}
+    lat = sorted(s for s, _ in samples)
+    p95 = lat[min(len(lat) - 1, int(math.ceil(0.95 * len(lat))) - 1)]
+    errors = sum(1 for _, ok in samples if not ok)
+    return {"n": len(samples), "p95_s": p95, "error_rate": errors / len(samples)}
+
+def _over_budget(route: dict) -> str | None:
+    h = model_health(route["model"])
+    if h["n"] < HEALTH_MIN_SAMPLES:
+        return None
+    if h["error_rate"] > route["max_error_rate"]:
+        return f"error rate {h['error_rate']:.0%} > {route['max_error_rate']:.0%}"
+    if h["p95_s"] is not None and h["p95_s"] > route["p95_s"]:
+        return f"p95 {h['p95_s']:.1f}s > {route['p95_s']}s"
+    return None
+
+# ---------- prompt-cache accounting ----------
+# build_prompt puts a byte-identical (mode, strategy) prefix first; these totals show
+# how much of it the provider actually served from its prompt cache.
+_USAGE: dict[tuple, dict] = {}
+
+def _record_usage(mode: str, strategy: str, usage: dict) -> None:
+    with _HEALTH_LOCK:
+        tot = _USAGE.setdefault((mode, strategy or ""), {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0})
+        tot["calls"] += 1
+        tot["prompt_tokens"] += usage["prompt_tokens"]
+        tot["cached_tokens"] += usage["cached_tokens"]
+
+def cache_stats() -> dict:
+    """{(mode, strategy): {"calls", "prompt_tokens", "cached_tokens", "hit_rate"}} since process start."""
+    with _HEALTH_LOCK:
+        snap = {k: dict(v) for k, v in _USAGE.items()}
+    for v in snap.values():
+        v["hit_rate"] = (v["cached_tokens"] / v["prompt_tokens"]) if v["prompt_tokens"] else 0.0
+    return snap
+
+# ---------- routing ----------
+def choose(mode: str, strategy: str = "") -> dict:
+    """
+    Resolve the route for (mode, strategy). If the primary model is over its latency/error
+    budget, swap primary and fallback for this call (except for a PROBE_SHARE of calls,
+    which keep probing the primary). Returns a copy with a "reason" field.
+    """
+    base = ROUTES.get((mode, strategy or "")) or ROUTES[("r1", "")]
+    route = dict(base)
+    why = _over_budget(base)
+    if why and route.get("fallback") and random.random() < PROBE_SHARE:
+        route["reason"] = f"probe: {base['model']} {why}"
+    elif why and route.get("fallback"):
+        route["model"], route["fallback"] = base["fallback"], base["model"]
+        route["reason"] = f"fallback: {base['model']} {why}"
+    else:
+        route["reason"] = "primary"
+    log.info("route mode=%s strategy=%s model=%s max_tokens=%s timeout=%ss (%s)",
+             mode, strategy or "-", route["model"], route["max_tokens"], route["timeout_s"], route["reason"])
+    return route
+
+class _Cancelled(Exception):
+    """The other hedged attempt won; this stream was closed on purpose."""
+
+class _Attempt:
+    """
+    One request in a hedge race. The attempt's thread attaches its stream once the response
+    is open; the winner calls stop(), which closes that stream from the winner's side so the
+    loser's blocked read ends now rather than at its next chunk.
+    """
+    def __init__(self, offset: float = 0.0):
+        self.offset = offset                  # seconds after the first request's start
+        self.first_token = threading.Event()
+        self.cancel = threading.Event()
+        self.future: Future = Future()
+        self._stream = None
+        self._lock = threading.Lock()
+
+    def attach(self, stream) -> None:
+        with self._lock:
+            self._stream = stream
+            stopped = self.cancel.is_set()
+        if stopped:
+            raise _Cancelled()
+
+    def stop(self) -> None:
+        with self._lock:
+            self.cancel.set()
+            stream = self._stream
+        _close(stream)
+
+def _stream_once(model: str, messages: list[dict], max_tokens: int, timeout_s: float, temperature: float,
+                 attempt: _Attempt | None = None):
+    """
+    One streamed completion. Streaming is used to time the first token (and to stop a
+    losing hedge early); the text is collected whole. Returns (text, usage, ttft_s, wall_s).
+    """
+    t0 = time.monotonic()
+    ttft = None
+    parts: list[str] = []
+    last = None
+    stream = None
+    try:
+        count("llm")
+        stream = get_client().with_options(timeout=timeout_s, max_retries=0).chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        if attempt is not None:
+            attempt.attach(stream)
+        for chunk in stream:
+            if attempt is not None and attempt.cancel.is_set():
+                raise _Cancelled()
+            if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                if ttft is None:
+                    ttft = time.monotonic() - t0
+                    if attempt is not None:
+                        attempt.first_token.set()
+                parts.append(chunk.choices[0].delta.content)
+            if getattr(chunk, "usage", None):
+                last = chunk  # usage arrives on the final chunk
+    except _Cancelled:
+        _close(stream)
+        raise
+    except Exception:
+        if attempt is not None and attempt.cancel.is_set():
+            raise _Cancelled()   # the winner closed this stream under us; not a model error
+        record(model, time.monotonic() - t0, False)
+        raise
+    wall = time.monotonic() - t0
+    record(model, wall, True, ttft)
+    return "".join(parts), usage_from(last), ttft, wall
+
+def _close(stream) -> None:
+    try:
+        if stream is not None and hasattr(stream, "close"):
+            stream.close()
+    except Exception:
+        pass
+
+# ---------- hedging ----------
+_HEDGES: deque = deque()   # monotonic timestamps of hedges fired in the last minute
+
+def hedge_deadline(model: str) -> float:
+    """Seconds to wait for a first token before hedging: the model's recent TTFT percentile."""
+    with _HEALTH_LOCK:
+        samples = sorted(_TTFT.get(model, ()))
+    if len(samples) < HEALTH_MIN_SAMPLES:
+        return HEDGE_DEFAULT_S
+    k = max(0, min(len(samples) - 1, int(math.ceil(HEDGE_PERCENTILE / 100.0 * len(samples))) - 1))
+    return max(HEDGE_MIN_S, samples[k])
+
+def _take_hedge_slot() -> bool:
+    now = time.monotonic()
+    with _HEALTH_LOCK:
+        while _HEDGES and now - _HEDGES[0] > 60:
+            _HEDGES.popleft()
+        if len(_HEDGES) >= HEDGE_PER_MINUTE:
+            return False
+        _HEDGES.append(now)
+        return True
+
+def _start(attempt: _Attempt, args: tuple) -> _Attempt:
+    """Run _stream_once for attempt on a thread of its own; the result lands in attempt.future."""
+    def run():
+        try:
+            attempt.future.set_result(_stream_once(*args, attempt))
+        except BaseException as e:
+            attempt.future.set_exception(e)
+    threading.Thread(target=in_session(run), name="hedge", daemon=True).start()
+    return attempt
+
+def _call(model: str, messages: list[dict], max_tokens: int, timeout_s: float, temperature: float):
+    """
+    _stream_once, hedged when LLM_HEDGE is on. Returns (text, usage, ttft_s, wall_s, hedged);
+    ttft/wall are measured from the first request's start, i.e. what the user waited.
+    """
+    if not HEDGE_ENABLED:
+        return (*_stream_once(model, messages, max_tokens, timeout_s, temperature), False)
+
+    args = (model, messages, max_tokens, timeout_s, temperature)
+    t0 = time.monotonic()
+    a = _start(_Attempt(), args)
+
+    deadline = hedge_deadline(model)
+    while not a.first_token.is_set() and not a.future.done() and time.monotonic() - t0 < deadline:
+        a.first_token.wait(0.05)
+    if a.first_token.is_set() or a.future.done() or not _take_hedge_slot():
+        text, usage, ttft, _ = a.future.result()
+        return text, usage, ttft, time.monotonic() - t0, False
+
+    log.info("hedge model=%s: no first token after %.2fs", model, deadline)
+    b = _start(_Attempt(offset=time.monotonic() - t0), args)
+    attempts = {a.future: a, b.future: b}
+
+    pending = set(attempts)
+    last_exc = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for fut in done:
+            if fut.exception() is None:
+                for other in pending:
+                    attempts[other].stop()
+                text, usage, ttft, _ = fut.result()
+                ttft = (ttft + attempts[fut].offset) if ttft is not None else None
+                log.info("hedge model=%s won by %s request", model, "first" if fut is a.future else "backup")
+                return text, usage, ttft, time.monotonic() - t0, True
+            last_exc = fut.exception()
+    raise last_exc
+
+def complete(mode: str, strategy: str, messages: list[dict], temperature: float = 0.6) -> tuple[str, dict]:
+    """
+    Run a chat completion on the routed model; on timeout/error retry once on the fallback.
+    Every attempt is written to the metrics store. Returns (text, info) where info =
+    {"model", "mode", "strategy", "seconds", "ttft_s", "fell_back", "hedged", "reason",
+     "prompt_tokens", "completion_tokens", "cached_tokens"}.
+    """
+    route = choose(mode, strategy)
+    t0 = time.monotonic()
+    fell_back = False
+    try:
+        text, usage, ttft, wall, hedged = _call(route["model"], messages, route["max_tokens"], route["timeout_s"], temperature)
+    except Exception as e:
+        record_llm_call("letter", mode=mode, strategy=strategy, model=route["model"],
+                        wall_s=round(time.monotonic() - t0, 3), ok=False)
+        if not route.get("fallback"):
+            raise
+        log.warning("model %s failed for mode=%s (%s); retrying on %s",
+                    route["model"], mode, e.__class__.__name__, route["fallback"])
+        route["model"], route["fallback"] = route["fallback"], None
+        route["reason"] = f"fallback after {e.__class__.__name__}"
+        fell_back = True
+        try:
+            text, usage, ttft, wall, hedged = _call(route["model"], messages, route["max_tokens"], route["timeout_s"], temperature)
+        except Exception:
+            record_llm_call("letter", mode=mode, strategy=strategy, model=route["model"], ok=False, fell_back=True)
+            raise
+
+    _record_usage(mode, strategy, usage)
+    record_llm_call("letter", mode=mode, strategy=strategy, model=route["model"],
+                    wall_s=round(wall, 3), ttft_s=round(ttft, 3) if ttft is not None else None,
+                    fell_back=fell_back, **usage)
+    log.info("usage mode=%s strategy=%s model=%s prompt=%s cached=%s completion=%s wall=%.2fs ttft=%s",
+             mode, strategy or "-", route["model"], usage["prompt_tokens"],
+             usage["cached_tokens"], usage["completion_tokens"], wall,
+             f"{ttft:.2f}s" if ttft is not None else "-")
+    return text.strip(), {
+        "model": route["model"],
+        "mode": mode,
+        "strategy": strategy or "",
+        "seconds": round(time.monotonic() - t0, 3),
+        "ttft_s": round(ttft, 3) if ttft is not None else None,
+        "fell_back": fell_back,
+        "hedged": hedged,
+        "reason": route["reason"],
+        **usage,
+    }
@@ -0,0 +1,119 @@
+# utils/metrics.py
+# Local LLM telemetry: one row per model call (letter generation and sidebar helper)
+# with token counts, wall time and time-to-first-token. The admin dashboard reads it.
+import os, math, time, sqlite3, threading, logging
+
+log = logging.getLogger("boostbridge.metrics")
+
+# Lives next to profiles.db by default (writable on Streamlit Cloud).
+DB_DIR  = os.environ.get("METRICS_DB_DIR", os.environ.get("PROFILE_DB_DIR", "/mount/data"))
+DB_PATH = os.path.join(DB_DIR, "metrics.db")
+
+DDL = """
+CREATE TABLE IF NOT EXISTS llm_calls (
+  id                INTEGER PRIMARY KEY AUTOINCREMENT,
+  ts                REAL NOT NULL,
+  kind              TEXT NOT NULL,         -- letter / helper
+  mode              TEXT DEFAULT '',       -- pi / r1 / r2 / r3 / help
+  strategy          TEXT DEFAULT '',
+  model             TEXT DEFAULT '',
+  prompt_tokens     INTEGER DEFAULT 0,
+  completion_tokens INTEGER DEFAULT 0,
+  cached_tokens     INTEGER DEFAULT 0,
+  wall_s            REAL DEFAULT 0,
+  ttft_s            REAL,                  -- NULL if no token arrived
+  ok                INTEGER DEFAULT 1,
+  fell_back         INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS llm_calls_ts ON llm_calls(ts);
+"""
+
+FIELDS = ["kind", "mode", "strategy", "model", "prompt_tokens", "completion_tokens",
+          "cached_tokens", "wall_s", "ttft_s", "ok", "fell_back"]
+
+_DB_LOCK = threading.Lock()
+_READY = {"ok": False}
+
+def _ensure_db():
+    if _READY["ok"]:
+        return
+    os.makedirs(DB_DIR, exist_ok=True)
+    with sqlite3.connect(DB_PATH, check_same_thread=False) as conn:
+        conn.executescript(DDL)
+        conn.commit()
+    _READY["ok"] = True
+
+def usage_from(resp) -> dict:
+    """Token counts from an API response (or the final stream chunk); zeros if absent."""
+    u = getattr(resp, "usage", None)
+    details = getattr(u, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": int(getattr(u, "prompt_tokens", 0) or 0),
+        "completion_tokens": int(getattr(u, "completion_tokens", 0) or 0),
+        "cached_tokens": int(getattr(details, "cached_tokens", 0) or 0),
+    }
+
+def record_llm_call(kind: str, **fields) -> None:
+    """Store one call. Telemetry must never break generation, so failures are only logged."""
+    row = {"kind": kind, **{k: fields.get(k) for k in FIELDS if k != "kind"}}
+    row["ok"] = 1 if fields.get("ok", True) else 0
+    row["fell_back"] = 1 if fields.get("fell_back") else 0
+    try:
+        _ensure_db()
+        with _DB_LOCK, sqlite3.connect(DB_PATH, check_same_thread=False) as conn:
+            conn.execute(
+                f"INSERT INTO llm_calls(ts, {', '.join(FIELDS)}) VALUES(?, {', '.join('?' * len(FIELDS))})",
+                [time.time()] + [row[k] for k in FIELDS],
+            )
+            conn.commit()
+    except Exception as e:
+        log.warning("could not record llm call: %s", e)
+
+def recent_calls(days: int = 7, kind: str | None = None) -> list[dict]:
+    _ensure_db()
+    since = time.time() - days * 86400
+    sql = f"SELECT ts, {', '.join(FIELDS)} FROM llm_calls WHERE ts >= ?"
+    args: list = [since]
+    if kind:
+        sql += " AND kind = ?"
+        args.append(kind)
+    with sqlite3.connect(DB_PATH, check_same_thread=False) as conn:
+        rows = conn.execute(sql + " ORDER BY ts", args).fetchall()
+    return [dict(zip(["ts"] + FIELDS, r)) for r in rows]
+
+def percentile(values: list[float], q: float) -> float | None:
+    """Nearest-rank percentile (q in 0..100); None for an empty list."""
+    vals = sorted(v for v in values if v is not None)
+    if not vals:
+        return None
+    k = max(0, min(len(vals) - 1, math.ceil(q / 100.0 * len(vals)) - 1))
+    return vals[k]
+
+def latency_summary(days: int = 7) -> list[dict]:
+    """p50/p95 wall time and TTFT plus token averages per (kind, mode, strategy, model)."""
+    groups: dict[tuple, list[dict]] = {}
+    for r in recent_calls(days):
+        groups.setdefault((r["kind"], r["mode"] or "", r["strategy"] or "", r["model"] or ""), []).append(r)
+
+    out = []
+    for (kind, mode, strategy, model), rows in sorted(groups.items()):
+        ok = [r for r in rows if r["ok"]]
+        wall = [r["wall_s"] for r in ok]
+        ttft = [r["ttft_s"] for r in ok]
+        prompt = sum(r["prompt_tokens"] or 0 for r in ok)
+        cached = sum(r["cached_tokens"] or 0 for r in ok)
+        out.append({
+            "kind": kind,
+            "mode": mode + (f"/{strategy}" if strategy else ""),
+            "model": model,
+            "calls": len(rows),
+            "errors": len(rows) - len(ok),
+            "p50_s": percentile(wall, 50),
+            "p95_s": percentile(wall, 95),
+            "ttft_p50_s": percentile(ttft, 50),
+            "ttft_p95_s": percentile(ttft, 95),
+            "avg_prompt_tok": round(prompt / len(ok)) if ok else 0,
+            "avg_completion_tok": round(sum(r["completion_tokens"] or 0 for r in ok) / len(ok)) if ok else 0,
+            "cache_hit": round(cached / prompt, 3) if prompt else 0.0,
+        })
+    return out
@@ -1,5 +1,6 @@
 # utils/notifications.py
-import os, smtplib
+import os, time, queue, atexit, smtplib, threading
+from concurrent.futures import ThreadPoolExecutor
 from email.mime.text import MIMEText
 from email.utils import formataddr
 from dotenv import load_dotenv
@@ -10,6 +11,9 @@ load_dotenv()
 SENDGRID_API_KEY = os.getenv("SENDGRID_API_KEY", "")
 EMAIL_FROM       = os.getenv("NOTIFY_EMAIL_FROM", "no-reply@boostbridgediy.com")
 
+SENDGRID_URL = os.getenv("SENDGRID_URL", "https://api.sendgrid.com/v3/mail/send")  # override for a local stub
+SENDGRID_MAX_PERSONALIZATIONS = 1000  # SendGrid's per-request cap
+
 # SMTP fallback (if no SendGrid)
 SMTP_HOST = os.getenv("SMTP_HOST", "")
 SMTP_PORT = int(os.getenv("SMTP_PORT", "587") or "587")
@@ -17,10 +21,296 @@ SMTP_USER = os.getenv("SMTP_USER", "")
 SMTP_PASS = os.getenv("SMTP_PASS", "")
 SMTP_TLS  = (os.getenv("SMTP_TLS", "true").lower() == "true")
 
+# SMTP connection pool (keeps authenticated sessions alive between messages)
+SMTP_POOL_SIZE     = int(os.getenv("SMTP_POOL_SIZE", "4") or "4")
+SMTP_MAX_PER_CONN  = int(os.getenv("SMTP_MAX_PER_CONN", "100") or "100")  # rotate before provider caps
+SMTP_IDLE_NOOP_S   = float(os.getenv("SMTP_IDLE_NOOP_S", "30") or "30")   # NOOP-check sessions idle longer than this
+
 # SMS via Twilio (optional)
 TWILIO_SID   = os.getenv("TWILIO_SID", "")
 TWILIO_TOKEN = os.getenv("TWILIO_AUTH_TOKEN", "")
-TWILIO_FROM  = os.getenv("TWILIO_FROM", "")
+TWILIO_FROM  = os.getenv("TWILIO_FROM", "")   # one number, or several comma-separated
+TWILIO_SENDERS = [x.strip() for x in TWILIO_FROM.split(",") if x.strip()]
+# Carrier cap per sending number (US long code ~1 msg/s; toll-free/short code higher)
+SMS_RATE_PER_SENDER = float(os.getenv("SMS_RATE_PER_SENDER", "1") or "1")
+
+# ---------- SMTP pool ----------
+def _smtp_configured() -> bool:
+    return bool(SMTP_HOST and SMTP_USER and SMTP_PASS)
+
+def _build_mime(to_email: str, subject: str, html_body: str) -> str:
+    msg = MIMEText(html_body, "html")
+    msg["Subject"] = subject
+    msg["From"] = formataddr(("BoostBridgeDIY", EMAIL_FROM))
+    msg["To"] = to_email
+    return msg.as_string()
+
+class _SmtpPool:
+    """
+    Small thread-safe pool of logged-in SMTP sessions.
+    - connect + STARTTLS + LOGIN happen once per session, not once per message
+    - sessions idle for a while get a NOOP health check before reuse
+    - a session is rotated after SMTP_MAX_PER_CONN messages
+    - on a dropped/broken session we reconnect once and resend
+    """
+    def __init__(self, size: int = SMTP_POOL_SIZE):
+        self._idle = queue.LifoQueue()   # LIFO keeps the warmest session in use
+        self._sem = threading.BoundedSemaphore(max(1, size))
+
+    def _connect(self) -> dict:
+        server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=20)
+        if SMTP_TLS:
+            server.starttls()
+        server.login(SMTP_USER, SMTP_PASS)
+        return {"server": server, "sent": 0, "last": time.time()}
+
+    @staticmethod
+    def _close(conn: dict):
+        try:
+            conn["server"].quit()
+        except Exception:
+            try:
+                conn["server"].close()
+            except Exception:
+                pass
+
+    def _checkout(self) -> dict:
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if conn["sent"] >= SMTP_MAX_PER_CONN:
+                self._close(conn)
+                continue
+            if time.time() - conn["last"] > SMTP_IDLE_NOOP_S:
+                try:
+                    if conn["server"].noop()[0] != 250:
+                        raise smtplib.SMTPServerDisconnected("noop failed")
+                except Exception:
+                    self._close(conn)
+                    continue
+            return conn
+
+    def _checkin(self, conn: dict):
+        conn["last"] = time.time()
+        self._idle.put(conn)
+
+    def session(self) -> "_SmtpSession":
+        """One checked-out session; use as `with pool.session() as sess: sess.send(...)`."""
+        return _SmtpSession(self)
+
+    def send(self, to_email: str, mime_str: str):
+        with self.session() as s:
+            s.send(to_email, mime_str)
+
+    def close_all(self):
+        while True:
+            try:
+                self._close(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+# errors that mean "this session is dead", not "this message is bad"
+_SMTP_DROPPED = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+class _SmtpSession:
+    """A pooled SMTP session bound to one thread for a run of messages."""
+    def __init__(self, pool: _SmtpPool):
+        self.pool = pool
+        self.conn = None
+
+    def __enter__(self):
+        self.pool._sem.acquire()
+        try:
+            self.conn = self.pool._checkout()
+        except Exception:
+            self.pool._sem.release()
+            raise
+        return self
+
+    def send(self, to_email: str, mime_str: str):
+        if self.conn is not None and self.conn["sent"] >= SMTP_MAX_PER_CONN:
+            self.pool._close(self.conn)   # rotate long-lived sessions
+            self.conn = None
+        for attempt in (1, 2):
+            if self.conn is None:
+                self.conn = self.pool._connect()
+            try:
+                self.conn["server"].sendmail(EMAIL_FROM, [to_email], mime_str)
+                self.conn["sent"] += 1
+                return
+            except _SMTP_DROPPED:
+                # broken session -> drop it, reconnect once, resend
+                self.pool._close(self.conn)
+                self.conn = None
+                if attempt == 2:
+                    raise
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self.conn is not None:
+                self.pool._checkin(self.conn)
+        finally:
+            self.pool._sem.release()
+        return False
+
+_POOL = {"smtp": None}
+_POOL_LOCK = threading.Lock()
+
+def _smtp_pool() -> _SmtpPool:
+    if _POOL["smtp"] is None:
+        with _POOL_LOCK:
+            if _POOL["smtp"] is None:
+                _POOL["smtp"] = _SmtpPool()
+                atexit.register(_POOL["smtp"].close_all)
+    return _POOL["smtp"]
+
+def _smtp_send_slice(items: list[tuple[int, dict]]) -> list[tuple[int, bool]]:
+    """Send a slice of messages over ONE pooled session; per-message outcome."""
+    out = []
+    try:
+        with _smtp_pool().session() as sess:
+            for i, m in items:
+                try:
+                    sess.send(m["to"], _build_mime(m["to"], m["subject"], m["html"]))
+                    out.append((i, True))
+                except smtplib.SMTPRecipientsRefused:
+                    out.append((i, False))  # bad address; session is still fine
+                except Exception:
+                    out.append((i, False))
+    except Exception:
+        # could not even open a session
+        done = {i for i, _ in out}
+        out += [(i, False) for i, _ in items if i not in done]
+    return out
+
+def send_emails(batch: list[dict]) -> list[bool]:
+    """
+    Bulk send. batch = [{"to": ..., "subject": ..., "html": ...}, ...]
+    Returns a list of booleans aligned with `batch`.
+    SendGrid: messages with identical subject/body share one request.
+    SMTP: messages are split across up to SMTP_POOL_SIZE sessions, each session
+    sending many messages without reconnecting or re-authenticating.
+    """
+    results = [False] * len(batch)
+    pending = [(i, m) for i, m in enumerate(batch) if (m or {}).get("to")]
+    if not pending:
+        return results
+
+    if SENDGRID_API_KEY:
+        # identical (subject, html) pairs collapse into one multi-personalization request
+        groups: dict[tuple[str, str], list[int]] = {}
+        for i, m in pending:
+            groups.setdefault((m.get("subject", ""), m.get("html", "")), []).append(i)
+        for (subject, html), ids in groups.items():
+            oks = send_sendgrid_batch(subject, html, [{"to": batch[i]["to"]} for i in ids])
+            for i, ok in zip(ids, oks):
+                results[i] = ok
+        return results
+
+    if not _smtp_configured():
+        for i, m in pending:
+            results[i] = send_email(m["to"], m.get("subject", ""), m.get("html", ""))
+        return results
+
+    n = max(1, min(SMTP_POOL_SIZE, len(pending)))
+    slices = [pending[k::n] for k in range(n)]
+    with ThreadPoolExecutor(max_workers=n, thread_name_prefix="bb-smtp") as ex:
+        for chunk in ex.map(_smtp_send_slice, slices):
+            for i, ok in chunk:
+                results[i] = ok
+    return results
+
+# ---------- SendGrid (keep-alive session + batched personalizations) ----------
+_SG = {"session": None}
+
+def _sendgrid_session():
+    """One pooled keep-alive HTTPS session per process (TLS handshake paid once)."""
+    if _SG["session"] is None:
+        with _POOL_LOCK:
+            if _SG["session"] is None:
+                import requests
+                sess = requests.Session()
+                sess.headers.update({
+                    "Authorization": f"Bearer {SENDGRID_API_KEY}",
+                    "Content-Type": "application/json",
+                })
+                adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+                sess.mount("https://", adapter)
+                sess.mount("http://", adapter)
+                _SG["session"] = sess
+    return _SG["session"]
+
+def _sg_token(name: str) -> str:
+    return f"-{name}-"
+
+def _to_sg_template(text: str, names) -> str:
+    """'{bureau}' placeholders -> SendGrid substitution tokens '-bureau-'."""
+    for n in names:
+        text = text.replace("{" + n + "}", _sg_token(n))
+    return text
+
+def _sg_failed_indexes(resp) -> set[int]:
+    """Pull personalization indexes out of a SendGrid 400 error body (field 'personalizations.N...')."""
+    bad = set()
+    try:
+        for err in (resp.json() or {}).get("errors", []):
+            parts = str(err.get("field") or "").split(".")
+            if len(parts) > 1 and parts[0] == "personalizations" and parts[1].isdigit():
+                bad.add(int(parts[1]))
+    except Exception:
+        pass
+    return bad
+
+def send_sendgrid_batch(subject_t: str, html_t: str, recipients: list[dict]) -> list[bool]:
+    """
+    Send ONE template to many recipients with per-recipient substitutions.
+    recipients = [{"to": "a@b.com", "vars": {"bureau": "Equifax", ...}}, ...]
+    Templates use {name} placeholders (same as str.format).
+    Up to 1000 recipients share one HTTPS request over a keep-alive session.
+    Returns per-recipient outcomes aligned with `recipients`.
+    """
+    results = [False] * len(recipients)
+    if not SENDGRID_API_KEY:
+        return results
+
+    names = sorted({k for r in recipients for k in (r.get("vars") or {})})
+    subject = _to_sg_template(subject_t, names)
+    html = _to_sg_template(html_t, names)
+    idx = [i for i, r in enumerate(recipients) if r.get("to")]
+
+    for start in range(0, len(idx), SENDGRID_MAX_PERSONALIZATIONS):
+        chunk = idx[start:start + SENDGRID_MAX_PERSONALIZATIONS]
+        # one retry after dropping personalizations SendGrid rejected
+        for _ in range(2):
+            body = {
+                "personalizations": [
+                    {
+                        "to": [{"email": recipients[i]["to"]}],
+                        "substitutions": {_sg_token(k): str(v) for k, v in (recipients[i].get("vars") or {}).items()},
+                    }
+                    for i in chunk
+                ],
+                "from": {"email": EMAIL_FROM, "name": "BoostBridgeDIY"},
+                "subject": subject,
+                "content": [{"type": "text/html", "value": html}],
+            }
+            try:
+                resp = _sendgrid_session().post(SENDGRID_URL, json=body, timeout=30)
+            except Exception:
+                break
+            if resp.status_code in (200, 202):
+                for i in chunk:
+                    results[i] = True
+                break
+            bad = _sg_failed_indexes(resp) if resp.status_code == 400 else set()
+            if not bad:
+                break
+            chunk = [i for pos, i in enumerate(chunk) if pos not in bad]
+            if not chunk:
+                break
+    return results
 
 def send_email(to_email: str, subject: str, html_body: str) -> bool:
     """Send email via SendGrid if configured; else SMTP; else simulate."""
@@ -30,11 +320,8 @@ def send_email(to_email: str, subject: str, html_body: str) -> bool:
     # Try SendGrid first
     if SENDGRID_API_KEY:
         try:
-            import requests, json
-            resp = requests.post(
-                "https://api.sendgrid.com/v3/mail/send",
-                headers={"Authorization": f"Bearer {SENDGRID_API_KEY}",
-                         "Content-Type": "application/json"},
+            resp = _sendgrid_session().post(
+                SENDGRID_URL,
                 json={
                     "personalizations": [{"to": [{"email": to_email}]}],
                     "from": {"email": EMAIL_FROM, "name": "BoostBridgeDIY"},
@@ -47,19 +334,10 @@ def send_email(to_email: str, subject: str, html_body: str) -> bool:
         except Exception:
             pass
 
-    # SMTP fallback
-    if SMTP_HOST and SMTP_USER and SMTP_PASS:
+    # SMTP fallback (pooled, authenticated session is reused)
+    if _smtp_configured():
         try:
-            msg = MIMEText(html_body, "html")
-            msg["Subject"] = subject
-            msg["From"] = formataddr(("BoostBridgeDIY", EMAIL_FROM))
-            msg["To"] = to_email
-            server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=20)
-            if SMTP_TLS:
-                server.starttls()
-            server.login(SMTP_USER, SMTP_PASS)
-            server.sendmail(EMAIL_FROM, [to_email], msg.as_string())
-            server.quit()
+            _smtp_pool().send(to_email, _build_mime(to_email, subject, html_body))
             return True
         except Exception:
             return False
@@ -67,16 +345,70 @@ def send_email(to_email: str, subject: str, html_body: str) -> bool:
     # If nothing configured, pretend success (for dev)
     return True
 
+# ---------- Twilio (shared client + per-sender pacing) ----------
+_TW = {"client": None, "rr": 0}
+
+def _twilio_configured() -> bool:
+    return bool(TWILIO_SID and TWILIO_TOKEN and TWILIO_SENDERS)
+
+def _twilio_client():
+    """One Twilio REST client per process (its HTTP session is reused)."""
+    if _TW["client"] is None:
+        with _POOL_LOCK:
+            if _TW["client"] is None:
+                from twilio.rest import Client
+                _TW["client"] = Client(TWILIO_SID, TWILIO_TOKEN)
+    return _TW["client"]
+
+class _SenderPacer:
+    """Spaces sends from ONE sending number to at most `rate` per second (thread-safe)."""
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_at = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_at)
+            self.next_at = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+_PACERS: dict[str, _SenderPacer] = {}
+
+def _pick_sender() -> tuple[str, _SenderPacer]:
+    """Round-robin across configured numbers; each number has its own pacer."""
+    with _POOL_LOCK:
+        sender = TWILIO_SENDERS[_TW["rr"] % len(TWILIO_SENDERS)]
+        _TW["rr"] += 1
+        pacer = _PACERS.setdefault(sender, _SenderPacer(SMS_RATE_PER_SENDER))
+    return sender, pacer
+
+# Twilio errors worth retrying: throttled or provider-side trouble
+_SMS_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+def send_sms_detailed(to_phone: str, body: str) -> tuple[bool, bool]:
+    """
+    Send one SMS, paced per sending number.
+    Returns (ok, retryable): retryable=True for throttling/5xx/network errors,
+    False for permanent failures (bad number, opted out, ...).
+    """
+    if not to_phone:
+        return False, False
+    if not _twilio_configured():
+        return True, False  # simulate in dev
+    sender, pacer = _pick_sender()
+    pacer.wait()
+    try:
+        _twilio_client().messages.create(from_=sender, to=to_phone, body=body)
+        return True, False
+    except Exception as e:
+        status = getattr(e, "status", None)
+        if status is None:
+            return False, True  # network / unknown -> retry
+        return False, int(status) in _SMS_RETRY_STATUS
+
 def send_sms(to_phone: str, body: str) -> bool:
     """Send SMS via Twilio if configured; else simulate."""
-    if not to_phone:
-        return False
-    if TWILIO_SID and TWILIO_TOKEN and TWILIO_FROM:
-        try:
-            from twilio.rest import Client
-            client = Client(TWILIO_SID, TWILIO_TOKEN)
-            client.messages.create(from_=TWILIO_FROM, to=to_phone, body=body)
-            return True
-        except Exception:
-            return False
-    return True  # simulate in dev
+    return send_sms_detailed(to_phone, body)[0]
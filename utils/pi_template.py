@@ -0,0 +1,101 @@
+# utils/pi_template.py
+# Deterministic body for "Personal Info" letters. PI cleanup is formulaic (wrong names,
+# addresses, employers -> remove; one generic law phrase), so this renders the same
+# structured facts build_prompt would list, with no model call. Used per plan or as the
+# fallback when the LLM is slow or down (see letter_body.generate_body).
+import re, json, hashlib
+
+PI_TYPES = ("personal_info", "personal_information")
+
+# Opening / closing variants; one is picked per intake (stable for identical inputs)
+# so the letters don't all read alike.
+OPENINGS = [
+    "I recently reviewed my credit file and found personal information that is outdated or "
+    "incorrect. I am asking you to remove it so that my file reflects only my current, "
+    "accurate personal information.",
+    "While checking my credit report, I noticed personal details that no longer apply to me "
+    "or were never correct. Please remove this outdated or incorrect personal information so "
+    "my file reflects only current, accurate details about me.",
+    "My credit file lists personal information that is incorrect or out of date. I would like "
+    "it removed so the file reflects only my current, accurate personal information and "
+    "cannot be confused with anyone else's.",
+]
+
+CLOSINGS = [
+    "Please apply these changes across all versions of my file, including any records shared "
+    "with other users of my report, and send me an updated copy of my report once the "
+    "corrections are complete.",
+    "Once the corrections are made, please apply the changes across all versions of my file "
+    "and send me an updated copy of my report so I can confirm that only accurate personal "
+    "information remains.",
+    "Please make these changes across all versions of my file and mail me an updated copy of "
+    "my report showing the corrected personal information when you have finished.",
+]
+
+LAW_SENTENCE = (
+    "Federal credit reporting law requires that the personal information in my file be "
+    "accurate and up to date, and outdated entries like these serve no purpose in my report."
+)
+
+# Short files get one more plain sentence so the body stays inside the PI word range.
+SHORT_FILE_SENTENCE = (
+    "Old or mistaken identifiers can cause my file to be mixed with someone else's records, "
+    "so I want to make sure everything listed under my name is correct."
+)
+
+_KINDS = [
+    ("address",  re.compile(r"\b(?:address|street|st|ave|avenue|apt|road|rd|blvd|lane|ln|drive|dr|po box|zip)\b|\d{3,}\s+\w+", re.I)),
+    ("employer", re.compile(r"\b(?:employ\w*|work\w*|job|company|inc|llc|corp\w*)\b", re.I)),
+    ("name",     re.compile(r"\b(?:name|aka|spelling|spelled|maiden|surname)\b", re.I)),
+]
+
+def _kind(text: str) -> str:
+    for kind, rx in _KINDS:
+        if rx.search(text):
+            return kind
+    return "entry"
+
+def pi_facts(inputs: dict) -> list[dict]:
+    """
+    The personal-info facts from build_prompt inputs: [{"kind", "wrong", "correct"}],
+    in dispute_types order (the same details build_prompt turns into fact bullets).
+    """
+    dd = inputs.get("dispute_details") or {}
+    types = [str(t).lower().replace(" ", "_") for t in (inputs.get("dispute_types") or [])]
+    out = []
+    for t in [t for t in types if t in PI_TYPES] or [t for t in PI_TYPES if t in dd]:
+        info = dd.get(t)
+        if not isinstance(info, dict):
+            continue
+        wrong = (info.get("wrong") or "").strip()
+        correct = (info.get("correct") or "").strip()
+        if wrong or correct:
+            out.append({"kind": _kind(f"{wrong} {correct}"), "wrong": wrong, "correct": correct})
+    return out
+
+def _fact_sentence(f: dict) -> str:
+    label = {"entry": "The entry"}.get(f["kind"], f"The {f['kind']}")
+    if f["wrong"] and f["correct"]:
+        return f"{label} \"{f['wrong']}\" is incorrect and should be removed; the accurate {f['kind']} is \"{f['correct']}\"."
+    if f["wrong"]:
+        return f"{label} \"{f['wrong']}\" is incorrect and should be removed from my file."
+    return f"My current {f['kind']} is \"{f['correct']}\"; please remove any other version that appears in my file."
+
+def render_pi_body(inputs: dict) -> str:
+    """Body paragraphs for a Personal Info letter (no header, salutation or signature)."""
+    facts = pi_facts(inputs)
+    seed = int(hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:8], 16)
+
+    if facts:
+        details = "Specifically: " + " ".join(_fact_sentence(f) for f in facts)
+    else:
+        details = ("Please review the names, addresses and employers listed in my file and remove any "
+                   "that are outdated or were never mine.")
+    middle = LAW_SENTENCE if len(facts) > 2 else f"{LAW_SENTENCE} {SHORT_FILE_SENTENCE}"
+
+    return "\n\n".join([
+        OPENINGS[seed % len(OPENINGS)],
+        details,
+        middle,
+        CLOSINGS[(seed // len(OPENINGS)) % len(CLOSINGS)],
+    ])
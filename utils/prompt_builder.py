@@ -1,32 +1,56 @@
 # utils/prompt_builder.py
 # Build the BODY ONLY of the dispute letter (header/signature added in Step 8)
-
-def build_prompt(
-    user_info,
-    dispute_details,
-    dispute_types,
-    bureau,
-    round_num,              # "Personal Info" or 1 / 2 / 3 (int or str)
-    law_selection,
-    strategy=None           # optional: "mov" or "factual" for R2/R3
-):
+from functools import lru_cache
+from typing import NamedTuple
+
+from utils.issue_signals import issue_signals
+from utils.token_budget import estimate_tokens, prompt_budget, trim_free_text, TRIM_STEPS
+
+# Target body length per (mode, strategy); strategy is "" for PI / Round 1.
+WORD_RANGES = {
+    ("pi", ""):        "120–200",
+    ("r1", ""):        "140–220",
+    ("r2", "mov"):     "140–220",
+    ("r2", "factual"): "180–300",
+    ("r3", "mov"):     "150–240",
+    ("r3", "factual"): "180–320",
+}
+
+# Voice & tone block per (mode, strategy).
+VOICE = {
+    ("pi", ""): """Voice & tone:
+- First-person consumer. Friendly, brief, and factual.
+- Focus ONLY on personal information (addresses, names, employers). No account disputes here.""",
+    ("r1", ""): """Voice & tone:
+- First-person consumer. Friendly but firm. Plain English—no legalese.
+- Do NOT deny ownership unless identity theft was indicated. Use 'unfamiliar' / 'do not recognize' phrasing.""",
+    ("r2", "mov"): """Voice & tone:
+- First-person consumer. Direct but polite. Plain English.
+- Focus on how the item was verified; avoid legal jargon.""",
+    ("r2", "factual"): """Voice & tone:
+- Clear, consumer-friendly, and factual. Prefer 'appears inconsistent with' rather than legalistic conclusions.
+- Keep the focus on correcting or deleting inaccuracies and requesting MOV details only if the item is verified.""",
+    ("r3", "mov"): """Voice & tone:
+- Firm but professional. Focus on verification process and transparency.""",
+    ("r3", "factual"): """Voice & tone:
+- Firm, factual, professional. Prefer 'appears inconsistent with' to avoid overreach. Keep requests specific and actionable.""",
+}
+
+PURPOSES = {
+    ("pi", ""):        "Personal info cleanup",
+    ("r1", ""):        "Round 1 investigation",
+    ("r2", "mov"):     "Round 2 – MOV",
+    ("r2", "factual"): "Round 2 – FACTUAL",
+    ("r3", "mov"):     "Round 3 – MOV",
+    ("r3", "factual"): "Round 3 – FACTUAL",
+}
+
+def normalize_round(round_num, strategy=None) -> tuple[str, str]:
     """
-    Returns a single prompt string for the LLM.
-
-    Modes:
-      - "Personal Info"   -> Personal info cleanup (pre-step, not a round)
-      - Round 1           -> Soft investigation request (consumer tone)
-      - Round 2           -> MOV or Factual (choose via `strategy`)
-      - Round 3           -> whichever wasn't used in Round 2 (or pass `strategy`)
-
-    Multi-account support:
-      - Step 4.5 can store a list in dispute_details["account_items"] with up to 5 items:
-        {name, last4, issue, docs, dofd_ym, event_ym}
-      - If present, we use those to create individual fact bullets.
-      - If absent, we fall back to the older single-account fields.
+    Map UI round labels to (mode, strategy):
+      mode in {"pi", "r1", "r2", "r3"}; strategy in {"", "mov", "factual"}.
+    R2 defaults to MOV, R3 to Factual; strategy is "" for PI / R1.
     """
-
-    # ---------- normalize round & strategy ----------
     r = str(round_num).strip().lower()
     if r in {"personal", "personal info", "personal_info"}:
         mode = "pi"
@@ -44,16 +68,57 @@ def build_prompt(
         s = "mov"
     if mode == "r3" and s not in {"mov", "factual"}:
         s = "factual"
+    if mode in {"pi", "r1"}:
+        s = ""
+    return mode, s
 
-    # ---------- normalize dispute types ----------
-    types = []
-    if isinstance(dispute_types, (list, tuple)):
-        for t in dispute_types:
-            types.append(str(t).lower().replace(" ", "_"))
-    elif dispute_types:
-        types.append(str(dispute_types).lower().replace(" ", "_"))
+def word_range_bounds(mode: str, strategy: str = "") -> tuple[int, int]:
+    """(low, high) word targets for a mode, e.g. (120, 200)."""
+    lo, hi = WORD_RANGES.get((mode, strategy), WORD_RANGES[("r1", "")]).split("–")
+    return int(lo), int(hi)
+
+@lru_cache(maxsize=None)
+def static_prefix(mode: str, strategy: str = "") -> str:
+    """
+    Everything in the prompt that depends only on (mode, strategy). It is byte-identical
+    across users, so it goes first and the provider can reuse its cached prefix.
+    """
+    return f"""
+Write ONLY the body paragraphs of a consumer credit letter.
+Do NOT include the consumer header, bureau address, date, salutation, or signature.
+
+Voice & tone and style guidance:
+{VOICE[(mode, strategy)]}
+
+Style constraints:
+- {WORD_RANGES[(mode, strategy)]} words in 2–5 short paragraphs.
+- Use unique phrasing (avoid boilerplate like "I am writing to dispute..."; vary the first sentence).
+- Be specific about the remedy (delete, correct, or cease reporting).
+
+Purpose: {PURPOSES[(mode, strategy)]}
+""".strip()
+
+class PromptFlags(NamedTuple):
+    """What the intake involves; with (mode, strategy) it fully determines requests and hints."""
+    involves_collections: bool = False
+    mentions_monthly_chargeoff: bool = False
+    mentions_monthly_collection: bool = False
+    mentions_past_due_after_co: bool = False
+    involves_repo: bool = False
+    involves_reinsertion: bool = False
+    involves_inquiry: bool = False
+    involves_duplicate: bool = False
+    involves_mixed_file: bool = False
+    involves_public_record: bool = False
+    reinsertion_notice_claim: str | None = None  # "no_notice" / "unknown"
+    furnisher_types: bool = False               # account / duplicate / repo / collection in dispute_types
+
+FACTS_HEADER = "Facts to address (use only what is relevant; do not invent details):"
+
+def _facts_and_flags(dd: dict, types: list[str], mode: str, furnisher_types: bool = False,
+                     signals=issue_signals) -> tuple[list[str], PromptFlags]:
+    """Fact bullets for the intake, plus the flags that pick requests, hints and laws."""
     dtype_anchor = types[0] if types else ""
-    dd = dispute_details or {}
 
     # ---------- derive concise fact bullets ----------
     fact_lines = []
@@ -91,17 +156,14 @@ def build_prompt(
                 f"Account — Furnisher: {nm or 'Unknown'}; Last4: {last4 or 'N/A'}; Issue: {issue or 'N/A'}{extra_str}; Docs: {docs or 'N/A'}"
             )
 
-            hay_issue = issue.lower()
-            if "collection" in hay_issue:
+            sig = signals(issue)
+            if sig.collection:
                 involves_collections = True
-                if any(p in hay_issue for p in ["every month", "each month", "monthly", "re-aging", "reaging", "re aged", "reaged"]):
+                if sig.monthly:
                     mentions_monthly_collection = True
-            if any(p in hay_issue for p in [
-                "charge off every month", "monthly charge-off", "charged off each month",
-                "every month", "each month", "monthly", "re-aging", "reaging", "re aged", "reaged"
-            ]):
+            if sig.monthly:
                 mentions_monthly_chargeoff = True
-            if "past due" in hay_issue and ("co" in hay_issue or "charge-off" in hay_issue or "charge off" in hay_issue):
+            if sig.past_due_after_co:
                 mentions_past_due_after_co = True
 
         types_wo_account = [t for t in types if t != "account"]
@@ -113,7 +175,7 @@ def build_prompt(
         if not dtype:
             continue
         info = dd.get(dtype, {}) if isinstance(dd.get(dtype, {}), dict) else dd
-        low_issue = ((info.get("issue") or "") + " " + (info.get("details") or "")).lower()
+        sig = signals((info.get("issue") or "") + " " + (info.get("details") or ""))
 
         if dtype == "account":
             nm    = (info.get("name") or "").strip()
@@ -123,14 +185,11 @@ def build_prompt(
             fact_lines.append(
                 f"Account — Furnisher: {nm or 'Unknown'}; Last4: {last4 or 'N/A'}; Issue: {issue or 'N/A'}; Docs: {docs or 'N/A'}"
             )
-            if "collection" in low_issue:
+            if sig.collection:
                 involves_collections = True
-            if any(p in low_issue for p in [
-                "charge off every month", "monthly charge-off", "charged off each month",
-                "every month", "each month", "monthly", "re-aging", "reaging", "re aged", "reaged"
-            ]):
+            if sig.monthly:
                 mentions_monthly_chargeoff = True
-            if "past due" in low_issue and ("co" in low_issue or "charge-off" in low_issue or "charge off" in low_issue):
+            if sig.past_due_after_co:
                 mentions_past_due_after_co = True
 
         elif dtype in {"collection"}:
@@ -141,7 +200,7 @@ def build_prompt(
                 f"Collection — Agency: {nm or 'Unknown'}; Last4: {last4 or 'N/A'}; Issue: {issue or 'N/A'}"
             )
             involves_collections = True
-            if any(p in issue.lower() for p in ["every month", "each month", "monthly", "re-aging", "reaging", "re aged", "reaged"]):
+            if signals(issue).monthly:
                 mentions_monthly_collection = True
 
         elif dtype in {"inquiry", "hard_inquiry"}:
@@ -189,8 +248,7 @@ def build_prompt(
             fact_lines.append(
                 f"Reinserted item — Details: {details or 'N/A'}"
             )
-            low = details.lower()
-            if any(kw in low for kw in ["no notice", "did not receive", "never received", "no letter", "no written notice"]):
+            if signals(details).no_notice:
                 reinsertion_notice_claim = "no_notice"
             else:
                 reinsertion_notice_claim = reinsertion_notice_claim or "unknown"
@@ -213,57 +271,80 @@ def build_prompt(
         else:
             fact_lines.append("General dispute — Focus on accurate, complete, and verifiable reporting.")
 
-    # ---------- law references ----------
-    def legal_laws_text():
-        if law_selection:
-            return ", ".join(law_selection)
-        laws = ["FCRA §611 (reinvestigation)", "FCRA §602 (accuracy)"]
-        # furnishers duties for tradelines/collections/repo/duplicate
-        if any(dt in ["account", "duplicate", "repo", "collection"]
-               for dt in [d.lower().replace(" ", "_") for d in (dispute_types or [])]):
-            laws.append("FCRA §623 / 15 USC 1681s-2 (duties of furnishers)")
-        # reinsertion notice rule
-        if involves_reinsertion:
-            laws.append("FCRA §611(a)(5)(B) (reinsertion notice within 5 business days)")
-        # inquiries permissible purpose
-        if involves_inquiry:
-            laws.append("FCRA §604 (permissible purpose for inquiries)")
-        # DOFD / obsolescence context
-        if mentions_monthly_chargeoff or mentions_monthly_collection or mentions_past_due_after_co:
-            laws.append("FCRA §623(a)(5) (accurate DOFD reporting)")
-            laws.append("FCRA §605(c) (obsolescence period measured from DOFD)")
-        return ", ".join(laws)
-
-    # ---------- optional guidance / hints (plain-English) ----------
+    return fact_lines, PromptFlags(
+        involves_collections, mentions_monthly_chargeoff, mentions_monthly_collection,
+        mentions_past_due_after_co, involves_repo, involves_reinsertion, involves_inquiry,
+        involves_duplicate, involves_mixed_file, involves_public_record, reinsertion_notice_claim,
+        furnisher_types,
+    )
+
+# Laws line per (mode, strategy); None = FCRA sections picked from the flags
+# (or the user's own law_selection).
+LAWS_TEXT = {
+    ("pi", ""):        "federal credit reporting law that requires accurate and up-to-date personal information",
+    ("r1", ""):        "federal credit reporting law that requires accurate, complete, and verifiable reporting",
+    ("r2", "mov"):     "my right to a reasonable reinvestigation and to understand how items are verified",
+    ("r2", "factual"): None,
+    ("r3", "mov"):     "my right to a reasonable reinvestigation and to understand how items are verified",
+    ("r3", "factual"): None,
+}
+
+@lru_cache(maxsize=None)
+def default_laws(f: PromptFlags) -> str:
+    laws = ["FCRA §611 (reinvestigation)", "FCRA §602 (accuracy)"]
+    # furnishers duties for tradelines/collections/repo/duplicate
+    if f.furnisher_types:
+        laws.append("FCRA §623 / 15 USC 1681s-2 (duties of furnishers)")
+    # reinsertion notice rule
+    if f.involves_reinsertion:
+        laws.append("FCRA §611(a)(5)(B) (reinsertion notice within 5 business days)")
+    # inquiries permissible purpose
+    if f.involves_inquiry:
+        laws.append("FCRA §604 (permissible purpose for inquiries)")
+    # DOFD / obsolescence context
+    if f.mentions_monthly_chargeoff or f.mentions_monthly_collection or f.mentions_past_due_after_co:
+        laws.append("FCRA §623(a)(5) (accurate DOFD reporting)")
+        laws.append("FCRA §605(c) (obsolescence period measured from DOFD)")
+    return ", ".join(laws)
+
+def laws_text(mode: str, s: str, f: PromptFlags, law_selection) -> str:
+    fixed = LAWS_TEXT[(mode, s)]
+    if fixed is not None:
+        return fixed
+    return ", ".join(law_selection) if law_selection else default_laws(f)
+
+@lru_cache(maxsize=None)
+def hints_section(f: PromptFlags) -> str:
+    """The "Additional considerations" block for these flags."""
     extra_hints = []
 
     # Monthly CO / collection pattern (re-aging / repeated derogs)
-    if mentions_monthly_chargeoff or mentions_monthly_collection:
+    if f.mentions_monthly_chargeoff or f.mentions_monthly_collection:
         extra_hints.append(
             "Treat a charge-off or collection as a single historical event; do not make it appear newly derogatory each month, and do not advance the Date of First Delinquency (no re-aging)."
         )
 
     # Past-due showing after CO
-    if mentions_past_due_after_co:
+    if f.mentions_past_due_after_co:
         extra_hints.append(
             "After a charge-off, the 'past due' field generally should not continue to accrue as new past-due amounts. If the debt was sold/transferred, the original creditor typically shows a $0 balance."
         )
 
     # Repo-specific guidance
-    if involves_repo:
+    if f.involves_repo:
         extra_hints.append(
             "For repossessions, ensure accurate sale date, proceeds/credits, any deficiency balance, and consistent remarks; do not duplicate balances between original creditor and any collector; do not move the DOFD forward."
         )
 
     # Collections general
-    if involves_collections:
+    if f.involves_collections:
         extra_hints.append(
             "If a debt collector is involved, they must report accurately and stop reporting information that cannot be substantiated."
         )
 
     # Reinsertion general
-    if involves_reinsertion:
-        if reinsertion_notice_claim == "no_notice":
+    if f.involves_reinsertion:
+        if f.reinsertion_notice_claim == "no_notice":
             extra_hints.append(
                 "State that no written reinsertion notice was received within 5 business days and request deletion until proper verification and notice are provided."
             )
@@ -273,25 +354,25 @@ def build_prompt(
             )
 
     # Inquiries general
-    if involves_inquiry:
+    if f.involves_inquiry:
         extra_hints.append(
             "Ask for the specific permissible purpose or a copy of the signed authorization for the inquiry; if none exists, request deletion of the inquiry."
         )
 
     # Duplicate tradeline
-    if involves_duplicate:
+    if f.involves_duplicate:
         extra_hints.append(
             "Request deletion of the duplicate tradeline so that only a single, accurate account remains; avoid double counting of balances or payment history."
         )
 
     # Mixed file
-    if involves_mixed_file:
+    if f.involves_mixed_file:
         extra_hints.append(
             "Request removal of any data that does not belong to the consumer and confirmation of the data sources used to associate those records."
         )
 
     # Public record
-    if involves_public_record:
+    if f.involves_public_record:
         extra_hints.append(
             "Ask the bureau to identify the public record source it relied upon and to delete the item if it cannot be verified for accuracy and completeness."
         )
@@ -301,22 +382,18 @@ def build_prompt(
         "Ensure status/balance/remark fields follow recognized industry reporting standards and are consistent across all versions of the file."
     )
 
-    # ---------- voice & requests by mode ----------
+    return "Additional considerations:\n- " + "\n- ".join(extra_hints)
+
+@lru_cache(maxsize=None)
+def requests_section(mode: str, s: str, f: PromptFlags) -> str:
+    """The "Requests to include" block for (mode, strategy) and these flags."""
     if mode == "pi":
-        voice = """Voice & tone:
-- First-person consumer. Friendly, brief, and factual.
-- Focus ONLY on personal information (addresses, names, employers). No account disputes here."""
         requests = """Requests to include:
 - Remove outdated or incorrect personal information listed in the facts below.
 - Ensure my file reflects only current, accurate personal information.
 - Apply changes across all versions of my file and send me an updated report."""
-        laws_text = "federal credit reporting law that requires accurate and up-to-date personal information"
-        word_range = "120–200"
 
     elif mode == "r1":
-        voice = """Voice & tone:
-- First-person consumer. Friendly but firm. Plain English—no legalese.
-- Do NOT deny ownership unless identity theft was indicated. Use 'unfamiliar' / 'do not recognize' phrasing."""
         base_requests = [
             "Conduct a reasonable reinvestigation within the normal timeline.",
             "If any item cannot be fully verified as accurate and complete, delete it or correct it across all versions of my file.",
@@ -324,177 +401,263 @@ def build_prompt(
             "Send me an updated copy of my report reflecting any changes.",
         ]
         # targeted adds
-        if involves_reinsertion:
+        if f.involves_reinsertion:
             base_requests.insert(0, "Confirm whether written reinsertion notice was sent within 5 business days as required by FCRA §611(a)(5)(B).")
             base_requests.insert(1, "If the notice was not sent or the reinsertion cannot be substantiated, delete the item until proper verification is completed.")
-        if involves_inquiry:
+        if f.involves_inquiry:
             base_requests.insert(0, "Identify the specific permissible purpose or provide a copy of the signed authorization for the inquiry; delete it if neither exists (FCRA §604).")
-        if mentions_monthly_chargeoff or mentions_monthly_collection:
+        if f.mentions_monthly_chargeoff or f.mentions_monthly_collection:
             base_requests.append("Correct reporting so the item reflects a single historical event and does not appear newly derogatory each month (no re-aging; accurate DOFD).")
-        if mentions_past_due_after_co:
+        if f.mentions_past_due_after_co:
             base_requests.append("Correct any 'past due' amounts reported after a charge-off where no new past-due should accrue.")
-        if involves_repo:
+        if f.involves_repo:
             base_requests.append("Confirm sale date, proceeds/credits, any deficiency balance, and ensure no duplicate balances between original creditor and any collector.")
-        if involves_duplicate:
+        if f.involves_duplicate:
             base_requests.append("Delete the duplicate tradeline so only one accurate account remains.")
-        if involves_mixed_file:
+        if f.involves_mixed_file:
             base_requests.append("Remove data that does not belong to me and confirm the data sources used to associate those records.")
-        if involves_public_record:
+        if f.involves_public_record:
             base_requests.append("Identify the public record source relied upon and delete the item if it cannot be verified.")
         requests = "Requests to include:\n- " + "\n- ".join(base_requests)
-        laws_text = "federal credit reporting law that requires accurate, complete, and verifiable reporting"
-        word_range = "140–220"
 
     elif mode == "r2":
         if s == "mov":
-            voice = """Voice & tone:
-- First-person consumer. Direct but polite. Plain English.
-- Focus on how the item was verified; avoid legal jargon."""
             base_requests = [
                 "Provide the specific method of verification.",
                 "Provide the name, address, and phone number of the furnisher relied upon.",
                 "If you cannot fully verify accuracy and completeness, delete or correct the item across all versions of my file.",
                 "Send me an updated report reflecting the outcome.",
             ]
-            if involves_reinsertion:
+            if f.involves_reinsertion:
                 base_requests.insert(0, "Confirm whether written reinsertion notice was sent within 5 business days (FCRA §611(a)(5)(B)); if not, delete the item until proper verification is completed.")
-            if involves_inquiry:
+            if f.involves_inquiry:
                 base_requests.insert(0, "Provide the permissible purpose or signed authorization for the inquiry; delete if neither exists (FCRA §604).")
-            if mentions_monthly_chargeoff or mentions_monthly_collection:
+            if f.mentions_monthly_chargeoff or f.mentions_monthly_collection:
                 base_requests.append("Affirm that reporting will not re-age the item or make it appear newly derogatory each month; ensure the DOFD is accurate.")
-            if mentions_past_due_after_co:
+            if f.mentions_past_due_after_co:
                 base_requests.append("Correct any 'past due' reporting that continues after a charge-off where no new past-due should accrue.")
-            if involves_repo:
+            if f.involves_repo:
                 base_requests.append("Confirm sale date, proceeds/credits, any deficiency balance, and remove any duplicate balances across furnishers.")
-            if involves_duplicate:
+            if f.involves_duplicate:
                 base_requests.append("Remove the duplicate tradeline and ensure balances/payment history are not double-counted.")
-            if involves_mixed_file:
+            if f.involves_mixed_file:
                 base_requests.append("Remove records that do not belong to me and confirm the data sources used.")
-            if involves_public_record:
+            if f.involves_public_record:
                 base_requests.append("Identify the public record source and delete the item if it cannot be verified.")
             requests = "Requests to include:\n- " + "\n- ".join(base_requests)
-            laws_text = "my right to a reasonable reinvestigation and to understand how items are verified"
-            word_range = "140–220"
         else:  # factual
-            voice = """Voice & tone:
-- Clear, consumer-friendly, and factual. Prefer 'appears inconsistent with' rather than legalistic conclusions.
-- Keep the focus on correcting or deleting inaccuracies and requesting MOV details only if the item is verified."""
             base_requests = [
                 "Correct the specific inaccuracies (status/balance/remarks/DOFD) so the item reflects a single historical event where applicable, or delete it if it cannot be fully verified as accurate and complete.",
                 "If verified, provide the method of verification and the furnisher’s name, address, and phone number.",
                 "Apply corrections across all versions of my file and send an updated copy of my report.",
             ]
-            if involves_reinsertion:
+            if f.involves_reinsertion:
                 base_requests.insert(0, "Confirm whether written reinsertion notice was sent within 5 business days (FCRA §611(a)(5)(B)); if not, delete the item until proper verification is completed.")
-            if involves_inquiry:
+            if f.involves_inquiry:
                 base_requests.insert(0, "Identify the permissible purpose or provide signed authorization for the inquiry; delete if neither exists (FCRA §604).")
-            if mentions_monthly_chargeoff or mentions_monthly_collection:
+            if f.mentions_monthly_chargeoff or f.mentions_monthly_collection:
                 base_requests.append("Ensure the item does not re-age or appear newly derogatory each month; keep DOFD accurate.")
-            if mentions_past_due_after_co:
+            if f.mentions_past_due_after_co:
                 base_requests.append("Remove any 'past due' amounts that continue post charge-off where they should not accrue.")
-            if involves_repo:
+            if f.involves_repo:
                 base_requests.append("Report sale date, proceeds/credits, any deficiency, and avoid duplicate balances between original creditor and collector.")
-            if involves_duplicate:
+            if f.involves_duplicate:
                 base_requests.append("Delete the duplicate tradeline; keep one accurate account only.")
-            if involves_mixed_file:
+            if f.involves_mixed_file:
                 base_requests.append("Remove non-belonging records and confirm source matching used.")
-            if involves_public_record:
+            if f.involves_public_record:
                 base_requests.append("Identify the public record source; delete the item if it cannot be verified.")
             requests = "Requests to include:\n- " + "\n- ".join(base_requests)
-            laws_text = legal_laws_text()
-            word_range = "180–300"
 
     else:  # mode == "r3"
         if s == "mov":
-            voice = """Voice & tone:
-- Firm but professional. Focus on verification process and transparency."""
             base_requests = [
                 "Provide the exact method of verification and furnisher contact details used in your prior decision.",
                 "If prior verification cannot be substantiated, delete or correct the item immediately and confirm in writing.",
                 "Send me an updated report reflecting the final disposition.",
             ]
-            if involves_reinsertion:
+            if f.involves_reinsertion:
                 base_requests.insert(0, "Confirm whether written reinsertion notice was sent within 5 business days (FCRA §611(a)(5)(B)); if not, delete the item until proper verification is completed.")
-            if involves_inquiry:
+            if f.involves_inquiry:
                 base_requests.insert(0, "Provide the permissible purpose or signed authorization for the inquiry; delete if neither exists (FCRA §604).")
-            if mentions_monthly_chargeoff or mentions_monthly_collection:
+            if f.mentions_monthly_chargeoff or f.mentions_monthly_collection:
                 base_requests.append("Affirm that reporting will not re-age or appear newly derogatory each month; DOFD must remain accurate.")
-            if mentions_past_due_after_co:
+            if f.mentions_past_due_after_co:
                 base_requests.append("Correct any 'past due' accrual shown after a charge-off where inappropriate.")
-            if involves_repo:
+            if f.involves_repo:
                 base_requests.append("Confirm sale date, proceeds/credits, any deficiency, and remove duplicates across furnishers.")
-            if involves_duplicate:
+            if f.involves_duplicate:
                 base_requests.append("Delete duplicate tradeline(s) so that only one accurate account remains.")
-            if involves_mixed_file:
+            if f.involves_mixed_file:
                 base_requests.append("Remove non-belonging records and confirm matching logic.")
-            if involves_public_record:
+            if f.involves_public_record:
                 base_requests.append("Identify the public record source; delete the item if unverifiable.")
             requests = "Requests to include:\n- " + "\n- ".join(base_requests)
-            laws_text = "my right to a reasonable reinvestigation and to understand how items are verified"
-            word_range = "150–240"
         else:  # factual
-            voice = """Voice & tone:
-- Firm, factual, professional. Prefer 'appears inconsistent with' to avoid overreach. Keep requests specific and actionable."""
             base_requests = [
                 "Correct or delete the specific inaccuracies listed below and stop any practice that makes the item appear newly derogatory each month. Do not advance the original delinquency date (no re-aging).",
                 "If verified, provide method of verification and furnisher contact; apply corrections across all file versions and send an updated report.",
             ]
-            if involves_reinsertion:
+            if f.involves_reinsertion:
                 base_requests.insert(0, "Confirm whether written reinsertion notice was sent within 5 business days (FCRA §611(a)(5)(B)); if not, delete the item until proper verification is completed.")
-            if involves_inquiry:
+            if f.involves_inquiry:
                 base_requests.insert(0, "Identify the permissible purpose or provide signed authorization for the inquiry; delete if neither exists (FCRA §604).")
-            if mentions_monthly_chargeoff or mentions_monthly_collection:
+            if f.mentions_monthly_chargeoff or f.mentions_monthly_collection:
                 base_requests.append("Ensure the item reflects a single historical event and does not re-age; keep DOFD accurate.")
-            if mentions_past_due_after_co:
+            if f.mentions_past_due_after_co:
                 base_requests.append("Remove any inappropriate 'past due' amounts shown after a charge-off.")
-            if involves_repo:
+            if f.involves_repo:
                 base_requests.append("Report sale date, proceeds/credits, any deficiency; avoid duplicate balances between original creditor and collector.")
-            if involves_duplicate:
+            if f.involves_duplicate:
                 base_requests.append("Delete duplicate tradeline entries and maintain one accurate account.")
-            if involves_mixed_file:
+            if f.involves_mixed_file:
                 base_requests.append("Remove data that does not belong to me and confirm the source matching used.")
-            if involves_public_record:
+            if f.involves_public_record:
                 base_requests.append("Identify the public record source relied upon; delete if unverifiable.")
             requests = "Requests to include:\n- " + "\n- ".join(base_requests)
-            laws_text = legal_laws_text()
-            word_range = "180–320"
 
-    # ---------- assemble final prompt ----------
-    facts_block = "- " + "\n- ".join(fact_lines) if fact_lines else "- (No facts were provided.)"
+    return requests
 
-    hints_block = ""
-    if extra_hints:
-        hints_block = "- " + "\n- ".join(extra_hints)
+def prompt_sections(
+    user_info,
+    dispute_details,
+    dispute_types,
+    bureau,
+    round_num,              # "Personal Info" or 1 / 2 / 3 (int or str)
+    law_selection,
+    strategy=None           # optional: "mov" or "factual" for R2/R3
+) -> list[tuple[str, str]]:
+    """
+    The prompt as named sections, in order: static, requests, hints, context, facts.
+    "static" depends only on (mode, strategy); "requests" and "hints" only on
+    (mode, strategy, flags) and are memoized; context and facts are rendered per call.
+    Everything shared across users comes before anything per-user, so the whole
+    (mode, strategy, flags) part can be served from the provider's prompt cache.
 
-    purpose = (
-        "Personal info cleanup" if mode == "pi" else
-        ("Round 1 investigation" if mode == "r1" else
-         ("Round 2 – " + s.upper() if mode == "r2" else "Round 3 – " + s.upper()))
-    )
+    Modes:
+      - "Personal Info"   -> Personal info cleanup (pre-step, not a round)
+      - Round 1           -> Soft investigation request (consumer tone)
+      - Round 2           -> MOV or Factual (choose via `strategy`)
+      - Round 3           -> whichever wasn't used in Round 2 (or pass `strategy`)
 
-    prompt = f"""
-Write ONLY the body paragraphs of a consumer credit letter.
-Do NOT include the consumer header, bureau address, date, salutation, or signature.
+    Multi-account support:
+      - Step 4.5 can store a list in dispute_details["account_items"] with up to 5 items:
+        {name, last4, issue, docs, dofd_ym, event_ym}
+      - If present, we use those to create individual fact bullets.
+      - If absent, we fall back to the older single-account fields.
+    """
 
-Voice & tone and style guidance:
-{voice}
+    mode, s = normalize_round(round_num, strategy)
+    return _render(dispute_details, dispute_types, bureau, mode, s, law_selection)[1]
+
+def prompt_parts(user_info, dispute_details, dispute_types, bureau, round_num, law_selection, strategy=None) -> dict:
+    """
+    The pieces build_prompt assembles, unjoined: {"mode", "strategy", "flags", "fact_lines",
+    "laws", "requests", "hints"} (fact lines already fitted to the token budget).
+    """
+    mode, s = normalize_round(round_num, strategy)
+    flags, _, fact_lines = _render(dispute_details, dispute_types, bureau, mode, s, law_selection)
+    return {
+        "mode": mode,
+        "strategy": s,
+        "flags": flags,
+        "fact_lines": fact_lines,
+        "laws": laws_text(mode, s, flags, law_selection),
+        "requests": requests_section(mode, s, flags),
+        "hints": hints_section(flags),
+    }
+
+def _render(dispute_details, dispute_types, bureau, mode: str, s: str, law_selection,
+            signals=issue_signals) -> tuple[PromptFlags, list[tuple[str, str]], list[str]]:
+    """prompt_sections after round/strategy normalization; also returns the flags and fact lines."""
+    # ---------- normalize dispute types ----------
+    types = []
+    if isinstance(dispute_types, (list, tuple)):
+        for t in dispute_types:
+            types.append(str(t).lower().replace(" ", "_"))
+    elif dispute_types:
+        types.append(str(dispute_types).lower().replace(" ", "_"))
 
-Context:
-- Purpose: {purpose}
-- Bureau: {bureau}
-- Laws to consider: {laws_text}
+    # ---------- facts + flags (per call); requests / hints / laws (memoized per flags) ----------
+    furnisher = isinstance(dispute_types, (list, tuple)) and any(
+        t in ("account", "duplicate", "repo", "collection") for t in types)
+    dd = dispute_details or {}
+    fact_lines, flags = _facts_and_flags(dd, types, mode, furnisher, signals)
+
+    sections = [
+        ("static",   static_prefix(mode, s)),
+        ("requests", "Requests:\n" + requests_section(mode, s, flags)),
+        ("hints",    hints_section(flags)),
+        ("context",  f"Context:\n- Bureau: {bureau}\n- Laws to consider: {laws_text(mode, s, flags, law_selection)}"),
+        ("facts",    _facts_section(fact_lines)),
+    ]
+    facts_at = len(sections) - 1
+
+    # ---------- token budget: shorten free-text fields until the facts fit ----------
+    # (flags above come from the full text, so trimming never drops guidance)
+    room = prompt_budget(mode, s) - sum(estimate_tokens(t) for name, t in sections if name != "facts")
+    if estimate_tokens(sections[facts_at][1]) > room:
+        for cap in TRIM_STEPS:
+            fact_lines = _facts_and_flags(trim_free_text(dd, cap), types, mode, furnisher, signals)[0]
+            facts = _facts_section(fact_lines)
+            if estimate_tokens(facts) <= room:
+                break
+        sections[facts_at] = ("facts", facts)
+    return flags, sections, fact_lines
+
+def _facts_section(fact_lines: list[str]) -> str:
+    facts_block = "- " + "\n- ".join(fact_lines) if fact_lines else "- (No facts were provided.)"
+    return FACTS_HEADER + "\n" + facts_block
 
-Facts to address (use only what is relevant; do not invent details):
-{facts_block}
+def build_prompt(user_info, dispute_details, dispute_types, bureau, round_num, law_selection, strategy=None):
+    """Returns a single prompt string for the LLM (the sections of prompt_sections, joined)."""
+    return join_sections(prompt_sections(user_info, dispute_details, dispute_types, bureau,
+                                         round_num, law_selection, strategy))
 
-Requests:
-{requests}
+def join_sections(sections: list[tuple[str, str]]) -> str:
+    return "\n\n".join(text for _, text in sections if text)
 
-Style constraints:
-- {word_range} words in 2–5 short paragraphs.
-- Use unique phrasing (avoid boilerplate like "I am writing to dispute..."; vary the first sentence).
-- Be specific about the remedy (delete, correct, or cease reporting).
-{("Additional considerations:\n" + hints_block) if hints_block else ""}
-""".strip()
+# ---------- batches ----------
+
+def batch_build_prompts(intakes: list[dict]) -> list[dict]:
+    """
+    Build many prompts at once. Each intake is a dict of build_prompt's keyword arguments.
+    Round/strategy normalization and issue-signal extraction are shared across the batch
+    (identical issue texts are scanned once), as are the memoized static sections.
 
-    return prompt
+    Returns one dict per intake, in order:
+      {"prompt", "mode", "strategy", "flags": PromptFlags, "est_tokens", "section_tokens": {name: n}}
+    or {"error": "..."} for an intake that could not be built.
+    """
+    rounds: dict[tuple, tuple[str, str]] = {}
+    sig_memo: dict = {}
+
+    def signals(text):
+        sig = sig_memo.get(text)
+        if sig is None:
+            sig = sig_memo[text] = issue_signals(text)
+        return sig
+
+    out = []
+    for intake in intakes:
+        try:
+            rkey = (str(intake.get("round_num")), intake.get("strategy"))
+            ms = rounds.get(rkey)
+            if ms is None:
+                ms = rounds[rkey] = normalize_round(*rkey)
+            mode, s = ms
+            flags, sections, _ = _render(intake.get("dispute_details"), intake.get("dispute_types"),
+                                      intake.get("bureau", ""), mode, s, intake.get("law_selection"), signals)
+        except Exception as e:
+            out.append({"error": f"{e.__class__.__name__}: {e}"})
+            continue
+        section_tokens = {name: estimate_tokens(text) for name, text in sections}
+        out.append({
+            "prompt": join_sections(sections),
+            "mode": mode,
+            "strategy": s,
+            "flags": flags,
+            "est_tokens": sum(section_tokens.values()),
+            "section_tokens": section_tokens,
+        })
+    return out
@@ -0,0 +1,146 @@
+# utils/quick_help.py
+# Sidebar "Quick Help": answer repeat questions locally from the tips/FAQ/step
+# content, and only call the LLM (small model, bounded context, streamed) when needed.
+import os, re, math, time
+from functools import lru_cache
+
+from utils.tips import TIP_BANK, FAQS, STEP_HELP
+from utils.metrics import record_llm_call, usage_from
+from utils.run_stats import count
+
+HELP_MODEL         = os.getenv("HELP_MODEL", "gpt-4o-mini")
+HELP_MAX_TOKENS    = 300
+HELP_RECENT_MSGS   = 6      # last N chat messages sent verbatim
+HELP_MSG_CHARS     = 800    # per-message cap
+HELP_SUMMARY_CHARS = 600    # older turns are folded into a short summary
+HELP_TURN_CHARS    = 160    # per-turn cap inside that summary
+LOCAL_MIN_SCORE    = 0.6    # share of (idf-weighted) question terms a local entry must cover
+
+SYSTEM_PROMPT = (
+    "You are an in-app helper for a credit-dispute letter generator. "
+    "Be concise, step-specific, and avoid legal advice. "
+    "If the user asks for legal advice, say you cannot provide it. "
+    "Explain fields, flow, and general law meanings in plain language."
+)
+
+_STOP = {
+    "a", "an", "and", "are", "as", "at", "be", "can", "could", "do", "does", "for", "from",
+    "how", "i", "if", "in", "is", "it", "me", "my", "of", "on", "or", "should", "so", "the",
+    "this", "to", "what", "when", "where", "which", "who", "why", "will", "with", "you", "your",
+    "about", "get", "have", "has", "need", "want", "would", "there", "they", "them", "it's",
+}
+
+def _tokens(text: str) -> set[str]:
+    words = re.findall(r"[a-z0-9§]+", (text or "").lower().replace("’", "'"))
+    out = set()
+    for w in words:
+        if w in _STOP or len(w) < 2:
+            continue
+        if len(w) > 4 and w.endswith("s"):
+            w = w[:-1]  # crude plural folding: disputes -> dispute
+        out.add(w)
+    return out
+
+@lru_cache(maxsize=1)
+def _index():
+    """Build (entries, idf) once per process from FAQs, step help and the tip bank."""
+    entries = []  # (tokens, answer)
+    for q, a in FAQS:
+        entries.append((frozenset(_tokens(q) | _tokens(a)), a))
+    for step, text in STEP_HELP.items():
+        entries.append((frozenset(_tokens(text) | {"step", step}), text))
+    for key, tips in TIP_BANK.items():
+        key_terms = _tokens(key.replace("_", " "))
+        for tip in tips:
+            entries.append((frozenset(_tokens(tip) | key_terms), tip))
+
+    df = {}
+    for toks, _ in entries:
+        for t in toks:
+            df[t] = df.get(t, 0) + 1
+    n = len(entries)
+    idf = {t: math.log(1 + n / c) for t, c in df.items()}
+    return entries, idf
+
+def answer_locally(question: str, step: str | None = None) -> str | None:
+    """Return a canned answer when the question is a known repeat, else None."""
+    q = (question or "").strip()
+    if not q:
+        return None
+    if step and step in STEP_HELP and re.search(r"\b(this|current|next) step\b|\bwhat do i do\b", q.lower()):
+        return STEP_HELP[step]
+
+    entries, idf = _index()
+    terms = _tokens(q)
+    if not terms:
+        return None
+    # unseen words get the max weight: a question about something we have no content for should miss
+    max_idf = max(idf.values()) if idf else 1.0
+    total = sum(idf.get(t, max_idf) for t in terms)
+    best, best_score = None, 0.0
+    for toks, answer in entries:
+        score = sum(idf[t] for t in terms & toks) / total
+        if score > best_score:
+            best, best_score = answer, score
+    return best if best_score >= LOCAL_MIN_SCORE else None
+
+def _clip(text: str, n: int) -> str:
+    text = (text or "").strip()
+    return text if len(text) <= n else text[: n - 1] + "…"
+
+def build_messages(history: list[dict]) -> list[dict]:
+    """
+    Bounded context: system prompt + a one-line summary of older turns (questions and
+    answers, newest kept when it has to be cut) + the last HELP_RECENT_MSGS messages
+    (each clipped).
+    """
+    older, recent = history[:-HELP_RECENT_MSGS], history[-HELP_RECENT_MSGS:]
+    msgs = [{"role": "system", "content": SYSTEM_PROMPT}]
+    turns, used = [], 0
+    for m in reversed(older):
+        if m.get("role") not in ("user", "assistant"):
+            continue
+        turn = ("Q: " if m["role"] == "user" else "A: ") + _clip(m["content"], HELP_TURN_CHARS)
+        if used + len(turn) > HELP_SUMMARY_CHARS:
+            break
+        turns.append(turn)
+        used += len(turn) + 3
+    if turns:
+        msgs.append({
+            "role": "system",
+            "content": "Earlier in this chat (Q = user, A = your answer): " + " | ".join(reversed(turns)),
+        })
+    msgs += [{"role": m["role"], "content": _clip(m["content"], HELP_MSG_CHARS)} for m in recent]
+    return msgs
+
+def stream_answer(history: list[dict]):
+    """Yield answer text chunks from the helper model (for st.write_stream)."""
+    from utils.llm import get_client
+
+    t0 = time.monotonic()
+    ttft = None
+    last = None
+    ok = False
+    try:
+        count("llm")
+        stream = get_client().chat.completions.create(
+            model=HELP_MODEL,
+            messages=build_messages(history),
+            temperature=0.4,
+            max_tokens=HELP_MAX_TOKENS,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                if ttft is None:
+                    ttft = time.monotonic() - t0
+                yield chunk.choices[0].delta.content
+            if getattr(chunk, "usage", None):
+                last = chunk
+        ok = True
+    finally:
+        record_llm_call("helper", mode="help", model=HELP_MODEL, ok=ok,
+                        wall_s=round(time.monotonic() - t0, 3),
+                        ttft_s=round(ttft, 3) if ttft is not None else None,
+                        **usage_from(last))
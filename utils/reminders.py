@@ -1,9 +1,10 @@
 # utils/reminders.py
 import os, json
+from functools import lru_cache
 from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
-import gspread
-from google.oauth2.service_account import Credentials
+from utils.lazy_imports import gspread, service_account_credentials, worksheet_not_found, rowcol_to_a1
+from utils.run_stats import counting_sheets
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -20,16 +21,16 @@ REM_HEADERS = [
 
 def _gc():
     if GA_CRED_PATH and os.path.exists(GA_CRED_PATH):
-        creds = Credentials.from_service_account_file(GA_CRED_PATH, scopes=SCOPE)
-        return gspread.authorize(creds)
-    return gspread.service_account()
+        creds = service_account_credentials().from_service_account_file(GA_CRED_PATH, scopes=SCOPE)
+        return counting_sheets(gspread().authorize(creds))
+    return counting_sheets(gspread().service_account())
 
 def _open_reminders_ws():
     gc = _gc()
     ss = gc.open_by_key(JOBS_SHEET_ID)
     try:
         ws = ss.worksheet("Reminders")
-    except gspread.WorksheetNotFound:
+    except worksheet_not_found():
         ws = ss.add_worksheet("Reminders", rows=2000, cols=len(REM_HEADERS))
         ws.append_row(REM_HEADERS)
     # Ensure header present
@@ -74,15 +75,18 @@ def schedule_followups(letter_id: str, email: str, bureau: str, round_name: str,
         ]
         ws.append_row(rem, value_input_option="USER_ENTERED")
 
-def list_due_reminders(limit: int = 50):
-    """Return pending reminders due now or earlier."""
+def list_due_reminders(limit: int = 50, until: datetime | None = None):
+    """
+    Return pending reminders due now or earlier.
+    Pass `until` (UTC) to look ahead, e.g. to the end of the local day for digests.
+    """
     ws = _open_reminders_ws()
     rows = ws.get_all_values()
     hdr = rows[0] if rows else []
     idx = {h:i for i,h in enumerate(hdr)}
     out = []
-    now = _now_utc()
-    for r in rows[1:]:
+    now = until or _now_utc()
+    for row_num, r in enumerate(rows[1:], start=2):
         try:
             status = r[idx["status"]].strip().lower()
             due = r[idx["due_at_utc"]].strip()
@@ -97,8 +101,9 @@ def list_due_reminders(limit: int = 50):
                     "phone": r[idx["phone"]],
                     "channel": r[idx["channel"]],
                     "topic": r[idx["topic"]],
+                    "due_at_utc": due,
                     "payload": json.loads(r[idx["payload_json"]] or "{}"),
-                    "__row": len(out) + 2  # not exact row; we’ll update by A1 later
+                    "__row": row_num,  # exact sheet row (1-based) for batched write-back
                 })
         except Exception:
             continue
@@ -107,13 +112,137 @@ def list_due_reminders(limit: int = 50):
     return out
 
 def mark_sent(reminder_id: str, sent_ok: bool):
+    mark_sent_many([{"reminder_id": reminder_id, "sent_ok": sent_ok}])
+
+def mark_sent_many(results: list[dict]):
+    """
+    Write many delivery outcomes back in ONE batch_update.
+    results: [{"reminder_id": "...", "sent_ok": True/False}, ...]
+    Rows are located by reminder_id (column A), so a stale "__row" never
+    lands on the wrong reminder.
+    """
+    if not results:
+        return
     ws = _open_reminders_ws()
     rows = ws.get_all_values()
     hdr = rows[0]
     idx = {h:i for i,h in enumerate(hdr)}
-    for i, r in enumerate(rows[1:], start=2):
-        if r and r[0] == reminder_id:
-            ws.update_cell(i, idx["status"]+1, "sent" if sent_ok else "failed")
-            ws.update_cell(i, idx["sent_at_utc"]+1, _now_utc().strftime("%Y-%m-%d %H:%M:%S"))
-            ws.update_cell(i, idx["updated_at_utc"]+1, _now_utc().strftime("%Y-%m-%d %H:%M:%S"))
-            return
+    row_of = {r[0]: i for i, r in enumerate(rows[1:], start=2) if r}
+    now = _now_utc().strftime("%Y-%m-%d %H:%M:%S")
+
+    updates = []
+    for res in results:
+        i = row_of.get(res.get("reminder_id"))
+        if not i:
+            continue
+        status = "sent" if res.get("sent_ok") else "failed"
+        for col, val in (("status", status), ("sent_at_utc", now), ("updated_at_utc", now)):
+            updates.append({"range": rowcol_to_a1(i, idx[col]+1), "values": [[val]]})
+    if updates:
+        ws.batch_update(updates, value_input_option="USER_ENTERED")
+
+# ---- message copy per topic (used by the dispatcher) ----
+REMINDER_COPY = {
+    "mail_nudge": (
+        "Did you mail your {bureau} letter?",
+        "Quick reminder: your {round} letter to {bureau} is ready. Mail it with tracking and keep the receipt.",
+    ),
+    "status_check": (
+        "Any response from {bureau} yet?",
+        "It has been about two weeks since your {round} letter to {bureau}. If they say \"verified\", request the method of verification.",
+    ),
+    "next_round_ready": (
+        "Ready for your next round with {bureau}?",
+        "Your {round} dispute with {bureau} should be resolved by now. Log in to review results and prepare the next round.",
+    ),
+}
+
+_FALLBACK_COPY = (
+    "Update on your {bureau} dispute",
+    "Log in to BoostBridgeDIY to check on your {round} dispute with {bureau}.",
+)
+
+def reminder_template(topic: str) -> tuple[str, str, str]:
+    """Return (subject, html, sms) templates with {bureau}/{round} placeholders for a topic."""
+    subject_t, body_t = REMINDER_COPY.get(topic or "", _FALLBACK_COPY)
+    html_t = f"<p>{body_t}</p><p style=\"color:#6b7280\">BoostBridgeDIY • Personal-use tool, not legal advice.</p>"
+    sms_t = f"BoostBridgeDIY: {body_t} Reply STOP to opt out."
+    return subject_t, html_t, sms_t
+
+def reminder_context(rem: dict) -> dict:
+    """Per-recipient values for the reminder templates."""
+    payload = rem.get("payload") or {}
+    return {
+        "bureau": payload.get("bureau") or "the bureau",
+        "round":  payload.get("round") or "dispute",
+    }
+
+def render_reminder(rem: dict) -> tuple[str, str, str]:
+    """Return (subject, html_body, sms_text) for a reminder dict from list_due_reminders."""
+    ctx = reminder_context(rem)
+    return tuple(t.format(**ctx) for t in reminder_template(rem.get("topic", "")))
+
+# ---- daily digests (coalesce a user's reminders into one message per channel) ----
+def end_of_local_day_utc(now: datetime | None = None) -> datetime:
+    """Last second of today in LOCAL_TZ, expressed in UTC (digest look-ahead window)."""
+    local = (now or _now_utc()).astimezone(LOCAL_TZ)
+    end = local.replace(hour=23, minute=59, second=59, microsecond=0)
+    return end.astimezone(timezone.utc)
+
+def _due_dt(rem: dict) -> datetime | None:
+    try:
+        return datetime.strptime(rem.get("due_at_utc", ""), "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    except Exception:
+        return None
+
+def coalesce_reminders(reminders: list[dict], now: datetime | None = None) -> list[list[dict]]:
+    """
+    Group reminders by (channel, recipient, local day).
+    A group is returned only if at least one member is due now; members due
+    later the same day ride along so the user gets ONE message that day.
+    Groups keep the input order; single-member groups are returned as-is.
+    """
+    now = now or _now_utc()
+    groups: dict[tuple, list[dict]] = {}
+    for rem in reminders:
+        channel = (rem.get("channel") or "email").strip().lower()
+        addr = (rem.get("phone") if channel == "sms" else rem.get("email")) or ""
+        due = _due_dt(rem) or now
+        day = due.astimezone(LOCAL_TZ).strftime("%Y-%m-%d")
+        groups.setdefault((channel, addr.strip().lower(), day), []).append(rem)
+
+    out = []
+    for members in groups.values():
+        if any((_due_dt(m) or now) <= now for m in members):
+            out.append(members)
+    return out
+
+@lru_cache(maxsize=None)
+def _digest_shell(channel: str) -> tuple[str, str]:
+    """Outer digest template per channel; built once per process."""
+    if channel == "sms":
+        return "", "BoostBridgeDIY ({n} reminders): {items} Reply STOP to opt out."
+    return (
+        "Your BoostBridgeDIY reminders ({n})",
+        "<p>Here's what's on your dispute checklist today:</p><ul>{items}</ul>"
+        "<p style=\"color:#6b7280\">BoostBridgeDIY • Personal-use tool, not legal advice.</p>",
+    )
+
+@lru_cache(maxsize=None)
+def _digest_item(topic: str, channel: str) -> str:
+    """Per-topic line template inside a digest; built once per (topic, channel)."""
+    subject_t, body_t = REMINDER_COPY.get(topic or "", _FALLBACK_COPY)
+    if channel == "sms":
+        return subject_t
+    return f"<li><b>{subject_t}</b><br>{body_t}</li>"
+
+def render_digest(group: list[dict]) -> tuple[str, str, str]:
+    """Return (subject, html_body, sms_text) for a coalesced group of reminders."""
+    if len(group) == 1:
+        return render_reminder(group[0])
+    n = len(group)
+    email_items = "".join(_digest_item(r.get("topic", ""), "email").format(**reminder_context(r)) for r in group)
+    sms_items = " • ".join(_digest_item(r.get("topic", ""), "sms").format(**reminder_context(r)) for r in group)
+    subject_t, html_t = _digest_shell("email")
+    _, sms_t = _digest_shell("sms")
+    return subject_t.format(n=n), html_t.format(n=n, items=email_items), sms_t.format(n=n, items=sms_items)
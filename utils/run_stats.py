@@ -0,0 +1,161 @@
+# utils/run_stats.py
+# Rerun accounting: full script runs, Sheets requests and LLM requests per session,
+# per wizard step and per step transition.
+#
+# Requests are counted per Streamlit session: the script thread's own session, or, on a
+# pool thread, the session that handed it the work (submit in_session(fn) rather than fn).
+# A background retry shared by several sessions counts for the one that scheduled it.
+# Each full script run is charged the growth of its session's totals from its start to the
+# start of the next run (or to session_stats()). Fragment reruns are not full runs; their
+# requests are charged to the step that is open. tests/test_flow_budget.py checks the
+# wizard's totals against a budget.
+import sys, functools, threading, logging
+from collections import OrderedDict
+
+log = logging.getLogger("boostbridge.run_stats")
+
+KINDS = ("sheets", "llm")
+STATE_KEY = "_run_stats"
+SESSIONS_MAX = 1000   # most recently active sessions whose totals are kept
+
+_TOTALS: "OrderedDict[str, dict]" = OrderedDict()   # session id ("" = none) -> {kind: n}
+_BOUND = threading.local()
+_LOCK = threading.Lock()
+
+def current_session() -> str:
+    """Session id the calling thread works for ("" outside any session, e.g. the workers)."""
+    sid = getattr(_BOUND, "session", None)
+    if sid is not None:
+        return sid
+    if "streamlit" not in sys.modules:
+        return ""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx else ""
+
+def in_session(fn):
+    """fn, run for the calling thread's session wherever it is called (pool threads)."""
+    sid = current_session()
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        prev = getattr(_BOUND, "session", None)
+        _BOUND.session = sid
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _BOUND.session = prev
+    return run
+
+def count(kind: str, n: int = 1) -> None:
+    """One (or n) outgoing requests of `kind` ("sheets" / "llm"), for the current session."""
+    sid = current_session()
+    with _LOCK:
+        tot = _TOTALS.get(sid)
+        if tot is None:
+            tot = _TOTALS[sid] = {k: 0 for k in KINDS}
+        _TOTALS.move_to_end(sid)
+        while len(_TOTALS) > SESSIONS_MAX:
+            _TOTALS.popitem(last=False)
+        tot[kind] += n
+
+def totals(session: str | None = None) -> dict:
+    """{kind: n} so far for a session (default: the current one)."""
+    sid = current_session() if session is None else session
+    with _LOCK:
+        return dict(_TOTALS.get(sid) or {k: 0 for k in KINDS})
+
+# ---------- Sheets: count every request made through a client ----------
+
+class _CountedSheets:
+    """
+    Wraps a gspread Client / Spreadsheet / Worksheet: every method call is one Sheets
+    request (plain attributes like title / col_count are local and not counted).
+    Spreadsheets and worksheets it returns are wrapped the same way.
+    """
+    __slots__ = ("_obj",)
+
+    def __init__(self, obj):
+        self._obj = obj
+
+    def __getattr__(self, name):
+        attr = getattr(self._obj, name)
+        if name == "sheet1":
+            count("sheets")  # property, but fetches the spreadsheet's metadata
+            return _counted(attr)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            count("sheets")
+            return _counted(attr(*args, **kwargs))
+        return call
+
+def _counted(value):
+    if hasattr(value, "row_values") or hasattr(value, "worksheet"):
+        return _CountedSheets(value)
+    return value
+
+def counting_sheets(client):
+    """An authorized gspread client whose requests show up in run stats."""
+    return client if isinstance(client, _CountedSheets) else _CountedSheets(client)
+
+# ---------- per-session accounting ----------
+
+def _step_key(step) -> str:
+    if step is None:
+        return "landing"
+    try:
+        return f"{float(step):g}"
+    except (TypeError, ValueError):
+        return str(step)
+
+def _bucket(stats: dict, step: str) -> dict:
+    return stats["by_step"].setdefault(step, {"runs": 0, **{k: 0 for k in KINDS}})
+
+def _charge_open_run(stats: dict) -> None:
+    """Add the requests made since the open run started to the session and its step."""
+    run = stats.get("open")
+    if not run:
+        return
+    now = totals(run["session"])   # session_stats() may be read from outside the session
+    bucket = _bucket(stats, run["step"])
+    for k in KINDS:
+        delta = now[k] - run["start"][k]
+        stats[k] += delta
+        bucket[k] += delta
+    run["start"] = now
+
+def begin_run(state, step) -> None:
+    """Call at the top of every full script run (state = st.session_state)."""
+    stats = state.get(STATE_KEY) or {"runs": 0, **{k: 0 for k in KINDS},
+                                     "by_step": {}, "transitions": {}, "open": None}
+    _charge_open_run(stats)
+    key = _step_key(step)
+    prev = (stats.get("open") or {}).get("step")
+    if prev is not None and prev != key:
+        t = f"{prev}->{key}"
+        stats["transitions"][t] = stats["transitions"].get(t, 0) + 1
+    stats["runs"] += 1
+    _bucket(stats, key)["runs"] += 1
+    sid = current_session()
+    stats["open"] = {"step": key, "session": sid, "start": totals(sid)}
+    state[STATE_KEY] = stats
+    log.debug("run %d step=%s sheets=%d llm=%d", stats["runs"], key, stats["sheets"], stats["llm"])
+
+def session_stats(state) -> dict:
+    """
+    {"runs", "sheets", "llm", "by_step": {step: {...}}, "transitions": {"a->b": n}}
+    for this session so far (the current run included).
+    """
+    stats = state.get(STATE_KEY)
+    if not stats:
+        return {"runs": 0, **{k: 0 for k in KINDS}, "by_step": {}, "transitions": {}}
+    _charge_open_run(stats)
+    state[STATE_KEY] = stats
+    return {
+        "runs": stats["runs"],
+        **{k: stats[k] for k in KINDS},
+        "by_step": {s: dict(v) for s, v in stats["by_step"].items()},
+        "transitions": dict(stats["transitions"]),
+    }
@@ -0,0 +1,101 @@
+# utils/sms_pipeline.py
+# High-throughput SMS sending: shared Twilio client, threaded send pool,
+# per-sending-number pacing (see notifications.send_sms_detailed) and a retry queue.
+#
+# Also drives the Jobs-sheet follow-up columns filled by jobs.add_job_row:
+#   python -m utils.sms_pipeline          # send due first follow-ups once
+import os, sys, time, heapq, random, logging, itertools
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
+
+from utils import notifications
+
+load_dotenv()
+log = logging.getLogger("bb.sms")
+
+# Enough threads to keep every sender's pacer busy while others wait on Twilio.
+SMS_WORKERS      = int(os.getenv("SMS_WORKERS", "0") or "0") or max(4, 2 * len(notifications.TWILIO_SENDERS or [""]))
+SMS_MAX_ATTEMPTS = int(os.getenv("SMS_MAX_ATTEMPTS", "5") or "5")
+SMS_BACKOFF_S    = float(os.getenv("SMS_BACKOFF_S", "2.0") or "2.0")
+SMS_BACKOFF_MAX  = float(os.getenv("SMS_BACKOFF_MAX_S", "60") or "60")
+
+FOLLOWUP_TEXT = (
+    "BoostBridgeDIY: It's been about 10 days since your {round} letter to {bureau}. "
+    "Mailed it yet? Keep your tracking receipt. Reply STOP to opt out."
+)
+
+def _backoff(attempt: int) -> float:
+    return min(SMS_BACKOFF_S * (2 ** (attempt - 1)), SMS_BACKOFF_MAX) * random.uniform(0.75, 1.25)
+
+def _send(item: dict) -> tuple[dict, bool, bool]:
+    try:
+        ok, retryable = notifications.send_sms_detailed(item["to"], item["body"])
+    except Exception as e:
+        log.warning("sms %s raised: %s", item["key"], e)
+        ok, retryable = False, True
+    return item, ok, retryable
+
+def send_many(messages: list[dict], workers: int = SMS_WORKERS) -> dict[str, bool]:
+    """
+    Send many SMS as fast as the per-sender caps allow, without dropping any.
+    messages = [{"key": <unique id>, "to": "+1...", "body": "..."}]
+    Retryable failures (429/5xx/network) go to a delayed retry queue with
+    exponential backoff; permanent failures are reported immediately.
+    Returns {key: ok}.
+    """
+    results: dict[str, bool] = {}
+    retry_heap: list = []          # (due_monotonic, seq, item)
+    seq = itertools.count()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="bb-sms") as ex:
+        futures = set()
+        for m in messages:
+            futures.add(ex.submit(_send, {**m, "attempt": 1}))
+
+        while futures or retry_heap:
+            now = time.monotonic()
+            while retry_heap and retry_heap[0][0] <= now:
+                _, _, item = heapq.heappop(retry_heap)
+                futures.add(ex.submit(_send, item))
+
+            timeout = None
+            if retry_heap:
+                timeout = max(0.0, retry_heap[0][0] - time.monotonic())
+            if not futures:
+                time.sleep(timeout or 0)
+                continue
+
+            done, futures = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+            for f in done:
+                item, ok, retryable = f.result()
+                if ok:
+                    results[item["key"]] = True
+                elif retryable and item["attempt"] < SMS_MAX_ATTEMPTS:
+                    nxt = {**item, "attempt": item["attempt"] + 1}
+                    heapq.heappush(retry_heap, (time.monotonic() + _backoff(item["attempt"]), next(seq), nxt))
+                else:
+                    results[item["key"]] = False
+    return results
+
+def run_job_followups(limit: int = 1000) -> dict:
+    """Send every due first follow-up SMS and record sms_status/last_sms_at in one batch."""
+    from utils.jobs import list_sms_followups_due, mark_sms_results  # Streamlit-backed; import on use
+
+    due = list_sms_followups_due(limit=limit)
+    msgs = []
+    for rec in due:
+        round_name = rec.get("round_name") or rec.get("round") or "dispute"
+        msgs.append({
+            "key": rec["letter_id"],
+            "to": rec.get("phone_cached", ""),
+            "body": FOLLOWUP_TEXT.format(round=round_name, bureau=rec.get("bureau") or "the bureau"),
+        })
+    results = send_many(msgs)
+    mark_sms_results(results)
+    summary = {"due": len(due), "sent": sum(results.values()), "failed": sum(1 for v in results.values() if not v)}
+    log.info("sms follow-ups: %s", summary)
+    return summary
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    print(run_job_followups(limit=int(sys.argv[1]) if len(sys.argv) > 1 else 1000))
@@ -0,0 +1,79 @@
+# utils/speculative.py
+# Speculative letter generation. Step 7.5 starts the LLM call in the background once every
+# build_prompt input is final; the result is parked under the input hash. Step 8 commits it
+# if the inputs still match and otherwise discards it. Nothing here charges credits.
+import os, time, logging, threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+from utils.letter_body import generate_body
+from utils.run_stats import in_session
+
+load_dotenv()
+
+log = logging.getLogger("boostbridge.speculative")
+
+SPEC_ENABLED    = os.getenv("SPECULATIVE_GENERATION", "1").lower() in ("1", "true", "yes")
+SPEC_WORKERS    = int(os.getenv("SPEC_WORKERS", "4"))
+SPEC_TTL_S      = int(os.getenv("SPEC_TTL_S", "900"))     # parked results older than this are dropped
+SPEC_MAX_PARKED = int(os.getenv("SPEC_MAX_PARKED", "64"))  # process-wide cap
+SPEC_WAIT_S     = int(os.getenv("SPEC_WAIT_S", "90"))      # Step 8 waits this long for an in-flight run
+
+_PARKED: dict[str, dict] = {}   # key -> {"future", "started"}
+_LOCK = threading.Lock()
+_POOL = {"pool": None}
+
+def _pool() -> ThreadPoolExecutor:
+    if _POOL["pool"] is None:
+        _POOL["pool"] = ThreadPoolExecutor(max_workers=SPEC_WORKERS, thread_name_prefix="spec")
+    return _POOL["pool"]
+
+def _drop(key: str) -> None:
+    entry = _PARKED.pop(key, None)
+    if entry:
+        entry["future"].cancel()  # no-op if already running; the result is simply never read
+
+def _evict(now: float) -> None:
+    for key in [k for k, e in _PARKED.items() if now - e["started"] > SPEC_TTL_S]:
+        _drop(key)
+    while len(_PARKED) >= SPEC_MAX_PARKED:
+        _drop(min(_PARKED, key=lambda k: _PARKED[k]["started"]))
+
+def start(key: str, inputs: dict, cache=None) -> bool:
+    """
+    Start generating for `inputs` under `key` unless already parked. Returns True if started.
+    cache is the session's letter_sections.section_cache.
+    """
+    if not SPEC_ENABLED:
+        return False
+    with _LOCK:
+        if key in _PARKED:
+            return False
+        now = time.monotonic()
+        _evict(now)
+        _PARKED[key] = {"future": _pool().submit(in_session(generate_body), inputs, None, cache), "started": now}
+    log.info("speculative start %s", key[:8])
+    return True
+
+def take(key: str, timeout_s: float = SPEC_WAIT_S) -> tuple[str, dict] | None:
+    """
+    Claim the parked result for `key` (waiting for an in-flight run up to timeout_s).
+    Returns (raw_body, info) or None if nothing usable was parked.
+    """
+    with _LOCK:
+        entry = _PARKED.pop(key, None)
+    if not entry:
+        return None
+    try:
+        raw_body, info = entry["future"].result(timeout=timeout_s)
+    except Exception as e:
+        log.warning("speculative run %s unusable: %s", key[:8], e.__class__.__name__)
+        return None
+    info = dict(info, speculative=True, head_start_s=round(time.monotonic() - entry["started"], 3))
+    return raw_body, info
+
+def discard(key: str | None) -> None:
+    if not key:
+        return
+    with _LOCK:
+        _drop(key)
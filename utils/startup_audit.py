@@ -0,0 +1,136 @@
+# utils/startup_audit.py
+# Import-time audit for the app's entry paths. Each path is imported in a fresh interpreter
+# (`-X importtime`) after its baseline (what that process pays regardless, e.g. streamlit),
+# and is checked against two budgets:
+#   - import cost beyond the baseline <= STARTUP_BUDGET_MS
+#   - no heavy library (HEAVY) loaded by the import itself; those load on first use
+#     through utils.lazy_imports / utils.llm.get_client.
+#
+#   python -m utils.startup_audit              # every path; exit 1 if a budget is exceeded
+#   python -m utils.startup_audit landing      # one path
+#   python -m utils.startup_audit --top 20     # more of the slowest modules per path
+import os, sys, json, subprocess
+from dotenv import load_dotenv
+
+load_dotenv()
+
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "150"))
+STARTUP_AUDIT_RUNS = int(os.getenv("STARTUP_AUDIT_RUNS", "3"))   # best of N (import time is noisy)
+
+HEAVY = ("openai", "gspread", "google.oauth2", "bcrypt", "fpdf", "pandas")
+
+STREAMLIT = ("streamlit", "dotenv")
+WORKER = ("dotenv",)
+
+# path -> (baseline modules, modules the path imports)
+PATHS = {
+    # app.py up to the auth gate: everything an unauthenticated visitor's run imports
+    "landing":      (STREAMLIT, ("utils.lazy_imports", "utils.auth", "utils.credit_tracker")),
+    # first run after login: sidebar helper + Step 1
+    "wizard":       (STREAMLIT, ("utils.auth", "utils.credit_tracker", "utils.quick_help",
+                                 "components.step_1_intro")),
+    "step_8":       (STREAMLIT, ("components.step_8_generate_letter",)),
+    "dispatcher":   (WORKER, ("utils.dispatcher",)),
+    "sms_pipeline": (WORKER, ("utils.sms_pipeline",)),
+    "bulk_jobs":    (WORKER, ("utils.bulk_jobs",)),
+}
+
+MARK = "startup_audit: baseline loaded"
+
+# Runs in the child interpreter: argv = baseline, modules, heavy (JSON lists).
+_CHILD = f"""
+import sys, time, json, importlib
+base, mods, heavy = (json.loads(a) for a in sys.argv[1:4])
+for m in base:
+    importlib.import_module(m)
+before = set(sys.modules)
+sys.stderr.write({MARK!r} + "\\n")
+sys.stderr.flush()
+t0 = time.perf_counter()
+for m in mods:
+    importlib.import_module(m)
+ms = (time.perf_counter() - t0) * 1000
+print(json.dumps({{
+    "ms": ms,
+    "heavy": [h for h in heavy if h in sys.modules and h not in before],
+    "baseline_heavy": [h for h in heavy if h in before],
+}}))
+"""
+
+def _root() -> str:
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _parse_importtime(stderr: str) -> list[tuple[int, int, str]]:
+    """[(self_us, cumulative_us, module)] for imports after the baseline mark."""
+    lines = stderr.splitlines()
+    if MARK in lines:
+        lines = lines[lines.index(MARK) + 1:]
+    out = []
+    for ln in lines:
+        if not ln.startswith("import time:") or "self [us]" in ln:
+            continue
+        try:
+            self_us, cum_us, name = ln[len("import time:"):].split("|", 2)
+            out.append((int(self_us), int(cum_us), name.rstrip()))
+        except ValueError:
+            continue
+    return out
+
+def measure(name: str) -> dict:
+    """Best-of-N import cost of one path, with its slowest modules and heavy imports."""
+    base, mods = PATHS[name]
+    best = None
+    for _ in range(max(1, STARTUP_AUDIT_RUNS)):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", _CHILD,
+             json.dumps(list(base)), json.dumps(list(mods)), json.dumps(list(HEAVY))],
+            cwd=_root(), capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            tail = (proc.stderr.strip().splitlines() or ["no output"])[-1]
+            return {"path": name, "ok": False, "error": tail}
+        res = json.loads(proc.stdout.strip().splitlines()[-1])
+        if best is None or res["ms"] < best["ms"]:
+            best = dict(res, modules=_parse_importtime(proc.stderr))
+    over = best["ms"] > STARTUP_BUDGET_MS
+    return {
+        "path": name,
+        "ok": not over and not best["heavy"],
+        "ms": round(best["ms"], 1),
+        "heavy": best["heavy"],
+        "baseline_heavy": best["baseline_heavy"],
+        "slowest": sorted(best["modules"], key=lambda m: -m[1]),
+    }
+
+def report(results: list[dict], top: int = 8) -> str:
+    lines = [f"startup budget: {STARTUP_BUDGET_MS:.0f} ms beyond baseline, no eager {', '.join(HEAVY)}", ""]
+    for r in results:
+        if "error" in r:
+            lines.append(f"FAIL {r['path']:<13} import failed: {r['error']}")
+            continue
+        status = "ok  " if r["ok"] else "FAIL"
+        heavy = f"  eager heavy: {', '.join(r['heavy'])}" if r["heavy"] else ""
+        lines.append(f"{status} {r['path']:<13} {r['ms']:>8.1f} ms{heavy}")
+        if r["baseline_heavy"]:
+            lines.append(f"     (baseline already loads {', '.join(r['baseline_heavy'])})")
+        for self_us, cum_us, mod in r["slowest"][:top]:
+            lines.append(f"     {cum_us / 1000:>8.1f} ms cumulative  {self_us / 1000:>7.1f} ms self  {mod.strip()}")
+    return "\n".join(lines)
+
+def main(argv: list[str]) -> int:
+    top = 8
+    if "--top" in argv:
+        i = argv.index("--top")
+        top = int(argv[i + 1])
+        argv = argv[:i] + argv[i + 2:]
+    names = argv or list(PATHS)
+    unknown = [n for n in names if n not in PATHS]
+    if unknown:
+        print(f"unknown path(s): {', '.join(unknown)} (expected one of {', '.join(PATHS)})")
+        return 2
+    results = [measure(n) for n in names]
+    print(report(results, top=top))
+    return 0 if all(r["ok"] for r in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
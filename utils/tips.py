@@ -84,6 +84,34 @@ TIP_BANK = {
     ],
 }
 
+# FAQs shown on the Education page (and answered locally by the sidebar helper)
+FAQS = [
+    ("How long does a bureau have to respond?",
+     "Generally **30 days** from receipt for reinvestigation; +15 days if you supply new docs mid-investigation."),
+    ("Should I send disputes online or by mail?",
+     "Mail gives you tracking and a paper trail. If you dispute online, always download the response PDF."),
+    ("Can I dispute multiple items at once?",
+     "Yes, but keep each item specific. Overloaded letters can delay clean outcomes."),
+    ("My item was deleted then came back. What now?",
+     "That’s a **reinsertion** scenario—ask for when/why it was reinserted and which furnisher data was relied upon."),
+    ("Do I still owe a debt if it’s deleted?",
+     "Removal for accuracy/verification reasons doesn’t erase the underlying debt. You may still owe it."),
+]
+
+# What each wizard step is for (used by the sidebar helper)
+STEP_HELP = {
+    "1": "Step 1 is the welcome and disclaimer. Accept it to start building a letter.",
+    "2": "Step 2 (What Are You Disputing?): select one or more dispute categories (account, personal info, hard inquiry, duplicate account, public record, reinserted item, mixed file, repo, other), then click Next to choose the bureau.",
+    "3": "Step 3: choose the main credit bureau for this letter. In Step 8 you can also send the same dispute to the other major bureaus at once (each gets its own letter, one credit per letter).",
+    "4": "Step 4: pick the type of issue (account, inquiry, personal info, public record, duplicate, repo, mixed file, reinserted, other).",
+    "4.5": "Step 4.5: describe each item. For accounts, add up to 25 with the lender name, last 4, what is wrong, and optional YYYY-MM dates. More than 5 are split into letters of up to 5 to the same bureau, one credit per letter.",
+    "5": "Step 5: choose Personal Info cleanup, Round 1, 2 or 3. Rounds 2 and 3 let you pick MOV (method of verification) or Factual.",
+    "6": "Step 6: let the AI choose supporting laws, or pick them yourself from the list.",
+    "7": "Step 7: enter your name, address, DOB (MM/YYYY or YYYY) and SSN last 4 exactly as they should appear on the letter. Phone is optional for SMS reminders.",
+    "7.5": "Step 7.5: review everything, use the edit buttons to fix anything, then confirm to generate.",
+    "8": "Step 8: tick the disclaimer and click Generate. Download the TXT or PDF, then mail it with tracking.",
+}
+
 def _norm_dispute_type(dt: str) -> str:
     return dt.lower().replace(" ", "_")
 
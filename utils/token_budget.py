@@ -0,0 +1,69 @@
+# utils/token_budget.py
+# Token budgets for letter generation: a local token estimate, a per-mode prompt budget
+# (build_prompt trims free-text fact fields to fit it), and the completion cap derived
+# from the mode's word range.
+import os, math
+
+CHARS_PER_TOKEN = 4.0   # rough average for English prose with OpenAI tokenizers
+TOKENS_PER_WORD = 1.4   # English prose averages ~1.3–1.4 tokens/word
+TOKEN_HEADROOM  = 1.25  # room for a slightly long answer so it isn't cut mid-sentence
+
+# Whole-prompt budget per (mode, strategy), in estimated tokens. The fixed sections
+# (static prefix, context, requests, hints) take ~350 tokens typically and up to ~950
+# with every flag set; the rest is room for facts (a typical 3-item intake is ~100).
+PROMPT_BUDGETS = {
+    ("pi", ""):        1000,
+    ("r1", ""):        1300,
+    ("r2", "mov"):     1250,
+    ("r2", "factual"): 1400,
+    ("r3", "mov"):     1250,
+    ("r3", "factual"): 1400,
+}
+PROMPT_BUDGET_SCALE = float(os.getenv("PROMPT_BUDGET_SCALE", "1.0"))
+
+# Free-text fields a user types into Step 4.5 (names / last4 / dates are never trimmed).
+FREE_TEXT_FIELDS = ("issue", "docs", "details", "reason", "wrong", "correct")
+# Per-field character caps tried in order until the facts fit.
+TRIM_STEPS = (600, 320, 180, 100)
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (no tokenizer dependency)."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+def prompt_budget(mode: str, strategy: str = "") -> int:
+    return int(PROMPT_BUDGETS.get((mode, strategy), PROMPT_BUDGETS[("r1", "")]) * PROMPT_BUDGET_SCALE)
+
+def completion_tokens_for(max_words: int) -> int:
+    """max_tokens for a body of up to max_words words, with headroom, rounded up to tens."""
+    return int(math.ceil(max_words * TOKENS_PER_WORD * TOKEN_HEADROOM / 10.0) * 10)
+
+def shorten(text: str, max_chars: int) -> str:
+    """
+    Fit free text into max_chars: collapse whitespace, then cut at the last sentence
+    end (if it keeps most of the text) or word boundary, marking the cut with "…".
+    """
+    t = " ".join(str(text).split())
+    if len(t) <= max_chars:
+        return t
+    cut = t[:max_chars - 1]
+    end = max(cut.rfind(". "), cut.rfind("; "), cut.rfind("! "), cut.rfind("? "))
+    if end >= max_chars * 0.6:
+        return cut[:end + 1] + " …"
+    space = cut.rfind(" ")
+    return (cut[:space] if space > 0 else cut).rstrip(",;:-") + "…"
+
+def _trim_fields(d: dict, max_chars: int) -> dict:
+    return {
+        k: shorten(v, max_chars) if k in FREE_TEXT_FIELDS and isinstance(v, str) else v
+        for k, v in d.items()
+    }
+
+def trim_free_text(dispute_details: dict, max_chars: int) -> dict:
+    """Copy of dispute_details with every free-text field (per type and per account item) shortened."""
+    out = _trim_fields(dispute_details, max_chars)
+    for k, v in dispute_details.items():
+        if isinstance(v, dict):
+            out[k] = _trim_fields(v, max_chars)
+        elif k == "account_items" and isinstance(v, list):
+            out[k] = [_trim_fields(it, max_chars) if isinstance(it, dict) else it for it in v]
+    return out